@@ -90,10 +90,42 @@ class SettingsApplier:
         else:
             self.settings['BACKEND_ADDITIONAL_PORT'] = ""
             
+        # Optional settings added after the first release. Settings files made from an older
+        # settings_example do not have them, so their placeholders are filled with the defaults.
+        optional_defaults = {
+            'DOCKER_SHM_SIZE': '1g',
+            'APP_METRICS_ENABLED': 'false',
+            'APP_METRICS_TOKEN': '',
+            'APP_QUERY_PROFILING_ENABLED': 'false',
+            'APP_QUERY_PROFILING_MAX_QUERIES': '50',
+            'APP_QUERY_PROFILING_SLOW_QUERIES': '5',
+            'APP_GZIP_MINIMUM_SIZE': '1000',
+            'APP_PASSWORD_HASH_ALGORITHM': 'pbkdf2_sha256',
+            'APP_PASSWORD_HASH_ITERATIONS': '100000',
+            'APP_PASSWORD_HASH_WORKERS': '0',
+            'DOCKER_HEARTBEAT_LEASE_SECONDS': '60',
+            'DOCKER_FAILOVER_RESERVATIONS': 'false',
+            'DOCKER_PRESTAGE_MINUTES': '5',
+            'DOCKER_STOP_TIMEOUT_SECONDS': '10',
+            'DOCKER_SECRETS_FOLDER': '/var/lib/containerfly/secrets',
+            'DOCKER_LIFECYCLE_EVENT_RETENTION_DAYS': '90',
+            'DOCKER_METRICS_PORT': '9101',
+            'DOCKER_METRICS_HOST': '127.0.0.1',
+            'DOCKER_PM2_LOG_PATH': '',
+            'DOCKER_LOG_RING_BUFFER_LINES': '300',
+            'DOCKER_USAGE_SAMPLING_ENABLED': 'true',
+            'DOCKER_USAGE_SAMPLE_RETENTION_DAYS': '14',
+        }
+        for setting, default in optional_defaults.items():
+            if not self.settings.get(setting):
+                self.settings[setting] = default
+
         # Convert boolean strings to proper JSON boolean values
         bool_settings = [
             'DATABASE_DEBUG', 'ADD_TEST_DATA', 
-            'MAIN_SERVER_WEB_HTTPS', 'DEBUG_SKIP_GPU_DEDICATION'
+            'MAIN_SERVER_WEB_HTTPS', 'DEBUG_SKIP_GPU_DEDICATION',
+            'APP_METRICS_ENABLED', 'APP_QUERY_PROFILING_ENABLED',
+            'DOCKER_FAILOVER_RESERVATIONS', 'DOCKER_USAGE_SAMPLING_ENABLED'
         ]
         
         for setting in bool_settings:
@@ -112,7 +144,12 @@ class SettingsApplier:
         numeric_settings = [
             'BACKEND_PORT', 'FRONTEND_PORT',
             'DOCKER_REGISTRY_PORT', 
-            'DOCKER_RESERVATION_PORT_RANGE_START', 'DOCKER_RESERVATION_PORT_RANGE_END'
+            'DOCKER_RESERVATION_PORT_RANGE_START', 'DOCKER_RESERVATION_PORT_RANGE_END',
+            'APP_QUERY_PROFILING_MAX_QUERIES', 'APP_QUERY_PROFILING_SLOW_QUERIES', 'APP_GZIP_MINIMUM_SIZE',
+            'APP_PASSWORD_HASH_ITERATIONS', 'APP_PASSWORD_HASH_WORKERS',
+            'DOCKER_HEARTBEAT_LEASE_SECONDS', 'DOCKER_PRESTAGE_MINUTES', 'DOCKER_STOP_TIMEOUT_SECONDS',
+            'DOCKER_LIFECYCLE_EVENT_RETENTION_DAYS', 'DOCKER_METRICS_PORT',
+            'DOCKER_LOG_RING_BUFFER_LINES', 'DOCKER_USAGE_SAMPLE_RETENTION_DAYS'
         ]
         
         for setting in numeric_settings:
@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+'''
+Benchmark of the reservation API.
+
+Seeds a database (SQLite by default, or an empty MySQL / MariaDB database) with synthetic computers,
+hardware specs, users, roles and reservations, then drives the API through FastAPI's TestClient
+and reports throughput and latency percentiles per scenario. Results can be saved as a baseline
+and later runs compared against it.
+
+Example:
+    python3 tests/benchmark/benchmark_api.py --reservations 20000 --save-baseline tests/benchmark/baseline.json
+    python3 tests/benchmark/benchmark_api.py --reservations 20000 --baseline tests/benchmark/baseline.json
+
+See tests/benchmark/README.md for all options.
+'''
+import argparse
+import datetime
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "webapp", "backend"))
+PASSWORD = "benchmark"
+SCENARIOS = ["login", "get_available_hardware", "get_availability_timeline", "create_reservation", "get_own_reservations", "admin_get_reservations"]
+
+def parseArguments():
+    parser = argparse.ArgumentParser(description="Benchmark the reservation API with a seeded database.")
+    parser.add_argument("--database", type=str, default=None, help="Database URI. Defaults to a new SQLite database in a temporary folder. MySQL databases must be empty.")
+    parser.add_argument("--computers", type=int, default=10, help="Amount of computers (servers)")
+    parser.add_argument("--gpus", type=int, default=8, help="Amount of GPUs per computer")
+    parser.add_argument("--users", type=int, default=5000, help="Amount of users")
+    parser.add_argument("--roles", type=int, default=50, help="Amount of roles, in addition to everyone and admin")
+    parser.add_argument("--reservations", type=int, default=20000, help="Amount of reservations, spread over the past 60 and next 30 days")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=10, help="Requests per scenario before measuring")
+    parser.add_argument("--concurrency", type=int, default=1, help="Requests sent at the same time")
+    parser.add_argument("--scenarios", type=str, default=",".join(SCENARIOS), help="Comma separated scenarios to run: " + ", ".join(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=42, help="Random seed, the same seed gives the same data and requests")
+    parser.add_argument("--output", type=str, default=None, help="Write the results as JSON to this file")
+    parser.add_argument("--save-baseline", type=str, default=None, help="Save the results as the baseline to this file")
+    parser.add_argument("--baseline", type=str, default=None, help="Compare the results against this baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown of p50 / p95 before a scenario counts as a regression")
+    return parser.parse_args()
+
+def writeSettings(workFolder, databaseUri, overrides=None):
+    '''
+    Writes the settings.json the backend reads from the working directory.
+    Overrides are { section: { key: value } }, for example { "docker": { "enabled": True } }.
+    '''
+    settings = {
+        "app": {
+            "url": "http://localhost",
+            "serverIp": "127.0.0.1",
+            "clientUrl": "http://localhost",
+            "port": 8000,
+            "production": True,
+            "addTestDataInDevelopment": False,
+            "metricsEnabled": False,
+            "queryProfilingEnabled": False
+        },
+        "database": {
+            "engineUri": databaseUri,
+            "debugPrinting": False
+        },
+        "docker": {
+            "enabled": False,
+            "registryAddress": "localhost:5000",
+            "serverName": "benchmark-server-1"
+        }
+    }
+    for section, values in (overrides or {}).items():
+        settings.setdefault(section, {}).update(values)
+    with open(os.path.join(workFolder, "settings.json"), "w") as settingsFile:
+        json.dump(settings, settingsFile, indent=2)
+
+def prepareBackend(databaseUri, settingsOverrides=None):
+    '''
+    Points the backend to the benchmark settings and creates the tables.
+    '''
+    workFolder = tempfile.mkdtemp(prefix="containerfly-benchmark-")
+    if databaseUri is None:
+        databaseUri = f"sqlite:///{os.path.join(workFolder, 'benchmark.db')}"
+    writeSettings(workFolder, databaseUri, settingsOverrides)
+    # settings_handler reads settings.json from the working directory
+    os.chdir(workFolder)
+    sys.path.insert(0, BACKEND_FOLDER)
+
+    from sqlalchemy import BigInteger
+    from sqlalchemy.ext.compiler import compiles
+    from sqlalchemy.dialects.mysql import LONGTEXT
+
+    @compiles(LONGTEXT, "sqlite")
+    def compileLongTextForSqlite(type_, compiler, **kw):
+        return "TEXT"
+
+    # SQLite only autoincrements INTEGER primary keys, the log and sample tables use BIGINT ones
+    @compiles(BigInteger, "sqlite")
+    def compileBigIntegerForSqlite(type_, compiler, **kw):
+        return "INTEGER"
+
+    from database import Base, engine
+    Base.metadata.create_all(engine)
+    return databaseUri
+
+def timeNow():
+    # Reservation dates are stored in UTC without a timezone
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None, microsecond=0)
+
+def seedDatabase(args, rng):
+    '''
+    Inserts the synthetic data with bulk inserts.
+
+    Returns:
+        dict: IDs and tokens the scenarios use.
+    '''
+    from database import Session, Role, RoleReservationLimit, User, UserRole, Computer, HardwareSpec, Container, ContainerPort, Reservation, ReservedContainer, ReservedHardwareSpec
+    # helpers.server has to be imported before helpers.auth, like the API does, because they import each other
+    import helpers.server
+    from helpers.auth import CreateLoginToken
+    from helpers.password_hashing import hashPassword
+
+    started = time.perf_counter()
+    now = timeNow()
+    # Hashing is slow on purpose, every user gets the same password hash
+    passwordHash = hashPassword(PASSWORD)
+    hashedPassword = passwordHash["password"]
+    passwordSalt = passwordHash["passwordSalt"]
+
+    with Session() as session:
+        roleNames = ["everyone", "admin"] + [f"role-{index}" for index in range(args.roles)]
+        session.bulk_insert_mappings(Role, [{ "roleId": index + 1, "name": name } for index, name in enumerate(roleNames)])
+        # Users have many reservations already, the roles allow them to keep making more
+        session.bulk_insert_mappings(RoleReservationLimit, [{ "roleId": roleId, "maxActiveReservations": 10000 } for roleId in range(3, len(roleNames) + 1)])
+
+        users = [{
+            "userId": index + 1,
+            "email": f"user{index}@benchmark.test",
+            "password": hashedPassword,
+            "passwordSalt": passwordSalt
+        } for index in range(args.users)]
+        session.bulk_insert_mappings(User, users)
+        userRoles = [{ "userId": 1, "roleId": 2 }]
+        for user in users:
+            for roleId in rng.sample(range(3, len(roleNames) + 1), k=min(2, args.roles)):
+                userRoles.append({ "userId": user["userId"], "roleId": roleId })
+        session.bulk_insert_mappings(UserRole, userRoles)
+
+        computers = []
+        hardwareSpecs = []
+        specsByComputer = {}
+        specId = 0
+        for index in range(args.computers):
+            computerId = index + 1
+            computers.append({ "computerId": computerId, "public": True, "name": f"benchmark-server-{computerId}", "ip": f"10.0.0.{computerId}", "removed": False })
+            specs = { "gpu": [] }
+            for specType, maximum, userMaximum, default, minimum, specFormat in [
+                ("cpus", 64, 16, 1, 1, "CPUs"),
+                ("ram", 512, 128, 4, 1, "GB"),
+                ("gpus", 0, 2, 0, 0, "GPUs")
+            ]:
+                specId += 1
+                specs[specType] = specId
+                hardwareSpecs.append({
+                    "hardwareSpecId": specId, "computerId": computerId, "type": specType, "maximumAmount": maximum,
+                    "maximumAmountForUser": userMaximum, "defaultAmountForUser": default, "minimumAmount": minimum, "format": specFormat
+                })
+            for gpu in range(args.gpus):
+                specId += 1
+                specs["gpu"].append(specId)
+                hardwareSpecs.append({
+                    "hardwareSpecId": specId, "computerId": computerId, "type": "gpu", "internalId": str(gpu), "maximumAmount": 1,
+                    "maximumAmountForUser": 1, "defaultAmountForUser": 0, "minimumAmount": 0, "format": "NVIDIA benchmark GPU"
+                })
+            specsByComputer[computerId] = specs
+        session.bulk_insert_mappings(Computer, computers)
+        session.bulk_insert_mappings(HardwareSpec, hardwareSpecs)
+
+        session.bulk_insert_mappings(Container, [{ "containerId": 1, "public": True, "name": "Ubuntu", "imageName": "ubuntu-base", "description": "Benchmark image" }])
+        session.bulk_insert_mappings(ContainerPort, [{ "containerPortId": 1, "containerId": 1, "serviceName": "SSH", "port": 22 }])
+
+        reservedContainers = []
+        reservations = []
+        reservedSpecs = []
+        for index in range(args.reservations):
+            reservationId = index + 1
+            computerId = rng.randint(1, args.computers)
+            specs = specsByComputer[computerId]
+            startDate = now + datetime.timedelta(minutes=rng.randint(-60 * 24 * 60, 30 * 24 * 60))
+            endDate = startDate + datetime.timedelta(hours=rng.choice([1, 2, 4, 8, 24]))
+            if endDate < now:
+                status = "stopped"
+            elif startDate < now:
+                status = "started"
+            else:
+                status = "reserved"
+            reservedContainers.append({ "reservedContainerId": reservationId, "containerId": 1, "shmSizePercent": 50, "ramDiskSizePercent": 0 })
+            reservations.append({
+                "reservationId": reservationId, "reservedContainerId": reservationId, "computerId": computerId,
+                "userId": rng.randint(1, args.users), "startDate": startDate, "endDate": endDate, "status": status
+            })
+            reservedSpecs.append({ "reservationId": reservationId, "hardwareSpecId": specs["cpus"], "amount": rng.randint(1, 8) })
+            reservedSpecs.append({ "reservationId": reservationId, "hardwareSpecId": specs["ram"], "amount": rng.choice([4, 8, 16, 32]) })
+            gpuAmount = 1 if specs["gpu"] and rng.random() < 0.3 else 0
+            reservedSpecs.append({ "reservationId": reservationId, "hardwareSpecId": specs["gpus"], "amount": gpuAmount })
+            if gpuAmount:
+                reservedSpecs.append({ "reservationId": reservationId, "hardwareSpecId": rng.choice(specs["gpu"]), "amount": 1 })
+        session.bulk_insert_mappings(ReservedContainer, reservedContainers)
+        session.bulk_insert_mappings(Reservation, reservations)
+        session.bulk_insert_mappings(ReservedHardwareSpec, reservedSpecs)
+
+        # Logged in users for the scenarios, user 1 is the admin
+        tokenUserIds = [1] + rng.sample(range(2, args.users + 1), k=min(50, args.users - 1))
+        tokens = {}
+        for userId in tokenUserIds:
+            tokens[userId] = CreateLoginToken()
+            session.query(User).filter(User.userId == userId).update({
+                User.loginToken: tokens[userId],
+                User.loginTokenCreatedAt: datetime.datetime.now(datetime.timezone.utc)
+            })
+        session.commit()
+
+    print(f"Seeded {args.computers} computers, {len(hardwareSpecs)} hardware specs, {args.users} users, {len(roleNames)} roles and {args.reservations} reservations in {time.perf_counter() - started:.1f} s")
+    return { "tokens": tokens, "specsByComputer": specsByComputer, "users": args.users }
+
+def createScenarios(client, seed, rng):
+    '''
+    Returns scenario name -> function sending one request and returning (succeeded, response).
+    '''
+    adminToken = seed["tokens"][1]
+    userTokens = [token for userId, token in seed["tokens"].items() if userId != 1]
+    computerIds = list(seed["specsByComputer"])
+
+    def authorization(token):
+        return { "Authorization": f"Bearer {token}" }
+
+    def futureDate(minHours=1, maxHours=24 * 14):
+        date = timeNow() + datetime.timedelta(hours=rng.randint(minHours, maxHours))
+        return date.replace(minute=0, second=0).isoformat() + "Z"
+
+    def isSuccess(response):
+        if response.status_code != 200:
+            return False
+        body = response.json()
+        return not isinstance(body, dict) or body.get("status", True) is not False
+
+    def login():
+        email = f"user{rng.randrange(seed['users'])}@benchmark.test"
+        response = client.post("/api/user/login", data={ "username": email, "password": PASSWORD })
+        return isSuccess(response), response
+
+    def getAvailableHardware():
+        response = client.get("/api/reservation/get_available_hardware", params={ "date": futureDate(), "duration": rng.choice([1, 4, 24]) }, headers=authorization(rng.choice(userTokens)))
+        return isSuccess(response), response
+
+    def getAvailabilityTimeline():
+        start = timeNow() - datetime.timedelta(days=1)
+        # Same format as the calendar of the frontend
+        params = { "startDate": start.strftime("%Y-%m-%d %H:%M:%S"), "endDate": (start + datetime.timedelta(days=14)).strftime("%Y-%m-%d %H:%M:%S") }
+        response = client.get("/api/reservation/get_availability_timeline", params=params, headers=authorization(rng.choice(userTokens)))
+        return isSuccess(response), response
+
+    def createReservation():
+        computerId = rng.choice(computerIds)
+        specs = seed["specsByComputer"][computerId]
+        hardwareSpecs = { str(specs["cpus"]): 1, str(specs["ram"]): 4, str(specs["gpus"]): 0 }
+        params = {
+            "date": futureDate(24, 24 * 30), "duration": 1, "computerId": computerId, "containerId": 1,
+            "hardwareSpecs": json.dumps(hardwareSpecs), "adminReserveUserEmail": "", "description": "benchmark"
+        }
+        response = client.post("/api/reservation/create_reservation", params=params, headers=authorization(rng.choice(userTokens)))
+        return isSuccess(response), response
+
+    def getOwnReservations():
+        response = client.post("/api/reservation/get_own_reservations", json={ "filters": { "status": "" } }, headers=authorization(rng.choice(userTokens)))
+        return isSuccess(response), response
+
+    def adminGetReservations():
+        response = client.post("/api/admin/reservations", json={ "filters": { "status": "" } }, headers=authorization(adminToken))
+        return isSuccess(response), response
+
+    return {
+        "login": login,
+        "get_available_hardware": getAvailableHardware,
+        "get_availability_timeline": getAvailabilityTimeline,
+        "create_reservation": createReservation,
+        "get_own_reservations": getOwnReservations,
+        "admin_get_reservations": adminGetReservations
+    }
+
+def percentile(sortedValues, percent):
+    if not sortedValues:
+        return None
+    rank = max(1, math.ceil(percent / 100 * len(sortedValues)))
+    return sortedValues[rank - 1]
+
+def runScenario(sendRequest, requests, warmup, concurrency):
+    '''
+    Sends the warmup requests, then measures the given amount of requests.
+
+    Returns:
+        dict: Throughput and latency percentiles (milliseconds) of the scenario.
+    '''
+    for _ in range(warmup):
+        sendRequest()
+
+    failureMessages = []
+
+    def measure(_):
+        start = time.perf_counter()
+        succeeded, response = sendRequest()
+        seconds = time.perf_counter() - start
+        if not succeeded:
+            # Kept to show why the requests failed
+            failureMessages.append(f"HTTP {response.status_code}: {response.text[:200]}")
+        return seconds, succeeded
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(measure, range(requests)))
+    else:
+        results = [measure(index) for index in range(requests)]
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(seconds * 1000 for seconds, succeeded in results)
+    return {
+        "requests": requests,
+        "failures": sum(1 for seconds, succeeded in results if not succeeded),
+        "throughput": round(requests / elapsed, 2) if elapsed > 0 else None,
+        "meanMs": round(sum(latencies) / len(latencies), 2),
+        "p50Ms": round(percentile(latencies, 50), 2),
+        "p95Ms": round(percentile(latencies, 95), 2),
+        "p99Ms": round(percentile(latencies, 99), 2),
+        "maxMs": round(latencies[-1], 2),
+        "firstFailure": failureMessages[0] if failureMessages else None
+    }
+
+def printResults(results):
+    print()
+    print(f"{'Scenario':<28}{'req/s':>10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'failed':>8}")
+    for name, result in results.items():
+        print(f"{name:<28}{result['throughput']:>10}{result['meanMs']:>10}{result['p50Ms']:>10}{result['p95Ms']:>10}{result['p99Ms']:>10}{result['maxMs']:>10}{result['failures']:>8}")
+    for name, result in results.items():
+        if result["firstFailure"]:
+            print(f"First failure of {name}: {result['firstFailure']}")
+
+def compareToBaseline(results, baseline, tolerance):
+    '''
+    Prints the change of each scenario against the baseline.
+
+    Returns:
+        list: Names of the scenarios whose p50 or p95 got slower than the tolerance allows.
+    '''
+    regressions = []
+    print()
+    print(f"Compared to the baseline from {baseline.get('createdAt', 'unknown')} (tolerance {tolerance * 100:.0f} %):")
+    for name, result in results.items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            print(f"  {name}: no baseline")
+            continue
+        changes = []
+        regressed = False
+        for key in ("p50Ms", "p95Ms"):
+            change = (result[key] - previous[key]) / previous[key] if previous[key] else 0
+            changes.append(f"{key} {previous[key]} -> {result[key]} ({change * 100:+.1f} %)")
+            regressed = regressed or change > tolerance
+        throughputChange = (result["throughput"] - previous["throughput"]) / previous["throughput"] if previous["throughput"] else 0
+        changes.append(f"req/s {throughputChange * 100:+.1f} %")
+        print(f"  {'REGRESSION ' if regressed else ''}{name}: {', '.join(changes)}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+def main():
+    args = parseArguments()
+    rng = random.Random(args.seed)
+
+    databaseUri = prepareBackend(args.database)
+    print(f"Using database {databaseUri.split('@')[-1]}")
+    seed = seedDatabase(args, rng)
+
+    from fastapi.testclient import TestClient
+    from main import app
+    client = TestClient(app)
+
+    scenarios = createScenarios(client, seed, rng)
+    results = {}
+    for name in [name.strip() for name in args.scenarios.split(",") if name.strip()]:
+        if name not in scenarios:
+            print(f"Unknown scenario: {name}")
+            sys.exit(2)
+        print(f"Running {name}...")
+        results[name] = runScenario(scenarios[name], args.requests, args.warmup, args.concurrency)
+    printResults(results)
+
+    output = {
+        "createdAt": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "machine": { "python": platform.python_version(), "platform": platform.platform() },
+        "parameters": {
+            "database": "sqlite" if databaseUri.startswith("sqlite") else databaseUri.split(":")[0],
+            "computers": args.computers, "gpus": args.gpus, "users": args.users, "roles": args.roles,
+            "reservations": args.reservations, "requests": args.requests, "concurrency": args.concurrency, "seed": args.seed
+        },
+        "scenarios": results
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as outputFile:
+                json.dump(output, outputFile, indent=2)
+            print(f"Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline) as baselineFile:
+            baseline = json.load(baselineFile)
+        if baseline.get("parameters") != output["parameters"]:
+            print("Warning: the baseline was recorded with different parameters, the comparison is not reliable.")
+        regressions = compareToBaseline(results, baseline, args.tolerance)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+'''
+Benchmark of the docker utility (webapp/backend/dockerUtil.py) without Docker, GPUs or waiting.
+
+Seeds a database with one server and a reservation trace, then replays the loop of the docker utility
+with a simulated clock and the in-memory container runtime of docker/simulation.py. Reports how late
+the reservations were started and stopped, and the database queries, docker CLI calls and CPU time
+of each pass of the loop.
+
+Example:
+    python3 tests/benchmark/benchmark_docker_util.py --reservations 3000 --days 7 --save-trace /tmp/trace.json
+    python3 tests/benchmark/benchmark_docker_util.py --trace /tmp/trace.json --output /tmp/results.json
+
+See tests/benchmark/README.md for all options.
+'''
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+from benchmark_api import prepareBackend, percentile
+
+SERVER_NAME = "simulated-server"
+IMAGES = ["ubuntu-base", "pytorch", "tensorflow", "jupyter", "matlab"]
+
+def parseArguments():
+    parser = argparse.ArgumentParser(description="Replay a reservation trace through the docker utility with a simulated clock.")
+    parser.add_argument("--database", type=str, default=None, help="Database URI. Defaults to a new SQLite database in a temporary folder. MySQL databases must be empty.")
+    parser.add_argument("--trace", type=str, default=None, help="Reservation trace (JSON) to replay. Without it a trace is generated")
+    parser.add_argument("--save-trace", type=str, default=None, help="Save the generated trace to this file")
+    parser.add_argument("--reservations", type=int, default=3000, help="Amount of reservations in the generated trace")
+    parser.add_argument("--days", type=int, default=7, help="Days the generated trace covers")
+    parser.add_argument("--users", type=int, default=200, help="Amount of users making the reservations")
+    parser.add_argument("--gpus", type=int, default=8, help="GPUs of the simulated server")
+    parser.add_argument("--prestage-minutes", type=int, default=5, help="docker.prestageMinutes, 0 disables pre-staging")
+    parser.add_argument("--password-injection", choices=["file", "env", "exec"], default="file", help="How the images accept the password, exec is the docker exec chpasswd of legacy images")
+    parser.add_argument("--latency", action="append", default=[], metavar="COMMAND=SECONDS", help="Simulated latency of a docker command, for example pull=60. Can be given many times")
+    parser.add_argument("--crash-rate", type=float, default=0.0, help="Probability per hour that a running container crashes")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed of the generated trace and the crashes")
+    parser.add_argument("--output", type=str, default=None, help="Write the results as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the docker utility")
+    return parser.parse_args()
+
+def generateTrace(rng, reservations, days, gpus):
+    '''
+    Generates reservations over the given days. Most start during office hours on the hour or half hour,
+    which gives bursts of starts like real reservations do.
+
+    Returns:
+        dict: { "reservations": [ { startMinute, durationMinutes, image, cpus, ramGb, gpus } ] }, sorted by the start.
+    '''
+    trace = []
+    for _ in range(reservations):
+        hour = rng.randrange(8, 18) if rng.random() < 0.8 else rng.randrange(24)
+        startMinute = rng.randrange(days) * 24 * 60 + hour * 60 + rng.choice([0, 30])
+        trace.append({
+            "startMinute": startMinute,
+            "durationMinutes": rng.choice([60, 120, 240, 480, 1440]),
+            "image": rng.choice(IMAGES),
+            "cpus": rng.choice([1, 2, 4, 8]),
+            "ramGb": rng.choice([4, 8, 16, 32]),
+            "gpus": rng.choice([0, 0, 0, 1, 1, 2]) if gpus else 0
+        })
+    trace.sort(key=lambda reservation: reservation["startMinute"])
+    return { "reservations": trace }
+
+def seedTrace(trace, args, simulationStart, rng):
+    '''
+    Inserts the server, images, users and the reservations of the trace.
+    '''
+    from database import Session, Role, User, Computer, HardwareSpec, Container, ContainerPort, Reservation, ReservedContainer, ReservedHardwareSpec
+
+    with Session() as session:
+        session.bulk_insert_mappings(Role, [{ "roleId": 1, "name": "everyone" }])
+        session.bulk_insert_mappings(User, [{ "userId": index + 1, "email": f"user{index}@benchmark.test" } for index in range(args.users)])
+        session.bulk_insert_mappings(Computer, [{ "computerId": 1, "public": True, "name": SERVER_NAME, "ip": "10.0.0.1", "removed": False }])
+
+        specs = [
+            { "hardwareSpecId": 1, "computerId": 1, "type": "cpus", "maximumAmount": 256, "maximumAmountForUser": 16, "defaultAmountForUser": 1, "minimumAmount": 1, "format": "CPUs" },
+            { "hardwareSpecId": 2, "computerId": 1, "type": "ram", "maximumAmount": 2048, "maximumAmountForUser": 128, "defaultAmountForUser": 4, "minimumAmount": 1, "format": "GB" },
+            { "hardwareSpecId": 3, "computerId": 1, "type": "gpus", "maximumAmount": 0, "maximumAmountForUser": 2, "defaultAmountForUser": 0, "minimumAmount": 0, "format": "GPUs" }
+        ]
+        gpuSpecIds = []
+        for gpu in range(args.gpus):
+            gpuSpecIds.append(len(specs) + 1)
+            specs.append({
+                "hardwareSpecId": len(specs) + 1, "computerId": 1, "type": "gpu", "internalId": str(gpu), "maximumAmount": 1,
+                "maximumAmountForUser": 1, "defaultAmountForUser": 0, "minimumAmount": 0, "format": "Simulated GPU"
+            })
+        session.bulk_insert_mappings(HardwareSpec, specs)
+
+        images = sorted({ reservation["image"] for reservation in trace["reservations"] })
+        containerIds = { image: index + 1 for index, image in enumerate(images) }
+        session.bulk_insert_mappings(Container, [{ "containerId": containerId, "public": True, "name": image, "imageName": image } for image, containerId in containerIds.items()])
+        session.bulk_insert_mappings(ContainerPort, [{ "containerId": containerId, "serviceName": "SSH", "port": 22 } for containerId in containerIds.values()])
+
+        reservedContainers = []
+        reservations = []
+        reservedSpecs = []
+        # Reservation dates are stored in UTC without a timezone
+        start = simulationStart.replace(tzinfo=None)
+        for index, traced in enumerate(trace["reservations"]):
+            reservationId = index + 1
+            startDate = start + datetime.timedelta(minutes=traced["startMinute"])
+            reservedContainers.append({ "reservedContainerId": reservationId, "containerId": containerIds[traced["image"]], "shmSizePercent": 50, "ramDiskSizePercent": 0 })
+            reservations.append({
+                "reservationId": reservationId, "reservedContainerId": reservationId, "computerId": 1, "userId": rng.randint(1, args.users),
+                "startDate": startDate, "endDate": startDate + datetime.timedelta(minutes=traced["durationMinutes"]), "status": "reserved"
+            })
+            gpuAmount = min(traced.get("gpus", 0), len(gpuSpecIds))
+            reservedSpecs.append({ "reservationId": reservationId, "hardwareSpecId": 1, "amount": traced.get("cpus", 1) })
+            reservedSpecs.append({ "reservationId": reservationId, "hardwareSpecId": 2, "amount": traced.get("ramGb", 4) })
+            reservedSpecs.append({ "reservationId": reservationId, "hardwareSpecId": 3, "amount": gpuAmount })
+            for gpuSpecId in rng.sample(gpuSpecIds, gpuAmount):
+                reservedSpecs.append({ "reservationId": reservationId, "hardwareSpecId": gpuSpecId, "amount": 1 })
+        session.bulk_insert_mappings(ReservedContainer, reservedContainers)
+        session.bulk_insert_mappings(Reservation, reservations)
+        session.bulk_insert_mappings(ReservedHardwareSpec, reservedSpecs)
+        session.commit()
+    return images
+
+def parseLatencies(values):
+    latencies = {}
+    for value in values:
+        command, _, seconds = value.partition("=")
+        latencies[command.strip()] = float(seconds)
+    return latencies
+
+def summarize(values, decimals=2):
+    if not values:
+        return { "count": 0 }
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), decimals),
+        "p50": round(percentile(values, 50), decimals),
+        "p95": round(percentile(values, 95), decimals),
+        "p99": round(percentile(values, 99), decimals),
+        "max": round(values[-1], decimals)
+    }
+
+def replay(dockerUtil, clock, runtime, simulationEnd, args, rng):
+    '''
+    Runs the loop of dockerUtil.main() until the simulated clock reaches the end.
+
+    Returns:
+        dict: Loop ("main" / "cleanup") -> list of (queries, CLI calls, CPU seconds, simulated seconds) per pass.
+    '''
+    from helpers.db_metrics import startCountingQueries, stopCountingQueries
+
+    ticks = { "main": [], "cleanup": [] }
+    errors = 0
+
+    def measure(loop, function, *parameters):
+        nonlocal errors
+        token, queryStats = startCountingQueries()
+        callsBefore = runtime.call_count()
+        simulatedBefore = clock.monotonic()
+        cpuBefore = time.process_time()
+        output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        try:
+            with output:
+                function(*parameters)
+        except Exception as e:
+            # The real utility would crash and be restarted by pm2
+            errors += 1
+            print(f"Error in the {loop} loop: {e}")
+        finally:
+            cpuSeconds = time.process_time() - cpuBefore
+            stopCountingQueries(token)
+        ticks[loop].append((queryStats.count, runtime.call_count() - callsBefore, cpuSeconds, clock.monotonic() - simulatedBefore))
+
+    crashProbability = args.crash_rate * 10 / 3600
+    lastReport = time.perf_counter()
+    while clock.now() < simulationEnd:
+        for i in range(6):
+            # The heartbeat thread of the real utility runs on the real clock, renew the lease once per pass instead
+            dockerUtil.sendHeartbeat()
+            measure("main", dockerUtil.runMainTick, i)
+            dockerUtil.sleep(10)
+            if crashProbability:
+                for containerName in [container.name for container in list(runtime.containers.values()) if container.state.running]:
+                    if rng.random() < crashProbability:
+                        runtime.crash(containerName)
+        measure("cleanup", dockerUtil.runCleanupTick)
+        if time.perf_counter() - lastReport > 10:
+            lastReport = time.perf_counter()
+            print(f"  simulated until {clock.now():%Y-%m-%d %H:%M}, {len(ticks['main'])} passes")
+    return ticks, errors
+
+def getLateness(simulationEnd):
+    '''
+    Returns:
+        dict: Seconds from the start date until the container was started, and from the end date
+        until it was stopped, and how many reservations were not started.
+    '''
+    from database import Session, Reservation, ReservedContainer
+    end = simulationEnd.replace(tzinfo=None)
+    startLateness = []
+    stopLateness = []
+    notStarted = 0
+    errored = 0
+    with Session() as session:
+        rows = session.query(Reservation.startDate, Reservation.endDate, Reservation.status, ReservedContainer.startedAt, ReservedContainer.stoppedAt)\
+            .join(ReservedContainer, ReservedContainer.reservedContainerId == Reservation.reservedContainerId)\
+            .filter(Reservation.startDate < end).all()
+    for startDate, endDate, status, startedAt, stoppedAt in rows:
+        if status == "error":
+            errored += 1
+        if startedAt is None:
+            notStarted += 1
+        else:
+            startLateness.append((startedAt.replace(tzinfo=None) - startDate).total_seconds())
+        if stoppedAt is not None:
+            stopLateness.append((stoppedAt.replace(tzinfo=None) - endDate).total_seconds())
+    return {
+        "startLatenessSeconds": summarize(startLateness),
+        "stopLatenessSeconds": summarize(stopLateness),
+        "notStarted": notStarted,
+        "errors": errored
+    }
+
+def printResults(results):
+    print()
+    for name, key in (("Start lateness (s)", "startLatenessSeconds"), ("Stop lateness (s)", "stopLatenessSeconds")):
+        stats = results["lateness"][key]
+        if stats["count"]:
+            print(f"{name:<22} n={stats['count']:<7} mean={stats['mean']:<9} p50={stats['p50']:<9} p95={stats['p95']:<9} p99={stats['p99']:<9} max={stats['max']}")
+    print(f"Reservations not started: {results['lateness']['notStarted']}, failed to start: {results['lateness']['errors']}")
+    print()
+    print(f"{'Loop':<10}{'Metric':<18}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for loop, metrics in results["ticks"].items():
+        for metric, stats in metrics.items():
+            if not isinstance(stats, dict) or not stats.get("count"):
+                continue
+            print(f"{loop:<10}{metric:<18}{stats['mean']:>10}{stats['p50']:>10}{stats['p95']:>10}{stats['p99']:>10}{stats['max']:>10}")
+    print()
+    print(f"Docker CLI calls: {json.dumps(results['cliCalls'])}")
+    print(f"Simulated {results['simulatedHours']} hours in {results['wallSeconds']} s, loop CPU time {results['loopCpuSeconds']} s, {results['loopErrors']} loop errors")
+
+def main():
+    args = parseArguments()
+    rng = random.Random(args.seed)
+
+    if args.trace:
+        with open(args.trace) as traceFile:
+            trace = json.load(traceFile)
+    else:
+        trace = generateTrace(rng, args.reservations, args.days, args.gpus)
+    if args.save_trace:
+        with open(args.save_trace, "w") as traceFile:
+            json.dump(trace, traceFile)
+        print(f"Trace written to {args.save_trace}")
+    if not trace["reservations"]:
+        print("The trace has no reservations.")
+        sys.exit(2)
+
+    databaseUri = prepareBackend(args.database, {
+        "docker": {
+            "enabled": True,
+            "serverName": SERVER_NAME,
+            "port_range_start": 20000,
+            "port_range_end": 40000,
+            "prestageMinutes": args.prestage_minutes,
+            "metricsPort": 0,
+            # A private folder of this user, like the one the utility creates
+            "secretsFolder": tempfile.mkdtemp(prefix="containerfly-secrets-"),
+            # Simulated pm2 logs do not exist
+            "pm2LogPath": os.path.join(os.getcwd(), "pm2-logs")
+        }
+    })
+    print(f"Using database {databaseUri.split('@')[-1]}")
+
+    # Whole hours keep the half hour bursts of the trace aligned with the loop
+    simulationStart = datetime.datetime.now(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0) + datetime.timedelta(hours=1)
+    images = seedTrace(trace, args, simulationStart, rng)
+    lastEndMinute = max(reservation["startMinute"] + reservation["durationMinutes"] for reservation in trace["reservations"])
+    # Starts a few minutes before the first reservation, so that it can be pre-staged, and runs until the last one has been stopped
+    simulationFrom = simulationStart + datetime.timedelta(minutes=min(reservation["startMinute"] for reservation in trace["reservations"]) - max(args.prestage_minutes, 1))
+    simulationEnd = simulationStart + datetime.timedelta(minutes=lastEndMinute + 5)
+
+    from docker.simulation import SimulatedClock, FakeDockerRuntime, FakeHost, install
+    from docker.credentials import PASSWORD_LABEL
+    from docker.docker_functionality import get_full_image_name
+    clock = SimulatedClock(simulationFrom)
+    labels = {} if args.password_injection == "exec" else { PASSWORD_LABEL: args.password_injection }
+    runtime = FakeDockerRuntime(clock, parseLatencies(args.latency), { get_full_image_name(image): labels for image in images }, labels)
+    dockerUtil = install(clock, runtime, FakeHost(clock))
+    dockerUtil.computerId = dockerUtil.getComputerId(SERVER_NAME)
+
+    print(f"Replaying {len(trace['reservations'])} reservations from {simulationFrom:%Y-%m-%d %H:%M} until {simulationEnd:%Y-%m-%d %H:%M} (UTC)...")
+    wallStart = time.perf_counter()
+    ticks, loopErrors = replay(dockerUtil, clock, runtime, simulationEnd, args, rng)
+    wallSeconds = time.perf_counter() - wallStart
+
+    tickResults = {}
+    for loop, rows in ticks.items():
+        tickResults[loop] = {
+            "passes": len(rows),
+            "queries": summarize([row[0] for row in rows]),
+            "cliCalls": summarize([row[1] for row in rows]),
+            "cpuMs": summarize([row[2] * 1000 for row in rows]),
+            "simulatedSeconds": summarize([row[3] for row in rows])
+        }
+    results = {
+        "createdAt": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "machine": { "python": platform.python_version(), "platform": platform.platform() },
+        "parameters": {
+            "database": "sqlite" if databaseUri.startswith("sqlite") else databaseUri.split(":")[0],
+            "trace": args.trace, "reservations": len(trace["reservations"]), "seed": args.seed,
+            "prestageMinutes": args.prestage_minutes,
+            "passwordInjection": args.password_injection, "latencies": runtime.latencies, "crashRate": args.crash_rate
+        },
+        "lateness": getLateness(simulationEnd),
+        "ticks": tickResults,
+        "cliCalls": dict(runtime.calls),
+        "loopCpuSeconds": round(sum(row[2] for rows in ticks.values() for row in rows), 2),
+        "loopErrors": loopErrors,
+        "simulatedHours": round(clock.monotonic() / 3600, 1),
+        "wallSeconds": round(wallSeconds, 1)
+    }
+    printResults(results)
+
+    if args.output:
+        with open(args.output, "w") as outputFile:
+            json.dump(results, outputFile, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -10,10 +10,12 @@ engine = create_engine(
     pool_recycle=3600,
     pool_pre_ping=True      # Test connections before using them
 )
+from helpers.db_metrics import instrumentEngine
+instrumentEngine(engine)
 from sqlalchemy.ext.declarative import declarative_base
 Base = declarative_base()
 
-from sqlalchemy import Column, Integer, Text, Float, ForeignKey, DateTime, UniqueConstraint, Boolean, BigInteger
+from sqlalchemy import Column, Integer, Text, String, Float, ForeignKey, DateTime, UniqueConstraint, Boolean, BigInteger
 from sqlalchemy.dialects.mysql import LONGTEXT
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -71,6 +73,7 @@ class Container(Base):
   name = Column(Text, nullable = False)
   removed = Column(Boolean, nullable = True)
   description = Column(Text, nullable = True)
+  stopTimeoutSeconds = Column(Integer, nullable = True) # Grace period before the container is killed when stopping, docker.stopTimeoutSeconds if not set
   createdAt = Column(DateTime(timezone=True), server_default=func.now())
   updatedAt = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -105,6 +108,7 @@ class ReservedContainer(Base):
   containerDockerErrorMessage = Column(Text, nullable = True)
   shmSizePercent = Column(Integer, nullable = False, default=50) # Shared memory size as percentage of RAM (0-90)
   ramDiskSizePercent = Column(Integer, nullable = False, default=0) # RAM disk size as percentage of RAM (0-60)
+  stagedAt = Column(DateTime(timezone=True), nullable = True) # Set when the container was created ahead of the start date, but not started yet
   createdAt = Column(DateTime(timezone=True), server_default=func.now())
   updatedAt = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -139,6 +143,8 @@ class Reservation(Base):
   createdAt = Column(DateTime(timezone=True), server_default=func.now())
   updatedAt = Column(DateTime(timezone=True), onupdate=func.now())
   status = Column(Text, nullable = False) # reserved, started, stopped, error, restart
+  idleNotifiedAt = Column(DateTime(timezone=True), nullable = True) # Set when the user was notified that the reservation is idle
+  startingAt = Column(DateTime(timezone=True), nullable = True) # Set while the docker utility of the computer is starting the container
 
   user = relationship("User", back_populates = "reservations")
   reservedContainer = relationship("ReservedContainer", back_populates = "reservation")
@@ -280,6 +286,10 @@ class ServerStatus(Base):
     softwareVersion = Column(Text, nullable=True)
     versionUpdatedAt = Column(DateTime(timezone=True), nullable=True)
     
+    # Heartbeat lease, the server is offline if the lease expires before the next heartbeat
+    heartbeatAt = Column(DateTime(timezone=True), nullable=True)
+    leaseExpiresAt = Column(DateTime(timezone=True), nullable=True)
+    
     # Last update timestamp
     lastUpdatedAt = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
@@ -292,16 +302,72 @@ class ServerLogs(Base):
     computerId = Column(ForeignKey("Computer.computerId"), nullable=False)
     logType = Column(Text, nullable=False)  # 'backend', 'frontend', 'docker_utility'
     
-    logContent = Column(LONGTEXT, nullable=True)  # Store last N lines
-    logLines = Column(Integer, nullable=True)  # How many lines stored
-    
+    logContent = Column(LONGTEXT, nullable=True)  # Legacy: full log snapshot, content is now stored in ServerLogChunk
+    logLines = Column(Integer, nullable=True)  # How many lines stored (sum of chunkLines in ServerLogChunk)
+
+    # Tail position of the pm2 log files on the server, so only new output is shipped
+    outLogInode = Column(BigInteger, nullable=True)
+    outLogOffset = Column(BigInteger, nullable=True)
+    errorLogInode = Column(BigInteger, nullable=True)
+    errorLogOffset = Column(BigInteger, nullable=True)
+
     lastUpdatedAt = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
-    
+
     # Unique constraint for upsert per computer+logtype
     __table_args__ = (UniqueConstraint('computerId', 'logType', name='unique_computer_logtype'),)
-    
+
+    computer = relationship("Computer")
+    chunks = relationship("ServerLogChunk", back_populates="serverLog", order_by="ServerLogChunk.serverLogChunkId")
+
+class ServerLogChunk(Base):
+    __tablename__ = "ServerLogChunk"
+
+    serverLogChunkId = Column(BigInteger, primary_key=True, autoincrement=True)
+    serverLogId = Column(ForeignKey("ServerLogs.serverLogId", name="fk_ServerLogChunk_serverLogId", ondelete="CASCADE"), nullable=False, index=True)
+    chunkContent = Column(LONGTEXT, nullable=False)  # New log lines appended during one collection cycle
+    chunkLines = Column(Integer, nullable=False)
+    createdAt = Column(DateTime(timezone=True), server_default=func.now())
+
+    serverLog = relationship("ServerLogs", back_populates="chunks")
+
+class ReservationUsageSample(Base):
+    __tablename__ = "ReservationUsageSample"
+
+    reservationUsageSampleId = Column(BigInteger, primary_key=True, autoincrement=True)
+    reservationId = Column(ForeignKey("Reservation.reservationId", name="fk_ReservationUsageSample_reservationId", ondelete="CASCADE"), nullable=False, index=True)
+    sampledAt = Column(DateTime(timezone=True), nullable=False, index=True)
+
+    cpuPercent = Column(Float, nullable=True)  # Percentage of one CPU core, like docker stats (can exceed 100)
+    memoryUsedBytes = Column(BigInteger, nullable=True)
+    memoryLimitBytes = Column(BigInteger, nullable=True)
+    blockReadBytes = Column(BigInteger, nullable=True)  # Cumulative since container start
+    blockWriteBytes = Column(BigInteger, nullable=True)  # Cumulative since container start
+    gpuUtilizationPercent = Column(Float, nullable=True)  # Average over the reserved GPUs, NULL if no GPUs
+    gpuMemoryUsedBytes = Column(BigInteger, nullable=True)  # Sum over the reserved GPUs, NULL if no GPUs
+
+    reservation = relationship("Reservation")
+
+class ReservationLifecycleEvent(Base):
+    __tablename__ = "ReservationLifecycleEvent"
+
+    reservationLifecycleEventId = Column(BigInteger, primary_key=True, autoincrement=True)
+    reservationId = Column(ForeignKey("Reservation.reservationId", name="fk_ReservationLifecycleEvent_reservationId", ondelete="CASCADE"), nullable=False, index=True)
+    computerId = Column(ForeignKey("Computer.computerId", name="fk_ReservationLifecycleEvent_computerId"), nullable=False)
+    imageName = Column(String(255), nullable=False)
+    event = Column(String(32), nullable=False)  # Lifecycle step, see docker/lifecycle_events.py
+    startedAt = Column(DateTime(timezone=True), nullable=False, index=True)
+    durationMs = Column(Integer, nullable=False)
+    succeeded = Column(Boolean, nullable=False, default=True)
+
+    reservation = relationship("Reservation")
     computer = relationship("Computer")
 
+class ResourceVersion(Base):
+    __tablename__ = "ResourceVersion"
+
+    resource = Column(String(64), primary_key=True)  # Collection of tables, see helpers/resource_versions.py
+    version = Column(BigInteger, nullable=False, default=0)  # Bumped by every commit writing to the tables of the resource
+
 class UserBlacklist(Base):
   __tablename__ = "UserBlacklist"
 
@@ -323,6 +389,10 @@ class SystemSetting(Base):
 from sqlalchemy.orm import sessionmaker
 Session = sessionmaker(bind = engine)
 
+# Versions of resources for the ETags of read-mostly endpoints
+from helpers.resource_versions import trackResourceVersions
+trackResourceVersions(Session)
+
 # DEBUG: DEBUG THE AMOUNT OF POOLED AND OVERFLOW CONNECTIONS
 '''from sqlalchemy import event
 def checkout_listener(dbapi_con, con_record, con_proxy):
@@ -0,0 +1,127 @@
+import os
+import stat
+import secrets
+import subprocess
+import warnings
+from python_on_whales import docker
+
+# Image label telling how the image entrypoint reads the password hash of the container user:
+#   "file": from the secret file mounted at SECRET_CONTAINER_PATH, in "username:hash" format for `chpasswd -e`
+#   "env": from the CONTAINERFLY_PASSWORD_HASH environment variable
+# Images without the label get the password with docker exec after the container has started.
+PASSWORD_LABEL = "containerfly.password"
+PASSWORD_ENV_VARIABLE = "CONTAINERFLY_PASSWORD_HASH"
+SECRET_CONTAINER_PATH = "/run/secrets/containerfly_password"
+
+def hash_password(password):
+    '''
+    Hashes the password with SHA-512 crypt, the format `chpasswd -e` accepts.
+
+    Returns:
+        string: The password hash, for example "$6$salt$hash".
+    '''
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            import crypt
+        return crypt.crypt(password, crypt.mksalt(crypt.METHOD_SHA512))
+    except ImportError:
+        # The crypt module was removed in Python 3.13
+        salt = secrets.token_hex(8)
+        return subprocess.check_output(
+            ["openssl", "passwd", "-6", "-salt", salt, "-stdin"],
+            input=password, text=True
+        ).strip()
+
+def get_password_injection(image_name):
+    '''
+    Pulls the image and returns how it accepts the password at creation time.
+
+    Returns:
+        string: "file", "env" or None if the image only supports setting the password with docker exec.
+    '''
+    image = docker.image.pull(image_name, quiet=True)
+    labels = image.config.labels or {}
+    injection = labels.get(PASSWORD_LABEL)
+    return injection if injection in ("file", "env") else None
+
+def get_container_password_injection(container_name):
+    '''
+    Returns how the container was given the password at creation time, read from the labels of the container,
+    which are the labels of its image unless add_password_to_run_params() overrode them.
+
+    Returns:
+        string: "file", "env" or None if the password has to be set with docker exec.
+    '''
+    labels = docker.container.inspect(container_name).config.labels or {}
+    injection = labels.get(PASSWORD_LABEL)
+    return injection if injection in ("file", "env") else None
+
+def get_secrets_folder():
+    '''
+    Returns the folder of the password secret files (docker.secretsFolder), creating it if needed.
+    The folder has to be a directory of the user running the docker utility that no one else can access,
+    otherwise another local user could have created it in advance or replaced it with a symlink.
+
+    Raises:
+        PermissionError: If the folder is not a directory owned by this user with mode 0700.
+        OSError: If the folder cannot be created.
+    '''
+    from settings_handler import getSetting
+    folder = getSetting("docker.secretsFolder")
+    os.makedirs(os.path.dirname(folder), mode=0o755, exist_ok=True)
+    try:
+        os.mkdir(folder, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(folder)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.geteuid() or stat.S_IMODE(info.st_mode) != 0o700:
+        raise PermissionError(f"The secrets folder {folder} must be a directory owned by the user running the docker utility, with mode 0700")
+    return folder
+
+def get_secret_file_path(container_name):
+    from settings_handler import getSetting
+    return os.path.join(getSetting("docker.secretsFolder"), f"{container_name}.password")
+
+def add_password_to_run_params(run_params, injection, container_name, username, password):
+    '''
+    Adds the hashed password of the container user to the docker run parameters. If the secrets folder
+    cannot be used, the container is labelled to have its password set with docker exec after it has started.
+
+    Parameters:
+        run_params: docker.run() parameters, modified in place.
+        injection: "file" or "env", see get_password_injection().
+        container_name: Name of the container.
+        username: The container user.
+        password: Plain text password.
+    '''
+    password_hash = hash_password(password)
+    if injection == "env":
+        run_params.setdefault("envs", {})[PASSWORD_ENV_VARIABLE] = password_hash
+        return
+
+    try:
+        secrets_folder = get_secrets_folder()
+    except OSError as e:
+        print(f"Cannot use the secrets folder, the password of {container_name} is set with docker exec instead: {e}")
+        # Labels of the container override the labels of its image, see get_container_password_injection()
+        run_params["labels"] = dict(run_params.get("labels") or {}, **{ PASSWORD_LABEL: "exec" })
+        return
+
+    secret_file_path = os.path.join(secrets_folder, f"{container_name}.password")
+    # A file left by an earlier container of the same name is replaced, symlinks are never followed
+    remove_secret_file(container_name)
+    file_descriptor = os.open(secret_file_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW, 0o600)
+    with os.fdopen(file_descriptor, "w") as secret_file:
+        secret_file.write(f"{username}:{password_hash}\n")
+    # Kept until the container is removed, so the entrypoint can read it again when the container restarts
+    run_params["volumes"] = list(run_params.get("volumes", [])) + [(secret_file_path, SECRET_CONTAINER_PATH, "ro")]
+
+def remove_secret_file(container_name):
+    '''
+    Removes the password secret file of the container, if any.
+    '''
+    try:
+        os.remove(get_secret_file_path(container_name))
+    except FileNotFoundError:
+        pass
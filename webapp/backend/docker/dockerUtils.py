@@ -1,5 +1,7 @@
 from python_on_whales import docker
-from database import Session, Reservation, Computer, ReservedContainerPort, Role
+from database import Session, Reservation, Computer, ReservedContainer, ReservedContainerPort
+from sqlalchemy import and_, or_, update
+from sqlalchemy.orm import joinedload
 from helpers.auth import create_password
 from helpers.server import ORMObjectToDict
 #from dateutil import parser
@@ -9,7 +11,9 @@ from datetime import timezone
 import datetime
 from helpers.auth import create_password
 from settings_handler import settings_handler
-from docker.docker_functionality import get_email_container_started, start_container, stop_container, restart_container
+from docker.docker_functionality import get_email_container_started, start_container, create_container, start_created_container, stop_container, stop_containers, restart_container
+from docker.mount_resolver import resolve_mounts
+from docker.lifecycle_events import LifecycleRecorder, QUEUED, PRESTAGED, NOTIFIED, READY
 import random
 import socket
 import os
@@ -28,7 +32,10 @@ def get_available_port():
   # Loop through all started containers and get the ports in use
   portsInUse = []
   with Session() as session:
-    allActiveReservations = session.query(Reservation).filter( Reservation.status == "started" )
+    # Pre-staged containers have their ports reserved before they are started
+    allActiveReservations = session.query(Reservation)\
+      .join(ReservedContainer, ReservedContainer.reservedContainerId == Reservation.reservedContainerId)\
+      .filter( or_(Reservation.status == "started", and_(Reservation.status == "reserved", ReservedContainer.stagedAt.isnot(None))) )
     for reservation in allActiveReservations:
       for usedPort in reservation.reservedContainer.reservedContainerPorts:
         #print("Used port:", usedPort.outsidePort)
@@ -55,131 +62,272 @@ def get_available_port():
 def timeNow():
   return datetime.datetime.now(datetime.timezone.utc)
 
-def startDockerContainer(reservationId: str):
-  with Session() as session:
-    reservation = session.query(Reservation).filter( Reservation.reservationId == reservationId ).first()
-    if reservation == None: return False
-    sshPassword = create_password()
+def getContainerName(reservation):
+  imageName = reservation.reservedContainer.container.imageName
+  timeNowParsed = timeNow().strftime('%m_%d_%Y_%H_%M_%S')
+  return f"reservation-{reservation.reservationId}-{imageName.replace(':', '').replace('/', '')}-{timeNowParsed}"
 
-    imageName = reservation.reservedContainer.container.imageName
-    hwSpecs = {}
-    gpuSpecs = {}
-    for spec in reservation.reservedHardwareSpecs:
-      if spec.hardwareSpec.type == "gpu":
-        gpuSpecs[spec.hardwareSpec.internalId] = { "amount": spec.amount }
-      else:
-        hwSpecs[spec.hardwareSpec.type] = { "amount": spec.amount }
-      #print(f"{spec.hardwareSpec.type}: {spec.amount} {spec.hardwareSpec.format}")
-
-    timeNowParsed = timeNow().strftime('%m_%d_%Y_%H_%M_%S')
-
-    containerName = f"reservation-{reservation.reservationId}-{imageName.replace(':', '').replace('/', '')}-{timeNowParsed}"
-    reservation.reservedContainer.containerDockerName = containerName
-
-    ports = []
-
-    # Set bindable ports for the reservation container
-    for port in reservation.reservedContainer.container.containerPorts:
-      #print(port.port)
-      outsidePort = get_available_port()
-      ports.append({
-        "containerPortId" : port.containerPortId,
-        "serviceName": port.serviceName,
-        "localPort": port.port,
-        "outsidePort": outsidePort
-      })
-
-    # Create the GPUs string to be passed to Docker
-    gpusString = ""
-    # Loop through all hwSpecs and find the reserved GPU internal IDs (Nvidia / cuda IDs), if any
-    if len(gpuSpecs) > 0:
-      gpusString = "device="
-      for gpu in gpuSpecs:
-        gpusString = gpusString + gpu + ","
-      # Remove the trailing , from gpuSpecs, if it exists
-      if gpusString[-1] == ",": gpusString = gpusString[:-1]
-    
-
-    # Create the port string to be passed to Docker
-    portsForContainer = []
-    for port in ports:
-      portsForContainer.append( (port["outsidePort"], port["localPort"]) )
-
-    details = {
-      "name": containerName,
-      "image": imageName,
-      "username": "user",
-      "cpus": int(hwSpecs['cpus']["amount"]),
-      "gpus": gpusString if gpusString else None,  # Convert empty string to None
-      "memory": f"{hwSpecs['ram']['amount']}g",
-      "shm_size_percent": reservation.reservedContainer.shmSizePercent if reservation.reservedContainer.shmSizePercent is not None else 50,
-      "ram_disk_percent": reservation.reservedContainer.ramDiskSizePercent if reservation.reservedContainer.ramDiskSizePercent is not None else 0,
-      "ports": portsForContainer,
-      "password": sshPassword,
-      "dbUserId": reservation.userId,
-      "reservation": {
-        "computerId": reservation.computerId,
-        "user": {
-          "email": reservation.user.email
-        }
+def allocatePorts(reservation):
+  '''
+  Picks free outside ports for the ports of the reserved container.
+  Returns:
+    List of ports: [ { containerPortId, serviceName, localPort, outsidePort } ]
+  '''
+  ports = []
+  # Set bindable ports for the reservation container
+  for port in reservation.reservedContainer.container.containerPorts:
+    #print(port.port)
+    outsidePort = get_available_port()
+    ports.append({
+      "containerPortId" : port.containerPortId,
+      "serviceName": port.serviceName,
+      "localPort": port.port,
+      "outsidePort": outsidePort
+    })
+  return ports
+
+def getReservedPorts(reservation):
+  '''
+  Returns the ports already bound to the reserved container, in the same format as allocatePorts().
+  '''
+  ports = []
+  for reservedPort in reservation.reservedContainer.reservedContainerPorts:
+    ports.append({
+      "containerPortId" : reservedPort.containerPortForeign,
+      "serviceName": reservedPort.containerPort.serviceName,
+      "localPort": reservedPort.containerPort.port,
+      "outsidePort": reservedPort.outsidePort
+    })
+  return ports
+
+def getContainerDetails(session, reservation, containerName: str, sshPassword: str, ports: list):
+  '''
+  Builds the start_container() / create_container() parameters of the reservation.
+  '''
+  imageName = reservation.reservedContainer.container.imageName
+  hwSpecs = {}
+  gpuSpecs = {}
+  for spec in reservation.reservedHardwareSpecs:
+    if spec.hardwareSpec.type == "gpu":
+      gpuSpecs[spec.hardwareSpec.internalId] = { "amount": spec.amount }
+    else:
+      hwSpecs[spec.hardwareSpec.type] = { "amount": spec.amount }
+    #print(f"{spec.hardwareSpec.type}: {spec.amount} {spec.hardwareSpec.format}")
+
+  # Create the GPUs string to be passed to Docker
+  gpusString = ""
+  # Loop through all hwSpecs and find the reserved GPU internal IDs (Nvidia / cuda IDs), if any
+  if len(gpuSpecs) > 0:
+    gpusString = "device="
+    for gpu in gpuSpecs:
+      gpusString = gpusString + gpu + ","
+    # Remove the trailing , from gpuSpecs, if it exists
+    if gpusString[-1] == ",": gpusString = gpusString[:-1]
+  
+
+  # Create the port string to be passed to Docker
+  portsForContainer = []
+  for port in ports:
+    portsForContainer.append( (port["outsidePort"], port["localPort"]) )
+
+  details = {
+    "name": containerName,
+    "image": imageName,
+    "username": "user",
+    "cpus": int(hwSpecs['cpus']["amount"]),
+    "gpus": gpusString if gpusString else None,  # Convert empty string to None
+    "memory": f"{hwSpecs['ram']['amount']}g",
+    "shm_size_percent": reservation.reservedContainer.shmSizePercent if reservation.reservedContainer.shmSizePercent is not None else 50,
+    "ram_disk_percent": reservation.reservedContainer.ramDiskSizePercent if reservation.reservedContainer.ramDiskSizePercent is not None else 0,
+    "ports": portsForContainer,
+    "password": sshPassword,
+    "dbUserId": reservation.userId,
+    "reservation": {
+      "computerId": reservation.computerId,
+      "user": {
+        "email": reservation.user.email
       }
     }
+  }
 
-    # Add role-based mounts (now the unified mounting system)
-    details["roleMounts"] = []
-    
-    # Always add mounts from "Everyone" role
-    with Session() as mount_session:
-        everyone_role = mount_session.query(Role).filter(Role.name == "everyone").first()
-        if everyone_role:
-            for mount in everyone_role.mounts:
-                if mount.computerId == reservation.computerId:
-                    details["roleMounts"].append({
-                        "hostPath": mount.hostPath,
-                        "containerPath": mount.containerPath,
-                        "readOnly": mount.readOnly,
-                        "computerId": mount.computerId
-                    })
-    
-    # Add mounts from user's assigned roles
-    for role in reservation.user.roles:
-        for mount in role.mounts:
-            # Only add mounts for the current computer
-            if mount.computerId == reservation.computerId:
-                # Check if this mount is already added (avoid duplicates from Everyone role)
-                mount_exists = any(
-                    existing["hostPath"] == mount.hostPath and 
-                    existing["containerPath"] == mount.containerPath 
-                    for existing in details["roleMounts"]
-                )
-                if not mount_exists:
-                    details["roleMounts"].append({
-                        "hostPath": mount.hostPath,
-                        "containerPath": mount.containerPath,
-                        "readOnly": mount.readOnly,
-                        "computerId": mount.computerId
-                    })
+  # Add role-based mounts (now the unified mounting system), the "everyone" role and the roles of the user
+  details["roleMounts"] = resolve_mounts(session, reservation.userId, reservation.user.email, reservation.computerId)
+  return details
+
+def unstageReservation(session, reservation):
+  '''
+  Forgets the pre-staged container of the reservation and frees its ports. Does not commit.
+  '''
+  for reservedPort in reservation.reservedContainer.reservedContainerPorts:
+    session.delete(reservedPort)
+  session.flush()
+  session.expire(reservation.reservedContainer, ["reservedContainerPorts"])
+  reservation.reservedContainer.stagedAt = None
+  reservation.reservedContainer.containerDockerName = None
+  reservation.reservedContainer.sshPassword = None
+
+def stageDockerContainer(reservationId: str):
+  '''
+  Creates the container of an upcoming reservation without starting it. The image is pulled, the mounts
+  prepared, the ports allocated and the password set now, so that at the start date startDockerContainer()
+  only has to start the container.
+  Returns:
+    True if the container was created.
+  '''
+  try:
+    with Session() as session:
+      reservation = session.query(Reservation).filter( Reservation.reservationId == reservationId ).first()
+      if reservation == None or reservation.status != "reserved" or reservation.reservedContainer.stagedAt is not None: return False
+
+      sshPassword = create_password()
+      containerName = getContainerName(reservation)
+      ports = allocatePorts(reservation)
+      details = getContainerDetails(session, reservation, containerName, sshPassword, ports)
+      recorder = LifecycleRecorder(reservation.reservationId, reservation.computerId, reservation.reservedContainer.container.imageName)
+      details["lifecycle"] = recorder
+
+      created = False
+      try:
+        with recorder.span(PRESTAGED):
+          created, cont_name, cont_password, errors = create_container(details)
+          if created == False: raise Exception(errors)
+      except Exception as e:
+        print(f"Could not pre-stage the container of reservation {reservationId}, it will be created at the start date. Error:")
+        print(e)
+        recorder.flush(session)
+        session.commit()
+        return False
+
+      # The ports are stored right away so that they are not given to other containers
+      for port in ports:
+        reservation.reservedContainer.reservedContainerPorts.append(ReservedContainerPort(
+          outsidePort = port["outsidePort"],
+          containerPortForeign = port["containerPortId"]
+        ))
+      reservation.reservedContainer.containerDockerName = containerName
+      reservation.reservedContainer.sshPassword = cont_password
+      reservation.reservedContainer.stagedAt = timeNow()
+      recorder.flush(session)
+      session.commit()
+      return True
+  except Exception as e:
+    print("Error pre-staging server:")
+    print(e)
+    return False
+
+def claimReservationStart(reservationId: str, computerId: int = None):
+  '''
+  Marks the reservation as being started (Reservation.startingAt) with one conditional update, committed right away.
+  docker/failover.py does not move claimed reservations, and no row lock is held while the container starts.
+  Parameters:
+    reservationId: ID of the reservation.
+    computerId: ID of the computer starting it. Not claimed if the reservation was moved to another computer.
+  Returns:
+    True if claimed, False if the reservation was moved, started, cancelled or claimed meanwhile.
+  '''
+  with Session() as session:
+    conditions = [Reservation.reservationId == reservationId, Reservation.status == "reserved", Reservation.startingAt.is_(None)]
+    if computerId is not None:
+      conditions.append(Reservation.computerId == computerId)
+    claimed = session.execute(update(Reservation).where(*conditions).values(startingAt=timeNow()).execution_options(synchronize_session=False)).rowcount
+    session.commit()
+    return claimed == 1
+
+def releaseStartingClaims(computerId: int, reservationId: str = None):
+  '''
+  Clears the start claims of the computer, or only the claim of the given reservation.
+  Called after a start and when the docker utility starts, for claims left by a run which stopped mid-start.
+  '''
+  with Session() as session:
+    conditions = [Reservation.startingAt.isnot(None)]
+    if reservationId is not None:
+      conditions.append(Reservation.reservationId == reservationId)
+    else:
+      conditions.append(Reservation.computerId == computerId)
+    session.execute(update(Reservation).where(*conditions).values(startingAt=None).execution_options(synchronize_session=False))
+    session.commit()
+
+def startDockerContainer(reservationId: str, computerId: int = None):
+  '''
+  Starts the container of a reservation. The reservation is claimed first (see claimReservationStart()),
+  so that docker/failover.py does not move it to another server while it is being started here.
+  Parameters:
+    reservationId: ID of the reservation.
+    computerId: ID of the computer starting it. The reservation is not started if it was moved to another computer.
+  '''
+  if not claimReservationStart(reservationId, computerId):
+    return False
+  try:
+    return startClaimedDockerContainer(reservationId)
+  finally:
+    releaseStartingClaims(computerId, reservationId)
+
+def startClaimedDockerContainer(reservationId: str):
+  '''
+  Starts the container of a reservation claimed with claimReservationStart(). The reservation row is only
+  locked at the end, to check that it was not cancelled meanwhile and to mark it started.
+  '''
+  with Session() as session:
+    reservation = session.query(Reservation).filter( Reservation.reservationId == reservationId ).first()
+    if reservation == None: return False
+    imageName = reservation.reservedContainer.container.imageName
+    recorder = LifecycleRecorder(reservation.reservationId, reservation.computerId, imageName)
+    recorder.add_since(QUEUED, reservation.startDate)
 
     cont_was_started = False
-    #print(details)
-    print("Starting container..")
-    cont_was_started, cont_name, cont_password, errors, non_critical_errors = start_container(details)
+    staged = reservation.reservedContainer.stagedAt is not None
+    if staged:
+      # The container was created ahead of time by stageDockerContainer(), it only needs to be started
+      sshPassword = reservation.reservedContainer.sshPassword
+      ports = getReservedPorts(reservation)
+      details = getContainerDetails(session, reservation, reservation.reservedContainer.containerDockerName, sshPassword, ports)
+      details["lifecycle"] = recorder
+      print("Starting pre-staged container..")
+      cont_was_started, cont_name, cont_password, errors, non_critical_errors = start_created_container(details)
+      if cont_was_started == False:
+        print("Could not start the pre-staged container, creating it again.")
+        unstageReservation(session, reservation)
+        staged = False
+
+    if cont_was_started == False:
+      sshPassword = create_password()
+      containerName = getContainerName(reservation)
+      reservation.reservedContainer.containerDockerName = containerName
+      ports = allocatePorts(reservation)
+      details = getContainerDetails(session, reservation, containerName, sshPassword, ports)
+      details["lifecycle"] = recorder
+      print("Starting container..")
+      cont_was_started, cont_name, cont_password, errors, non_critical_errors = start_container(details)
+
     print("Container started!")
     print("Result: " + str(cont_was_started))
 
+    # Locked only until the commit below. Cancelled or edited while the container was starting?
+    session.refresh(reservation, ["status"], with_for_update=True)
+    if cont_was_started == True and reservation.status != "reserved":
+      print(f"Reservation {reservationId} was {reservation.status} while its container was starting, removing container {cont_name}.")
+      stop_container(cont_name)
+      recorder.flush(session)
+      session.commit()
+      return False
+
     if cont_was_started == True:
       print(f"Container with Docker name {cont_name} was started succesfully.")
-      # Set bound ports
-      for port in ports:
-        reservation.reservedContainer.reservedContainerPorts.append(ReservedContainerPort(
-          outsidePort = port["outsidePort"],
-          containerPortForeign = port["containerPortId"]
-        ))
+      # Set bound ports, pre-staged containers have them already
+      if not staged:
+        for port in ports:
+          reservation.reservedContainer.reservedContainerPorts.append(ReservedContainerPort(
+            outsidePort = port["outsidePort"],
+            containerPortForeign = port["containerPortId"]
+          ))
 
       # Set basic reservation status
       reservation.status = "started"  
       reservation.reservedContainer.sshPassword = cont_password
       reservation.reservedContainer.startedAt = timeNow()
+      recorder.flush(session)
+      session.commit()
+
       # Send the email
       from settings_handler import getSetting
       if getSetting('email.sendEmail'):
@@ -192,7 +340,10 @@ def startDockerContainer(reservationId: str):
           non_critical_errors,
           reservation.endDate
           )
-        send_email(reservation.user.email, "AI Server is ready to use!", body)
+        with recorder.span(NOTIFIED):
+          send_email(reservation.user.email, "AI Server is ready to use!", body)
+      recorder.add_since(READY, reservation.startDate)
+      recorder.flush(session)
       
       session.commit()
     else:
@@ -204,8 +355,10 @@ def startDockerContainer(reservationId: str):
       print("Non-critical errors:")
       if non_critical_errors:
         print(non_critical_errors)
-      reservation.status = "error"
+      if reservation.status == "reserved":
+        reservation.status = "error"
       reservation.reservedContainer.containerDockerErrorMessage = str(errors)
+      recorder.flush(session)
       session.commit()
 
       # Send email about the error
@@ -306,6 +459,47 @@ def stopDockerContainer(reservationId: str):
     print("Error stopping server:")
     print(e)
 
+def stopDockerContainers(reservationIds: list):
+  '''
+  Stops the containers of the given reservations concurrently and removes them in one call.
+  Only after that the reservations are marked as stopped, with a single commit. Reservations whose
+  container could not be stopped and removed stay as they are, so that they are stopped again on the next pass.
+  The grace period before a container is killed comes from its image (Container.stopTimeoutSeconds)
+  or the docker.stopTimeoutSeconds setting.
+  Parameters:
+    reservationIds: IDs of the reservations.
+  '''
+  if not reservationIds: return
+  try:
+    with Session() as session:
+      reservations = session.query(Reservation)\
+        .options(joinedload(Reservation.reservedContainer).joinedload(ReservedContainer.container))\
+        .filter( Reservation.reservationId.in_(reservationIds) ).all()
+
+      defaultTimeout = settings_handler.getSetting("docker.stopTimeoutSeconds")
+      stopTimeouts = {}
+      for reservation in reservations:
+        containerName = reservation.reservedContainer.containerDockerName
+        # Pre-staged containers of cancelled reservations are created but not running
+        isStaged = reservation.status == "reserved" and reservation.reservedContainer.stagedAt is not None
+        if (reservation.status == "started" or isStaged) and containerName:
+          stopTimeout = reservation.reservedContainer.container.stopTimeoutSeconds
+          stopTimeouts[containerName] = stopTimeout if stopTimeout is not None else defaultTimeout
+
+      removedNames = stop_containers(stopTimeouts)
+      for reservation in reservations:
+        containerName = reservation.reservedContainer.containerDockerName
+        if containerName in stopTimeouts and containerName not in removedNames:
+          # Still running or not removed, its hardware is not freed. The next pass tries again.
+          print(f"Container {containerName} could not be stopped and removed, trying again on the next pass.")
+          continue
+        reservation.status = "stopped"
+        reservation.reservedContainer.stoppedAt = timeNow()
+      session.commit()
+  except Exception as e:
+    print("Error stopping servers:")
+    print(e)
+
 def stopOrphanDockerContainer(containerName):
   if not containerName: return
   try:
@@ -353,6 +547,29 @@ def getReservationsRequiringStart(computerId : int):
     )
     return reservations
 
+def getReservationsRequiringStaging(computerId : int, minutes : int):
+  '''
+  Returns all reservations starting within the given minutes in the given computer, which do not have a pre-staged container yet.
+  Parameters:
+    computerId: ID of the computer.
+    minutes: How far ahead reservations are pre-staged.
+  
+  Returns:
+    List of reservations requiring pre-staging in the given computer.
+  '''
+  with Session() as session:
+    reservations = session.query(Reservation)\
+      .join(ReservedContainer, ReservedContainer.reservedContainerId == Reservation.reservedContainerId)\
+      .filter(
+        Reservation.status == "reserved",
+        Reservation.computerId == computerId,
+        Reservation.startDate > timeNow(),
+        Reservation.startDate < timeNow() + datetime.timedelta(minutes=minutes),
+        Reservation.endDate > timeNow(),
+        ReservedContainer.stagedAt.is_(None)
+      )
+    return reservations
+
 def getRunningReservations(computerId : int):
   '''
   Returns all running reservations in the given computer.
@@ -476,3 +693,32 @@ def getRunningReservedDockerContainers():
   ]
 
   return reservation_containers
+
+def getCreatedReservedDockerContainers():
+  '''
+  Finds all Docker containers with name starting with "reservation-" which were created but never started.
+  These are the pre-staged containers of upcoming reservations on this computer.
+  '''
+  all_containers = docker.ps(all=True)
+
+  return [
+    container for container in all_containers
+      if container.name.startswith("reservation-") and container.state.status == "created"
+  ]
+
+def getReservedContainerNames(computerId : int):
+  '''
+  Returns the container names the database binds to this computer: the pre-staged containers of
+  upcoming reservations and the containers of started reservations.
+  Parameters:
+    computerId: ID of the computer.
+  '''
+  with Session() as session:
+    rows = session.query(ReservedContainer.containerDockerName)\
+      .join(Reservation, Reservation.reservedContainerId == ReservedContainer.reservedContainerId)\
+      .filter(
+        Reservation.computerId == computerId,
+        ReservedContainer.containerDockerName.isnot(None),
+        or_(Reservation.status == "started", and_(Reservation.status == "reserved", ReservedContainer.stagedAt.isnot(None)))
+      )
+    return { containerDockerName for (containerDockerName,) in rows }
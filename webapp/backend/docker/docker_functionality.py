@@ -1,39 +1,30 @@
 #! /usr/bin/python3
 from python_on_whales import docker
 from helpers.auth import create_password
-from helpers.Utils import removeSpecialCharacters
 from datetime import datetime
 from settings_handler import settings_handler
 from python_on_whales.exceptions import NoSuchContainer
 import os
-import shutil
 import traceback
 import getpass
-from database import Session, Role
-import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from docker.mount_preparation import prepare_mount_folders
+from docker.lifecycle_events import NULL_RECORDER, MOUNTS_PREPARED, PULLED, CREATED, STARTED, CREDENTIALS_SET, USER_SCRIPT_DONE
+from docker.credentials import get_password_injection, get_container_password_injection, add_password_to_run_params, remove_secret_file
 
-def substitute_mount_variables(path, user_email, user_id):
-    """Substitute template variables in mount paths"""
-    if not path:
-        return path
-    
-    # Sanitize email for filesystem use
-    email_sanitized = removeSpecialCharacters(user_email)
-    
-    substitutions = {
-        '{email}': email_sanitized,
-        '{userid}': str(user_id)
-    }
-    
-    result = path
-    for variable, value in substitutions.items():
-        result = result.replace(variable, value)
-    
-    return result
+# Maximum amount of containers stopped at the same time
+STOP_MAX_WORKERS = 16
+
+def get_full_image_name(image, image_version="latest"):
+    '''
+    Returns the name of the image in the local registry.
+    '''
+    return f"{settings_handler.getSetting('docker.registryAddress')}/{image}:{image_version}"
 
 def start_container(pars):
     """
-    Starts a Docker container with the given parameters.
+    Creates and starts a Docker container with the given parameters.
+    Same as create_container() followed by start_created_container().
 
     If the container cannot be started or there are any problems running this function,
     will try to stop the created container (if able to).
@@ -48,9 +39,7 @@ def start_container(pars):
         dbUserId (string): User ID from the database who started the container
         reservation: Reservation dictionary containing computerId and user data (with email)
         roleMounts (list): List of mount dictionaries with hostPath, containerPath, readOnly, computerId
-                          hostPath and containerPath support template variables:
-                          - {email}: User's email with special characters removed (e.g., "test_foo_com")
-                          - {userid}: User's database ID (e.g., "123")
+                          Template variables in the paths must already be substituted, see resolve_mounts() in docker/mount_resolver.py
     Optional parameters:
         gpus (string): The amount of gpus dedicated for the container in format "device=0,2,4" where "0", "2" and "4" are device nvidia / cuda IDs. Pass None if no gpus are needed.
         image_version (string) (default: "latest"): The image version to use.
@@ -58,6 +47,7 @@ def start_container(pars):
         interactive (int) (default: True): Leave stdin open during the duration of the process to allow communication with the parent process. Currently only works with tty=True for interactive use on the terminal.
         remove (int) (default: True): If this is True, removes the container after it is stopped.
         shm_size (int): The size of the shared memory. For example: 1g
+        lifecycle (LifecycleRecorder): Records how long each step takes, see docker/lifecycle_events.py
     Returns:
         namedtuple:
             (boolean) started: True if the container was started successfully,
@@ -66,6 +56,26 @@ def start_container(pars):
             (string) error_message: Error message(s) (if any),
             (string) non_critical_error: Non-critical error messages (if any)
     """
+    created, container_name, password, error_message = create_container(pars)
+    if not created:
+        return False, "", "", error_message, None
+    return start_created_container(pars)
+
+def create_container(pars):
+    """
+    Creates a Docker container with the given parameters without starting it.
+    Pulls the image, prepares the mount folders and passes the password
+    at creation time if the image supports it. The ports are bound when the container is started.
+
+    Parameters:
+        The same as start_container().
+    Returns:
+        tuple:
+            (boolean) created: True if the container was created successfully,
+            (string) container_name: The name of the container (if any),
+            (string) password: The password of the container user (if any),
+            (string) error_message: Error message(s) (if any)
+    """
     try:
         # Verify parameters first
         if "name" not in pars: raise Exception("Missing parameter: name")
@@ -84,6 +94,7 @@ def start_container(pars):
         if "image_version" not in pars: pars["image_version"] = "latest"
         if "interactive" not in pars: pars["interactive"] = True
         if "remove" not in pars: pars["remove"] = True
+        lifecycle = pars.get("lifecycle", NULL_RECORDER)
 
         # Create random password for the user if it was not passed
         if "password" not in pars: pars["password"] = create_password()
@@ -134,42 +145,20 @@ def start_container(pars):
         mountUser = os.getenv('USER') or os.getenv('USERNAME') or getpass.getuser()
         mountGroup = "docker"
 
-        # Get user info for variable substitution
-        user_email = pars["reservation"]["user"]["email"]
         user_id = pars["dbUserId"]
 
-        # Unified mount processing with variable substitution
+        # Unified mount processing
         computer_id = pars["reservation"]["computerId"]
+        mount_host_paths = []
         for mount in pars["roleMounts"]:
             # Only include mounts for this specific computer
             if mount["computerId"] == computer_id:
-                # Apply variable substitution to paths
-                host_path = substitute_mount_variables(mount["hostPath"], user_email, user_id)
-                container_path = substitute_mount_variables(mount["containerPath"], user_email, user_id)
+                host_path = mount["hostPath"]
+                container_path = mount["containerPath"]
                 read_only = mount["readOnly"]
                 
                 if host_path:
-                    # Create directory for mounting if it does not exist
-                    if not os.path.isdir(host_path):
-                        os.makedirs(host_path, exist_ok=True)
-                    # Set correct owner and group for the mount folder (keep docker group for mounting)
-                    shutil.chown(host_path, user=mountUser, group=mountGroup)
-                    # Set correct file permissions for the mount folder
-                    os.chmod(host_path, 0o775)
-                    
-                    # Remove any existing ACLs to ensure default Unix behavior
-                    try:
-                        subprocess.run(['setfacl', '-b', host_path], check=True, capture_output=True)
-                    except Exception as e:
-                        print("Resetting ACL permissions for a mount folder failed:")
-                        print(e)
-                    
-                    # Give containerfly group write access to the directory
-                    try:
-                        subprocess.run(['setfacl', '-m', 'g:containerfly:rwx', host_path], check=True)
-                    except Exception as e:
-                        print(f"Failed to set containerfly group permissions on {host_path}:")
-                        print(e)
+                    mount_host_paths.append(host_path)
                 
                 # Add the volume mount
                 if read_only:
@@ -177,7 +166,11 @@ def start_container(pars):
                 else:
                     volumes.append((host_path, container_path))
 
-        full_image_name = f"{settings_handler.getSetting('docker.registryAddress')}/{pars['image']}:{pars['image_version']}"
+        # Create the mount folders and set their owner, mode and ACL (skips folders which are already correct)
+        with lifecycle.span(MOUNTS_PREPARED):
+            prepare_mount_folders(mount_host_paths, mountUser, mountGroup, (user_id, computer_id))
+
+        full_image_name = get_full_image_name(pars['image'], pars['image_version'])
 
         # RAM disk configuration
         ram_mounts = []
@@ -192,7 +185,7 @@ def start_container(pars):
             tmpfs_config = f"type=tmpfs,destination={mount_path},tmpfs-size={ram_disk_bytes}"
             ram_mounts.append(tmpfs_config)
         
-        # Start the container
+        # Create the container
         # Build the base parameters
         run_params = {
             'volumes': volumes,
@@ -202,14 +195,13 @@ def start_container(pars):
             'shm_size': pars['shm_size'],
             'cpus': pars['cpus'],
             'publish': pars['ports'],
-            'detach': True,
             'interactive': pars['interactive'],
             # Do not automatically remove the container as it will stop.
             # Removing a container will be handled manually in the stop_container() function.
             # If it would be removed, restarting or crashing a container would fully destroy it immediately.
             'remove': False,
-            # Looks every time if there is newer image in local registery
-            'pull': 'always',
+            # The image was already pulled from the local registry when checking how it accepts the password
+            'pull': 'missing',
             #user="1002:130"
         }
         
@@ -222,17 +214,57 @@ def start_container(pars):
             # mounts expects a list of lists where each inner list contains mount config parts
             run_params['mounts'] = [[mount] for mount in ram_mounts]
             
-        cont = docker.run(full_image_name, **run_params)
-        #print("The running container: ", cont)
-        #print("=== Stop printing running container")
-        docker.execute(container=container_name, command=["/bin/bash","-c", f"/bin/echo 'user:{pars['password']}' | /usr/sbin/chpasswd"], user="root")
+        # Pass the hashed password when creating the container if the image supports it,
+        # otherwise it is set with docker exec after the container has started (legacy images)
+        with lifecycle.span(PULLED):
+            password_injection = get_password_injection(full_image_name)
+        if password_injection:
+            add_password_to_run_params(run_params, password_injection, container_name, pars["username"], pars["password"])
+            
+        with lifecycle.span(CREATED):
+            docker.container.create(full_image_name, **run_params)
     except Exception as e:
-        print(f"Something went wrong starting container {container_name or 'unknown'}. Trying to stop the container. Error:")
+        print(f"Something went wrong creating container {container_name or 'unknown'}. Trying to remove the container. Error:")
         print(e)
         print("Stack trace:")
         print(traceback.format_exc())
-        if container_name:  # Only try to stop if we have a name
+        if container_name:  # Only try to remove if we have a name
             stop_container(container_name)
+        return False, "", "", e
+
+    return True, container_name, pars["password"], ""
+
+def start_created_container(pars):
+    """
+    Starts a container created with create_container(). Sets the password with docker exec
+    for images which do not accept it at creation time and runs the config.bash of the user.
+    If the container cannot be started, it is removed.
+
+    Required parameters:
+        name (string): Name of the container.
+        password (string): Password for the user of the container.
+        reservation: Reservation dictionary containing computerId.
+        roleMounts (list): The mounts the container was created with.
+    Optional parameters:
+        lifecycle (LifecycleRecorder): Records how long each step takes.
+    Returns:
+        The same as start_container().
+    """
+    container_name = pars["name"]
+    computer_id = pars["reservation"]["computerId"]
+    lifecycle = pars.get("lifecycle", NULL_RECORDER)
+    try:
+        with lifecycle.span(STARTED):
+            docker.container.start(container_name)
+        with lifecycle.span(CREDENTIALS_SET):
+            if not get_container_password_injection(container_name):
+                docker.execute(container=container_name, command=["/bin/bash","-c", f"/bin/echo 'user:{pars['password']}' | /usr/sbin/chpasswd"], user="root")
+    except Exception as e:
+        print(f"Something went wrong starting container {container_name}. Trying to stop the container. Error:")
+        print(e)
+        print("Stack trace:")
+        print(traceback.format_exc())
+        stop_container(container_name)
         return False, "", "", e, None
 
     try:
@@ -243,14 +275,15 @@ def start_container(pars):
         # then config.bash should be at /data/users/{email_sanitized}/config/config.bash
         
         # Look for config.bash in any mounted persistent volume
-        for mount in pars["roleMounts"]:
-            if mount["computerId"] == computer_id and not mount["readOnly"]:
-                container_path = substitute_mount_variables(mount["containerPath"], user_email, user_id)
-                host_path = substitute_mount_variables(mount["hostPath"], user_email, user_id)
-                config_path = f'{host_path}/config/config.bash'
-                if os.path.exists(config_path):
-                    docker.execute(container=container_name, command=["/bin/bash","-c", f"timeout 60 {container_path}/config/config.bash"], user="root")
-                    break  # Only run the first config.bash found
+        with lifecycle.span(USER_SCRIPT_DONE):
+            for mount in pars["roleMounts"]:
+                if mount["computerId"] == computer_id and not mount["readOnly"]:
+                    container_path = mount["containerPath"]
+                    host_path = mount["hostPath"]
+                    config_path = f'{host_path}/config/config.bash'
+                    if os.path.exists(config_path):
+                        docker.execute(container=container_name, command=["/bin/bash","-c", f"timeout 60 {container_path}/config/config.bash"], user="root")
+                        break  # Only run the first config.bash found
     except Exception as e:
         print(f"Something went wrong when running users config.bash in  {container_name}. This is not critical, most likely user error")
         print(e)
@@ -278,9 +311,63 @@ def stop_container(container_name):
     except NoSuchContainer as e:
         print(f"Error removing container: {container_name}")
         noErrors = False
+
+    remove_secret_file(container_name)
     
     return noErrors
 
+def stop_containers(stop_timeouts):
+    '''
+    Stops the given containers concurrently and then removes them with a single docker rm call.
+
+    Parameters:
+        stop_timeouts (dict): Container name -> seconds to wait for the container to stop before it is killed.
+
+    Returns:
+        set: Names of the containers which were stopped and removed, or did not exist anymore.
+    '''
+    if not stop_timeouts:
+        return set()
+
+    def stop(container_name):
+        try:
+            docker.stop(container_name, time=stop_timeouts[container_name])
+            print(f"Stopped container {container_name}")
+        except NoSuchContainer:
+            print(f"Error stopping container: {container_name}")
+        except Exception as e:
+            print(f"Error stopping container {container_name}: {e}")
+            return False
+        return True
+
+    container_names = list(stop_timeouts)
+    with ThreadPoolExecutor(max_workers=min(STOP_MAX_WORKERS, len(container_names))) as executor:
+        stopped_names = [name for name, stopped in zip(container_names, executor.map(stop, container_names)) if stopped]
+
+    removed_names = set()
+    if stopped_names:
+        try:
+            docker.remove(stopped_names)
+            removed_names.update(stopped_names)
+            print(f"Removed containers {', '.join(stopped_names)}")
+        except Exception:
+            # Some of the containers did not exist anymore, remove the rest one by one
+            for container_name in stopped_names:
+                try:
+                    docker.remove(container_name)
+                    print(f"Removed container {container_name}")
+                except NoSuchContainer:
+                    print(f"Error removing container: {container_name}")
+                except Exception as e:
+                    print(f"Error removing container {container_name}: {e}")
+                    continue
+                removed_names.add(container_name)
+
+    for container_name in removed_names:
+        remove_secret_file(container_name)
+
+    return removed_names
+
 def restart_container(container_name):
     '''
     Restarts the container with the given name.
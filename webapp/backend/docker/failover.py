@@ -0,0 +1,154 @@
+import datetime
+from os import linesep
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
+from database import Computer, Reservation, ReservedContainer, ReservedHardwareSpec, ServerStatus
+from helpers.email import send_email
+
+# Only reservations starting within this time are moved, later ones can still be started by the server if it recovers
+FAILOVER_HORIZON = datetime.timedelta(minutes=30)
+# A start claim older than this was left by a server which went offline in the middle of starting the container
+STARTING_CLAIM_TIMEOUT = datetime.timedelta(minutes=30)
+
+def timeNow():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def get_free_capacity(session, computer, start_date, end_date):
+    '''
+    Calculates the hardware of the computer which is not reserved during the given time period.
+
+    Returns:
+        tuple: (free amount per spec type, list of free individual GPU specs)
+    '''
+    reserved_amounts = {}
+    overlapping = session.query(ReservedHardwareSpec.hardwareSpecId, ReservedHardwareSpec.amount)\
+        .join(Reservation, Reservation.reservationId == ReservedHardwareSpec.reservationId)\
+        .filter(
+            Reservation.computerId == computer.computerId,
+            Reservation.startDate < end_date,
+            Reservation.endDate > start_date,
+            Reservation.status.in_(["reserved", "started"])
+        ).all()
+    for hardware_spec_id, amount in overlapping:
+        reserved_amounts[hardware_spec_id] = reserved_amounts.get(hardware_spec_id, 0) + amount
+
+    free_amounts = {}
+    free_gpus = []
+    for spec in computer.hardwareSpecs:
+        free = spec.maximumAmount - reserved_amounts.get(spec.hardwareSpecId, 0)
+        if spec.type == "gpu":
+            if free >= 1:
+                free_gpus.append(spec)
+        else:
+            free_amounts[spec.type] = free_amounts.get(spec.type, 0) + free
+    return free_amounts, free_gpus
+
+def map_reserved_specs(session, reservation, computer):
+    '''
+    Finds hardware specs of the computer matching the reserved hardware of the reservation.
+
+    Returns:
+        dict: reservedHardwareSpecId -> hardwareSpecId in the given computer, or None if the computer does not have enough free hardware.
+    '''
+    free_amounts, free_gpus = get_free_capacity(session, computer, reservation.startDate, reservation.endDate)
+    specs_by_type = {}
+    for spec in computer.hardwareSpecs:
+        if spec.type != "gpu":
+            specs_by_type.setdefault(spec.type, spec)
+
+    mapping = {}
+    for reserved_spec in reservation.reservedHardwareSpecs:
+        spec_type = reserved_spec.hardwareSpec.type
+        if spec_type == "gpu":
+            if reserved_spec.amount <= 0:
+                continue
+            if not free_gpus:
+                return None
+            mapping[reserved_spec.reservedHardwareSpecId] = free_gpus.pop(0).hardwareSpecId
+        else:
+            target_spec = specs_by_type.get(spec_type)
+            if target_spec is None or free_amounts.get(spec_type, 0) < reserved_spec.amount:
+                return None
+            mapping[reserved_spec.reservedHardwareSpecId] = target_spec.hardwareSpecId
+    return mapping
+
+def fail_over_reservations(session, offline_computer_id):
+    '''
+    Moves reservations which have not started yet from an offline computer to online computers
+    with enough free hardware for the whole reservation. The user is notified by email.
+    Reservations which do not fit any other computer stay where they are. Commits once at the end.
+    Reservations which their server has claimed for starting (Reservation.startingAt, see claimReservationStart()
+    of docker/dockerUtils.py) are skipped, unless the claim is older than STARTING_CLAIM_TIMEOUT.
+
+    Parameters:
+        session: Database session.
+        offline_computer_id: ID of the computer whose heartbeat lease has expired.
+
+    Returns:
+        list: (reservationId, new computerId) for each moved reservation.
+    '''
+    now = timeNow()
+    reservations = session.query(Reservation)\
+        .options(
+            joinedload(Reservation.reservedHardwareSpecs).joinedload(ReservedHardwareSpec.hardwareSpec),
+            joinedload(Reservation.user),
+            joinedload(Reservation.reservedContainer).joinedload(ReservedContainer.reservedContainerPorts)
+        )\
+        .filter(
+            Reservation.computerId == offline_computer_id,
+            Reservation.status == "reserved",
+            Reservation.startDate < now + FAILOVER_HORIZON,
+            Reservation.endDate > now,
+            or_(Reservation.startingAt.is_(None), Reservation.startingAt < now - STARTING_CLAIM_TIMEOUT)
+        )\
+        .with_for_update(skip_locked=True)\
+        .all()
+    if not reservations:
+        return []
+
+    # Only computers with a valid lease are used as failover targets
+    candidates = session.query(Computer)\
+        .options(joinedload(Computer.hardwareSpecs))\
+        .join(ServerStatus, ServerStatus.computerId == Computer.computerId)\
+        .filter(
+            Computer.computerId != offline_computer_id,
+            Computer.removed.isnot(True),
+            Computer.public.is_(True),
+            ServerStatus.leaseExpiresAt > now
+        ).all()
+
+    moved = []
+    for reservation in reservations:
+        for computer in candidates:
+            mapping = map_reserved_specs(session, reservation, computer)
+            if mapping is None:
+                continue
+            for reserved_spec in reservation.reservedHardwareSpecs:
+                if reserved_spec.reservedHardwareSpecId in mapping:
+                    reserved_spec.hardwareSpecId = mapping[reserved_spec.reservedHardwareSpecId]
+                else:
+                    # Unused GPU rows (amount 0) of the old computer
+                    session.delete(reserved_spec)
+            reservation.computerId = computer.computerId
+            reservation.startingAt = None
+            # A container pre-staged in the offline computer is created again in the new one
+            for reserved_port in reservation.reservedContainer.reservedContainerPorts:
+                session.delete(reserved_port)
+            reservation.reservedContainer.stagedAt = None
+            reservation.reservedContainer.containerDockerName = None
+            reservation.reservedContainer.sshPassword = None
+            # Flush so that the next reservation sees the hardware reserved here
+            session.flush()
+            moved.append((reservation, computer))
+            break
+
+    session.commit()
+
+    for reservation, computer in moved:
+        body = f"The server your AI server reservation (ID {reservation.reservationId}) was made for is offline.{linesep}{linesep}"
+        body += f"The reservation was moved to the server {computer.name} with the same hardware and times. "
+        body += f"Connection details will be sent when the server has started.{linesep}{linesep}"
+        body += "Please do not reply to this email, this email is sent from a noreply email address."
+        send_email(reservation.user.email, "AI Server reservation moved to another server", body)
+
+    return [(reservation.reservationId, computer.computerId) for reservation, computer in moved]
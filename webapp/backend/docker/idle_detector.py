@@ -0,0 +1,125 @@
+import datetime
+from os import linesep
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+from database import Reservation, ReservationUsageSample
+from helpers.email import send_email
+from settings_handler import settings_handler
+
+def timeNow():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def find_idle_reservation_ids(session, computer_id, window_minutes, cpu_threshold, gpu_threshold):
+    '''
+    Finds started reservations whose usage stayed under the thresholds during the whole window.
+    Uses a single grouped query over the usage samples of the window.
+
+    Parameters:
+        session: Database session.
+        computer_id: ID of the computer this utility manages.
+        window_minutes: Length of the window in minutes.
+        cpu_threshold: CPU usage percent the container must stay under.
+        gpu_threshold: GPU utilization percent the reserved GPUs must stay under.
+
+    Returns:
+        set: IDs of the idle reservations.
+    '''
+    window_start = timeNow() - datetime.timedelta(minutes=window_minutes)
+
+    rows = session.query(
+        ReservationUsageSample.reservationId,
+        func.max(ReservationUsageSample.cpuPercent),
+        func.max(ReservationUsageSample.gpuUtilizationPercent),
+        func.min(ReservationUsageSample.sampledAt)
+    ).join(Reservation, Reservation.reservationId == ReservationUsageSample.reservationId)\
+        .filter(
+            Reservation.computerId == computer_id,
+            Reservation.status == "started",
+            ReservationUsageSample.sampledAt >= window_start
+        ).group_by(ReservationUsageSample.reservationId).all()
+
+    # Samples must cover the window, otherwise the reservation was started (or sampling enabled) too recently
+    coverage_tolerance = datetime.timedelta(minutes=max(1, window_minutes // 10))
+    idle_ids = set()
+    for reservation_id, max_cpu, max_gpu, first_sampled_at in rows:
+        if first_sampled_at.tzinfo is None:
+            first_sampled_at = first_sampled_at.replace(tzinfo=datetime.timezone.utc)
+        if first_sampled_at > window_start + coverage_tolerance:
+            continue
+        if max_cpu is None or max_cpu >= cpu_threshold:
+            continue
+        if max_gpu is not None and max_gpu >= gpu_threshold:
+            continue
+        idle_ids.add(reservation_id)
+    return idle_ids
+
+def get_idle_email(reservation, window_minutes, stop_at):
+    '''
+    Returns the body of the email sent to the user of an idle reservation.
+    '''
+    body = f"Your AI server reservation (ID {reservation.reservationId}) on {reservation.computer.name} has been idle for the last {window_minutes} minutes.{linesep}{linesep}"
+    if stop_at:
+        body += f"If the server stays idle, the reservation will be ended early at {stop_at.strftime('%Y-%m-%d %H:%M')} UTC so that the reserved hardware can be used by others. "
+        body += f"Any activity in the server cancels this.{linesep}{linesep}"
+    else:
+        body += f"If you no longer need the server, please end the reservation so that the reserved hardware can be used by others.{linesep}{linesep}"
+    body += "Please do not reply to this email, this email is sent from a noreply email address."
+    return body
+
+def apply_idle_policy(session, computer_id):
+    '''
+    Notifies the users of idle reservations in this computer and, if the idle.action setting is "stop",
+    ends the reservations that stayed idle for idle.stopGraceMinutes after the notification.
+    Ending is done by moving the endDate of the reservation to now, so the container is stopped through
+    the normal stop path. Reservations that become active again are reset. Commits once at the end.
+
+    Parameters:
+        session: Database session.
+        computer_id: ID of the computer this utility manages.
+
+    Returns:
+        tuple: (notified reservation IDs, ended reservation IDs)
+    '''
+    window_minutes = settings_handler.getSetting("idle.windowMinutes")
+    stop_enabled = settings_handler.getSetting("idle.action") == "stop"
+    grace = datetime.timedelta(minutes=settings_handler.getSetting("idle.stopGraceMinutes"))
+
+    idle_ids = find_idle_reservation_ids(
+        session, computer_id, window_minutes,
+        settings_handler.getSetting("idle.cpuThresholdPercent"),
+        settings_handler.getSetting("idle.gpuThresholdPercent")
+    )
+
+    reservations = session.query(Reservation)\
+        .options(joinedload(Reservation.user), joinedload(Reservation.computer))\
+        .filter(
+            Reservation.computerId == computer_id,
+            Reservation.status == "started",
+            (Reservation.reservationId.in_(list(idle_ids))) | (Reservation.idleNotifiedAt != None)
+        ).all()
+
+    now = timeNow()
+    notified_ids = []
+    ended_ids = []
+    for reservation in reservations:
+        if reservation.reservationId not in idle_ids:
+            # Activity resumed after the notification
+            reservation.idleNotifiedAt = None
+            continue
+
+        if reservation.idleNotifiedAt is None:
+            reservation.idleNotifiedAt = now
+            stop_at = now + grace if stop_enabled else None
+            send_email(reservation.user.email, "AI Server reservation is idle", get_idle_email(reservation, window_minutes, stop_at))
+            notified_ids.append(reservation.reservationId)
+            continue
+
+        notified_at = reservation.idleNotifiedAt
+        if notified_at.tzinfo is None:
+            notified_at = notified_at.replace(tzinfo=datetime.timezone.utc)
+        if stop_enabled and now >= notified_at + grace:
+            reservation.endDate = now
+            ended_ids.append(reservation.reservationId)
+
+    session.commit()
+    return notified_ids, ended_ids
@@ -0,0 +1,119 @@
+import json
+import time
+import datetime
+from contextlib import contextmanager
+from database import ReservationLifecycleEvent
+from settings_handler import settings_handler
+from helpers.metrics import REGISTRY
+
+# Steps of getting a reservation container ready, in order
+QUEUED = "queued"                      # From the start date until the docker utility picked the reservation up
+PRESTAGED = "prestaged"                # Creating the container ahead of the start date, see stageDockerContainer()
+MOUNTS_PREPARED = "mounts_prepared"    # Creating the mount folders, chown, chmod and setfacl
+PULLED = "pulled"                      # Pulling the image
+CREATED = "created"                    # docker create
+STARTED = "started"                    # docker start
+CREDENTIALS_SET = "credentials_set"    # Checking the password injection and docker exec chpasswd for legacy images
+USER_SCRIPT_DONE = "user_script_done"  # config.bash of the user
+NOTIFIED = "notified"                  # Sending the connection details email
+READY = "ready"                        # From the start date until the container was ready and the user notified
+
+STEP_DURATION = REGISTRY.histogram(
+    "containerfly_reservation_lifecycle_step_seconds", "Duration of each step of getting a reservation container ready",
+    ("step",)
+)
+START_LATENCY = REGISTRY.histogram(
+    "containerfly_reservation_start_latency_seconds", "Time from the start date of a reservation until its container was ready",
+    ("image",)
+)
+
+def timeNow():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+class LifecycleRecorder:
+    '''
+    Collects timing spans of one reservation container in memory. Recording a span only reads the clock,
+    the spans are written to the database and printed as a JSON line with flush().
+    '''
+
+    def __init__(self, reservation_id, computer_id, image_name):
+        self.reservation_id = reservation_id
+        self.computer_id = computer_id
+        self.image_name = image_name
+        self.events = []
+
+    @contextmanager
+    def span(self, event):
+        '''
+        Records how long the with block takes. Exceptions are recorded as a failed span and raised again.
+        '''
+        started_at = timeNow()
+        start = time.perf_counter()
+        succeeded = False
+        try:
+            yield
+            succeeded = True
+        finally:
+            self.add(event, started_at, time.perf_counter() - start, succeeded)
+
+    def add(self, event, started_at, duration_seconds, succeeded=True):
+        self.events.append((event, started_at, int(duration_seconds * 1000), succeeded))
+        if succeeded:
+            STEP_DURATION.observe(duration_seconds, step=event)
+            if event == READY:
+                START_LATENCY.observe(duration_seconds, image=self.image_name)
+
+    def add_since(self, event, started_at):
+        '''
+        Records a span from the given time (for example the start date of the reservation) until now.
+        '''
+        if started_at.tzinfo is None:
+            # Reservation dates are stored in UTC without a timezone
+            started_at = started_at.replace(tzinfo=datetime.timezone.utc)
+        self.add(event, started_at, max(0, (timeNow() - started_at).total_seconds()))
+
+    def flush(self, session):
+        '''
+        Adds the recorded spans to the session and prints them as one JSON line for the pm2 logs.
+        Spans older than docker.lifecycleEventRetentionDays are removed. The caller commits.
+        '''
+        if not self.events:
+            return
+        session.bulk_insert_mappings(ReservationLifecycleEvent, [{
+            "reservationId": self.reservation_id,
+            "computerId": self.computer_id,
+            "imageName": self.image_name,
+            "event": event,
+            "startedAt": started_at,
+            "durationMs": duration_ms,
+            "succeeded": succeeded
+        } for event, started_at, duration_ms, succeeded in self.events])
+        print(json.dumps({
+            "lifecycle": self.reservation_id,
+            "computerId": self.computer_id,
+            "image": self.image_name,
+            "events": [
+                { "event": event, "startedAt": started_at.isoformat(), "durationMs": duration_ms, "succeeded": succeeded }
+                for event, started_at, duration_ms, succeeded in self.events
+            ]
+        }, separators=(",", ":")))
+        self.events = []
+
+        retention_days = settings_handler.getSetting("docker.lifecycleEventRetentionDays")
+        session.query(ReservationLifecycleEvent).filter(
+            ReservationLifecycleEvent.computerId == self.computer_id,
+            ReservationLifecycleEvent.startedAt < timeNow() - datetime.timedelta(days=retention_days)
+        ).delete(synchronize_session=False)
+
+class NullLifecycleRecorder(LifecycleRecorder):
+    '''
+    Recorder which does not record anything, used when containers are started without a reservation.
+    '''
+
+    def __init__(self):
+        super().__init__(None, None, None)
+
+    def add(self, event, started_at, duration_seconds, succeeded=True):
+        pass
+
+NULL_RECORDER = NullLifecycleRecorder()
@@ -0,0 +1,153 @@
+import os
+from database import ServerLogs, ServerLogChunk
+from settings_handler import settings_handler
+
+# pm2 process names and the log type they are stored as in the database
+PM2_LOG_SOURCES = {
+    "backend": "backend",
+    "frontend": "frontend",
+    "backendDockerUtil": "docker_utility",
+}
+
+# When a log file is seen for the first time, only this many bytes from the end are shipped
+INITIAL_READ_BYTES = 64 * 1024
+# Upper limit of bytes read from a single log file per collection cycle
+MAX_READ_BYTES = 512 * 1024
+
+def get_pm2_log_folder():
+    '''
+    Returns the folder where pm2 writes the process log files.
+    '''
+    log_path = settings_handler.getSetting("docker.pm2LogPath")
+    if log_path:
+        return log_path
+    pm2_home = os.getenv("PM2_HOME") or os.path.join(os.path.expanduser("~"), ".pm2")
+    return os.path.join(pm2_home, "logs")
+
+def read_new_lines(file_path, inode, offset):
+    '''
+    Reads complete lines written to the file after the given position.
+
+    Parameters:
+        file_path: Path of the log file.
+        inode: Inode of the file at the previous read, or None if the file has not been read before.
+        offset: Byte offset where the previous read ended.
+
+    Returns:
+        tuple: (text, line_count, inode, offset). Text is "" if there was nothing new.
+        If the file does not exist, the given inode and offset are returned unchanged.
+    '''
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return "", 0, inode, offset
+
+    if inode is None or offset is None:
+        # First time seeing the file, only ship the end of it
+        offset = max(0, stat.st_size - INITIAL_READ_BYTES)
+    elif stat.st_ino != inode or stat.st_size < offset:
+        # File was rotated or truncated (pm2 flush), start from the beginning
+        offset = 0
+
+    if stat.st_size <= offset:
+        return "", 0, stat.st_ino, offset
+
+    with open(file_path, "rb") as f:
+        f.seek(offset)
+        data = f.read(MAX_READ_BYTES)
+
+    # Only consume complete lines, the rest is read on the next cycle
+    last_newline = data.rfind(b"\n")
+    if last_newline == -1:
+        if len(data) < MAX_READ_BYTES:
+            return "", 0, stat.st_ino, offset
+        # A single line longer than the read limit, ship it as is
+        last_newline = len(data) - 1
+    data = data[:last_newline + 1]
+
+    # Skip the partial line when starting from the middle of the file
+    if inode is None and offset > 0:
+        first_newline = data.find(b"\n")
+        offset += first_newline + 1
+        data = data[first_newline + 1:]
+        if not data:
+            return "", 0, stat.st_ino, offset
+
+    text = data.decode("utf-8", errors="replace")
+    return text, text.count("\n"), stat.st_ino, offset + len(data)
+
+def trim_log_chunks(session, log_record, max_lines):
+    '''
+    Removes the oldest chunks of the log until at most max_lines lines are stored (ring buffer).
+    The newest chunk is always kept, even if it alone is larger than the limit.
+    '''
+    if (log_record.logLines or 0) <= max_lines:
+        return
+
+    chunks = session.query(ServerLogChunk.serverLogChunkId, ServerLogChunk.chunkLines).filter(
+        ServerLogChunk.serverLogId == log_record.serverLogId
+    ).order_by(ServerLogChunk.serverLogChunkId).all()
+
+    total_lines = log_record.logLines
+    removable_ids = []
+    for chunk_id, chunk_lines in chunks[:-1]:
+        if total_lines <= max_lines:
+            break
+        removable_ids.append(chunk_id)
+        total_lines -= chunk_lines
+
+    if removable_ids:
+        session.query(ServerLogChunk).filter(
+            ServerLogChunk.serverLogChunkId.in_(removable_ids)
+        ).delete(synchronize_session=False)
+        log_record.logLines = total_lines
+
+def collect_logs(session, computer_id):
+    '''
+    Ships new pm2 log output of this server to the database.
+    Only lines written since the previous call are appended as a new ServerLogChunk per log type,
+    nothing is written for log types without new output. Commits once at the end.
+
+    Parameters:
+        session: Database session.
+        computer_id: ID of the computer the logs belong to.
+    '''
+    log_folder = get_pm2_log_folder()
+    max_lines = settings_handler.getSetting("docker.logRingBufferLines")
+
+    log_records = {}
+    for log_record in session.query(ServerLogs).filter(ServerLogs.computerId == computer_id):
+        log_records[log_record.logType] = log_record
+
+    for process_name, log_type in PM2_LOG_SOURCES.items():
+        try:
+            log_record = log_records.get(log_type)
+            if not log_record:
+                log_record = ServerLogs(computerId=computer_id, logType=log_type, logLines=0)
+                session.add(log_record)
+                session.flush()
+
+            out_text, out_lines, log_record.outLogInode, log_record.outLogOffset = read_new_lines(
+                os.path.join(log_folder, f"{process_name}-out.log"),
+                log_record.outLogInode, log_record.outLogOffset
+            )
+            error_text, error_lines, log_record.errorLogInode, log_record.errorLogOffset = read_new_lines(
+                os.path.join(log_folder, f"{process_name}-error.log"),
+                log_record.errorLogInode, log_record.errorLogOffset
+            )
+
+            new_lines = out_lines + error_lines
+            if new_lines == 0:
+                continue
+
+            session.add(ServerLogChunk(
+                serverLogId=log_record.serverLogId,
+                chunkContent=out_text + error_text,
+                chunkLines=new_lines
+            ))
+            log_record.logLines = (log_record.logLines or 0) + new_lines
+            trim_log_chunks(session, log_record, max_lines)
+        except Exception as e:
+            print(f"Error collecting {log_type} logs: {e}")
+
+    session.commit()
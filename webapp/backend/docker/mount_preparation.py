@@ -0,0 +1,170 @@
+import os
+import grp
+import pwd
+import time
+import struct
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Group which is given write access to the mount folders with an ACL
+ACL_GROUP = "containerfly"
+MOUNT_MODE = 0o775
+# Maximum amount of mount folders prepared at the same time
+MAX_WORKERS = 8
+# How long verified mount folders are trusted without checking them again, in seconds
+VERIFIED_CACHE_SECONDS = 600
+
+# POSIX ACL xattr format (see linux/posix_acl_xattr.h)
+ACL_XATTR_VERSION = 2
+ACL_TAG_USER_OBJ = 0x01
+ACL_TAG_USER = 0x02
+ACL_TAG_GROUP_OBJ = 0x04
+ACL_TAG_GROUP = 0x08
+ACL_TAG_MASK = 0x10
+ACL_TAG_OTHER = 0x20
+
+# (user ID, computer ID) -> { host path: time verified }
+_verified_paths = {}
+_verified_paths_lock = threading.Lock()
+
+def parse_acl_xattr(data):
+    '''
+    Parses a system.posix_acl_access extended attribute.
+
+    Returns:
+        set: (tag, permissions, id) tuples. The id is None for entries without a qualifier.
+    '''
+    version = struct.unpack_from("<I", data, 0)[0]
+    if version != ACL_XATTR_VERSION:
+        raise ValueError(f"Unknown ACL xattr version: {version}")
+    entries = set()
+    for offset in range(4, len(data), 8):
+        tag, permissions, qualifier = struct.unpack_from("<HHI", data, offset)
+        entries.add((tag, permissions, qualifier if tag in (ACL_TAG_USER, ACL_TAG_GROUP) else None))
+    return entries
+
+def get_expected_acl(acl_group_id):
+    '''
+    Returns the ACL entries a mount folder has after chmod 775, setfacl -b and setfacl -m g:containerfly:rwx.
+    '''
+    return {
+        (ACL_TAG_USER_OBJ, 0o7, None),
+        (ACL_TAG_GROUP_OBJ, 0o7, None),
+        (ACL_TAG_GROUP, 0o7, acl_group_id),
+        (ACL_TAG_MASK, 0o7, None),
+        (ACL_TAG_OTHER, 0o5, None),
+    }
+
+def is_mount_folder_ready(host_path, user_id, group_id, acl_group_id):
+    '''
+    Checks with stat and the ACL extended attributes that the mount folder exists and has the correct owner, mode and ACL.
+    '''
+    try:
+        stat = os.stat(host_path)
+    except OSError:
+        return False
+    if not os.path.isdir(host_path):
+        return False
+    if stat.st_uid != user_id or stat.st_gid != group_id or (stat.st_mode & 0o7777) != MOUNT_MODE:
+        return False
+    if acl_group_id is None:
+        return False
+
+    try:
+        acl = parse_acl_xattr(os.getxattr(host_path, "system.posix_acl_access"))
+    except (OSError, ValueError, struct.error):
+        return False
+    if acl != get_expected_acl(acl_group_id):
+        return False
+
+    # setfacl -b also removes the default ACL
+    try:
+        os.getxattr(host_path, "system.posix_acl_default")
+        return False
+    except OSError:
+        return True
+
+def prepare_mount_folder(host_path, mount_user, mount_group):
+    '''
+    Creates the mount folder and sets its owner, mode and ACL.
+    Errors creating the folder or setting the owner and mode are raised, ACL errors are only printed.
+
+    Returns:
+        bool: True if all steps succeeded.
+    '''
+    # Create directory for mounting if it does not exist
+    if not os.path.isdir(host_path):
+        os.makedirs(host_path, exist_ok=True)
+    # Set correct owner and group for the mount folder (keep docker group for mounting)
+    shutil.chown(host_path, user=mount_user, group=mount_group)
+    # Set correct file permissions for the mount folder
+    os.chmod(host_path, MOUNT_MODE)
+
+    succeeded = True
+    # Remove any existing ACLs to ensure default Unix behavior
+    try:
+        subprocess.run(['setfacl', '-b', host_path], check=True, capture_output=True)
+    except Exception as e:
+        print("Resetting ACL permissions for a mount folder failed:")
+        print(e)
+        succeeded = False
+
+    # Give containerfly group write access to the directory
+    try:
+        subprocess.run(['setfacl', '-m', f'g:{ACL_GROUP}:rwx', host_path], check=True)
+    except Exception as e:
+        print(f"Failed to set {ACL_GROUP} group permissions on {host_path}:")
+        print(e)
+        succeeded = False
+
+    return succeeded
+
+def prepare_mount_folders(host_paths, mount_user, mount_group, cache_key):
+    '''
+    Makes sure all given mount folders exist with the correct owner, mode and ACL.
+    Folders verified for the same cache key recently are skipped, the rest are checked first
+    and only incorrect folders are prepared, in parallel.
+
+    Parameters:
+        host_paths: Host paths of the mount folders.
+        mount_user: User which should own the folders.
+        mount_group: Group which should own the folders.
+        cache_key: Key of the verified folders cache, (user ID, computer ID).
+    '''
+    now = time.monotonic()
+    with _verified_paths_lock:
+        verified = _verified_paths.setdefault(cache_key, {})
+        unverified = [
+            path for path in dict.fromkeys(host_paths)
+            if now - verified.get(path, -VERIFIED_CACHE_SECONDS) >= VERIFIED_CACHE_SECONDS or not os.path.isdir(path)
+        ]
+    if not unverified:
+        return
+
+    user_id = pwd.getpwnam(mount_user).pw_uid
+    group_id = grp.getgrnam(mount_group).gr_gid
+    try:
+        acl_group_id = grp.getgrnam(ACL_GROUP).gr_gid
+    except KeyError:
+        acl_group_id = None
+
+    ready = [path for path in unverified if is_mount_folder_ready(path, user_id, group_id, acl_group_id)]
+    unready = [path for path in unverified if path not in ready]
+
+    if unready:
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(unready))) as executor:
+            results = list(executor.map(lambda path: prepare_mount_folder(path, mount_user, mount_group), unready))
+        ready += [path for path, succeeded in zip(unready, results) if succeeded]
+
+    with _verified_paths_lock:
+        for path in ready:
+            verified[path] = now
+
+def clear_verified_mount_folders():
+    '''
+    Clears the verified mount folders cache, so that all folders are checked on the next start.
+    '''
+    with _verified_paths_lock:
+        _verified_paths.clear()
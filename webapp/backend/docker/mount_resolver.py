@@ -0,0 +1,106 @@
+import threading
+from sqlalchemy import select
+from database import Role, RoleMount, UserRole, ResourceVersion
+from helpers.Utils import removeSpecialCharacters
+
+# Resources whose versions change when role mounts are saved or the roles of a user change (see helpers/resource_versions.py)
+MOUNT_RESOURCES = ("roles", "users")
+
+# (user ID, user email, computer ID) -> (resource versions, resolved mounts)
+_mount_plans = {}
+_mount_plans_lock = threading.Lock()
+
+def substitute_mount_variables(path, user_email, user_id):
+    """Substitute template variables in mount paths"""
+    if not path:
+        return path
+
+    # Sanitize email for filesystem use
+    email_sanitized = removeSpecialCharacters(user_email)
+
+    substitutions = {
+        '{email}': email_sanitized,
+        '{userid}': str(user_id)
+    }
+
+    result = path
+    for variable, value in substitutions.items():
+        result = result.replace(variable, value)
+
+    return result
+
+def get_mounts_version(session):
+    '''
+    Returns the versions of the resources of role mounts and user roles, or None if they are not tracked yet.
+    Other processes save the mounts, so the cache is checked against the versions in the database.
+    '''
+    versions = dict(session.query(ResourceVersion.resource, ResourceVersion.version).filter(ResourceVersion.resource.in_(MOUNT_RESOURCES)).all())
+    if len(versions) < len(MOUNT_RESOURCES):
+        return None
+    return tuple(versions[resource] for resource in MOUNT_RESOURCES)
+
+def load_mounts(session, user_id, user_email, computer_id):
+    '''
+    Loads the mounts of the "everyone" role and the roles of the user for the computer with a single query.
+    Template variables are substituted once and mounts with the same host and container path are only included once,
+    the "everyone" role taking precedence.
+    '''
+    user_role_ids = select(UserRole.roleId).where(UserRole.userId == user_id)
+    rows = session.query(RoleMount.hostPath, RoleMount.containerPath, RoleMount.readOnly, RoleMount.computerId)\
+        .join(Role, Role.roleId == RoleMount.roleId)\
+        .filter(
+            RoleMount.computerId == computer_id,
+            (Role.name == "everyone") | (RoleMount.roleId.in_(user_role_ids))
+        )\
+        .order_by(Role.name != "everyone", RoleMount.roleMountId)\
+        .all()
+
+    mounts = []
+    seen = set()
+    for host_path, container_path, read_only, mount_computer_id in rows:
+        host_path = substitute_mount_variables(host_path, user_email, user_id)
+        container_path = substitute_mount_variables(container_path, user_email, user_id)
+        if (host_path, container_path) in seen:
+            continue
+        seen.add((host_path, container_path))
+        mounts.append({
+            "hostPath": host_path,
+            "containerPath": container_path,
+            "readOnly": read_only,
+            "computerId": mount_computer_id
+        })
+    return mounts
+
+def resolve_mounts(session, user_id, user_email, computer_id):
+    '''
+    Returns the mounts of a container started by the user in the computer, with template variables substituted.
+    The result is cached per (user, computer) and reused until the versions of roles or users change.
+
+    Parameters:
+        session: Database session.
+        user_id: ID of the user.
+        user_email: Email of the user.
+        computer_id: ID of the computer.
+
+    Returns:
+        list: Mount dictionaries with hostPath, containerPath, readOnly, computerId
+    '''
+    key = (user_id, user_email, computer_id)
+    version = get_mounts_version(session)
+    with _mount_plans_lock:
+        cached = _mount_plans.get(key)
+    if version is not None and cached and cached[0] == version:
+        return [dict(mount) for mount in cached[1]]
+
+    mounts = load_mounts(session, user_id, user_email, computer_id)
+    if version is not None:
+        with _mount_plans_lock:
+            _mount_plans[key] = (version, mounts)
+    return [dict(mount) for mount in mounts]
+
+def invalidate_mount_plans():
+    '''
+    Removes all cached mount plans of this process.
+    '''
+    with _mount_plans_lock:
+        _mount_plans.clear()
@@ -0,0 +1,280 @@
+import datetime
+import importlib
+import threading
+from collections import Counter, namedtuple
+from types import SimpleNamespace
+import python_on_whales
+from python_on_whales.exceptions import DockerException, NoSuchContainer
+from docker.credentials import PASSWORD_LABEL
+
+# Simulated seconds each docker command takes by default. Commands running in parallel
+# (docker stop in stop_containers()) advance the clock one after another.
+DEFAULT_LATENCIES = {
+    "pull": 30.0,          # Image not pulled before
+    "pull_cached": 1.0,    # Image already in the local cache
+    "create": 1.0,
+    "start": 2.0,
+    "exec": 0.5,
+    "stop": 1.0,
+    "remove": 0.5,
+    "restart": 3.0,
+    "inspect": 0.05,
+    "ps": 0.1,
+    "list": 0.1,
+    "stats": 2.0,
+}
+
+# Modules with their own timeNow() helper
+CLOCK_MODULES = (
+    "dockerUtil", "docker.dockerUtils", "docker.failover", "docker.idle_detector",
+    "docker.usage_collector", "docker.lifecycle_events", "helpers.tables.ServerStatus",
+)
+# Modules reading time.monotonic(), time.perf_counter() or time.time() for caches and durations
+TIME_MODULES = ("dockerUtil", "docker.lifecycle_events", "docker.mount_preparation")
+# Modules which imported the docker client of python_on_whales
+DOCKER_MODULES = ("docker.dockerUtils", "docker.docker_functionality", "docker.credentials", "docker.usage_collector")
+
+class SimulatedClock:
+    '''
+    Clock of the simulation. Time only moves when sleep() or advance() is called.
+    Stands in for datetime.now(), time.sleep(), time.monotonic(), time.perf_counter() and time.time().
+    '''
+
+    def __init__(self, start):
+        self.start = start
+        self.elapsed = 0.0
+        self.lock = threading.Lock()
+
+    def now(self):
+        with self.lock:
+            return self.start + datetime.timedelta(seconds=self.elapsed)
+
+    def advance(self, seconds):
+        with self.lock:
+            self.elapsed += max(0.0, seconds)
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def monotonic(self):
+        with self.lock:
+            return self.elapsed
+
+    def perf_counter(self):
+        return self.monotonic()
+
+    def time(self):
+        return self.start.timestamp() + self.monotonic()
+
+class FakeContainer:
+    def __init__(self, name, image, labels, created_at):
+        self.name = name
+        self.image = image
+        self.config = SimpleNamespace(labels=dict(labels))
+        self.state = SimpleNamespace(status="created", running=False, started_at=None, finished_at=None, exit_code=0)
+        self.created_at = created_at
+
+    def set_status(self, status, now):
+        self.state.status = status
+        self.state.running = status == "running"
+        if status == "running":
+            self.state.started_at = now
+        elif status == "exited":
+            self.state.finished_at = now
+
+class FakeContainerCommands:
+    def __init__(self, runtime):
+        self.runtime = runtime
+
+    def create(self, image, name=None, **kwargs):
+        return self.runtime.create(image, name, kwargs)
+
+    def start(self, container_name):
+        self.runtime.start(container_name)
+
+    def inspect(self, container_name):
+        return self.runtime.inspect(container_name)
+
+    def list(self, all=False):
+        return self.runtime.list_containers(all, "list")
+
+class FakeImageCommands:
+    def __init__(self, runtime):
+        self.runtime = runtime
+
+    def pull(self, image_name, quiet=False):
+        return self.runtime.pull(image_name)
+
+class FakeDockerRuntime:
+    '''
+    In-memory stand-in for the python_on_whales docker client. Keeps the containers in a dict,
+    counts the docker CLI calls the real client would have made and advances the simulated clock
+    by the latency of each command.
+
+    Parameters:
+        clock: SimulatedClock.
+        latencies: Overrides of DEFAULT_LATENCIES.
+        image_labels: Full image name -> image labels. Other images get default_labels.
+        default_labels: Labels of images not in image_labels, by default the password is passed as a file.
+    '''
+
+    def __init__(self, clock, latencies=None, image_labels=None, default_labels=None):
+        self.clock = clock
+        self.latencies = dict(DEFAULT_LATENCIES, **(latencies or {}))
+        self.image_labels = image_labels or {}
+        self.default_labels = default_labels if default_labels is not None else { PASSWORD_LABEL: "file" }
+        self.containers = {}
+        self.pulled_images = set()
+        self.calls = Counter()
+        self.lock = threading.RLock()
+        self.container = FakeContainerCommands(self)
+        self.image = FakeImageCommands(self)
+
+    def call(self, command, latency_key=None):
+        with self.lock:
+            self.calls[command] += 1
+        self.clock.advance(self.latencies.get(latency_key or command, 0.0))
+
+    def call_count(self):
+        with self.lock:
+            return sum(self.calls.values())
+
+    def get_container(self, command, container_name):
+        container = self.containers.get(container_name)
+        if container is None:
+            raise NoSuchContainer(["docker", command, container_name], 1, stderr=f"No such container: {container_name}".encode())
+        return container
+
+    def pull(self, image_name):
+        with self.lock:
+            cached = image_name in self.pulled_images
+            self.pulled_images.add(image_name)
+        self.call("pull", "pull_cached" if cached else "pull")
+        return SimpleNamespace(config=SimpleNamespace(labels=dict(self.image_labels.get(image_name, self.default_labels))))
+
+    def create(self, image, name, options):
+        self.call("create")
+        with self.lock:
+            if name in self.containers:
+                raise DockerException(["docker", "create", "--name", name, image], 125, stderr=f"Conflict. The container name {name} is already in use.".encode())
+            # Labels of the container override the labels of its image
+            labels = dict(self.image_labels.get(image, self.default_labels), **(options.get("labels") or {}))
+            container = self.containers[name] = FakeContainer(name, image, labels, self.clock.now())
+            return container
+
+    def start(self, container_name):
+        self.call("start")
+        with self.lock:
+            self.get_container("start", container_name).set_status("running", self.clock.now())
+
+    def inspect(self, container_name):
+        self.call("inspect")
+        with self.lock:
+            return self.get_container("inspect", container_name)
+
+    def list_containers(self, all, command):
+        self.call(command)
+        with self.lock:
+            return [container for container in self.containers.values() if all or container.state.running]
+
+    def ps(self, all=False):
+        return self.list_containers(all, "ps")
+
+    def execute(self, container=None, command=None, user=None, **kwargs):
+        self.call("exec")
+        with self.lock:
+            if not self.get_container("exec", container).state.running:
+                raise DockerException(["docker", "exec", container], 1, stderr=f"Container {container} is not running".encode())
+        return ""
+
+    def stop(self, container_name, time=None):
+        self.call("stop")
+        with self.lock:
+            self.get_container("stop", container_name).set_status("exited", self.clock.now())
+
+    def remove(self, container_names, force=False, volumes=False):
+        self.call("remove")
+        names = [container_names] if isinstance(container_names, str) else list(container_names)
+        with self.lock:
+            missing = [name for name in names if name not in self.containers]
+            for name in names:
+                self.containers.pop(name, None)
+        if missing:
+            # Like docker rm, the existing containers are removed and the command fails for the rest
+            raise NoSuchContainer(["docker", "rm"] + names, 1, stderr=f"No such container: {missing[0]}".encode())
+
+    def restart(self, container_name):
+        self.call("restart")
+        with self.lock:
+            self.get_container("restart", container_name).set_status("running", self.clock.now())
+
+    def stats(self):
+        self.call("stats")
+        with self.lock:
+            return [SimpleNamespace(
+                container_name=container.name, cpu_percentage=0.0, memory_used=0, memory_limit=0, block_read=0, block_write=0
+            ) for container in self.containers.values() if container.state.running]
+
+    def crash(self, container_name):
+        '''
+        Makes a running container exit, as if it had crashed.
+        '''
+        with self.lock:
+            self.get_container("kill", container_name).set_status("exited", self.clock.now())
+
+class FakeHost:
+    '''
+    Stand-in for psutil in updateServerMonitoring(), so that cpu_percent(interval=1) does not block.
+    '''
+    VirtualMemory = namedtuple("VirtualMemory", ["total", "used", "percent"])
+    DiskUsage = namedtuple("DiskUsage", ["total", "used", "free"])
+
+    def __init__(self, clock):
+        self.clock = clock
+
+    def cpu_percent(self, interval=None):
+        if interval:
+            self.clock.advance(interval)
+        return 0.0
+
+    def cpu_count(self):
+        return 64
+
+    def virtual_memory(self):
+        return self.VirtualMemory(512 * 1024 ** 3, 0, 0.0)
+
+    def disk_usage(self, path):
+        return self.DiskUsage(4 * 1024 ** 4, 0, 4 * 1024 ** 4)
+
+    def getloadavg(self):
+        return (0.0, 0.0, 0.0)
+
+    def boot_time(self):
+        return self.clock.start.timestamp()
+
+def install(clock, runtime, host=None):
+    '''
+    Switches the docker utility to the simulated clock and the fake runtime.
+    settings.json of the simulation must be in the working directory, as the modules connect to the database when imported.
+
+    Parameters:
+        clock: SimulatedClock.
+        runtime: FakeDockerRuntime.
+        host: Stand-in for psutil, FakeHost by default.
+
+    Returns:
+        The dockerUtil module, drive it with runMainTick() and runCleanupTick().
+    '''
+    # Functions importing the client at call time get the fake as well
+    python_on_whales.docker = runtime
+    for module_name in DOCKER_MODULES:
+        importlib.import_module(module_name).docker = runtime
+    for module_name in CLOCK_MODULES:
+        importlib.import_module(module_name).timeNow = clock.now
+    for module_name in TIME_MODULES:
+        importlib.import_module(module_name).time = clock
+
+    docker_util = importlib.import_module("dockerUtil")
+    docker_util.sleep = clock.sleep
+    docker_util.psutil = host or FakeHost(clock)
+    return docker_util
@@ -0,0 +1,127 @@
+import datetime
+import subprocess
+from python_on_whales import docker
+from sqlalchemy.orm import joinedload
+from database import Reservation, ReservedHardwareSpec, ReservationUsageSample
+from settings_handler import settings_handler
+
+def timeNow():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def get_container_stats():
+    '''
+    Gets CPU, memory and block IO usage of all running containers with a single `docker stats --no-stream` call.
+
+    Returns:
+        dict: Container name -> { cpuPercent, memoryUsedBytes, memoryLimitBytes, blockReadBytes, blockWriteBytes }
+    '''
+    stats = {}
+    for container_stats in docker.stats():
+        stats[container_stats.container_name] = {
+            "cpuPercent": round(container_stats.cpu_percentage, 1) if container_stats.cpu_percentage is not None else None,
+            "memoryUsedBytes": container_stats.memory_used,
+            "memoryLimitBytes": container_stats.memory_limit,
+            "blockReadBytes": container_stats.block_read,
+            "blockWriteBytes": container_stats.block_write,
+        }
+    return stats
+
+def get_gpu_stats():
+    '''
+    Gets utilization and used memory of all NVIDIA GPUs with a single nvidia-smi call.
+
+    Returns:
+        dict: GPU index (string, same as HardwareSpec.internalId) -> { utilizationPercent, memoryUsedBytes }.
+        Empty if nvidia-smi is not available.
+    '''
+    try:
+        output = subprocess.check_output(
+            ["nvidia-smi", "--query-gpu=index,utilization.gpu,memory.used", "--format=csv,noheader,nounits"],
+            text=True, stderr=subprocess.DEVNULL, timeout=10
+        )
+    except (OSError, subprocess.SubprocessError):
+        return {}
+
+    gpus = {}
+    for line in output.splitlines():
+        parts = [part.strip() for part in line.split(",")]
+        if len(parts) != 3:
+            continue
+        try:
+            gpus[parts[0]] = {
+                "utilizationPercent": float(parts[1]),
+                "memoryUsedBytes": int(float(parts[2]) * 1024 * 1024),  # nvidia-smi reports MiB
+            }
+        except ValueError:
+            continue
+    return gpus
+
+def collect_usage_samples(session, computer_id):
+    '''
+    Stores one usage sample for every started reservation on this computer whose container is running.
+    Old samples are removed based on the docker.usageSampleRetentionDays setting. Commits once at the end.
+
+    Parameters:
+        session: Database session.
+        computer_id: ID of the computer this utility manages.
+
+    Returns:
+        int: Amount of samples stored.
+    '''
+    reservations = session.query(Reservation)\
+        .options(
+            joinedload(Reservation.reservedContainer),
+            joinedload(Reservation.reservedHardwareSpecs).joinedload(ReservedHardwareSpec.hardwareSpec)
+        )\
+        .filter(
+            Reservation.computerId == computer_id,
+            Reservation.status == "started"
+        ).all()
+
+    samples = []
+    if reservations:
+        container_stats = get_container_stats()
+        gpu_stats = None
+        sampled_at = timeNow()
+
+        for reservation in reservations:
+            stats = container_stats.get(reservation.reservedContainer.containerDockerName)
+            if stats is None:
+                continue
+
+            gpu_ids = [
+                spec.hardwareSpec.internalId for spec in reservation.reservedHardwareSpecs
+                if spec.hardwareSpec.type == "gpu" and spec.amount > 0
+            ]
+            gpu_utilization = None
+            gpu_memory = None
+            if gpu_ids:
+                # Only call nvidia-smi when some reservation has GPUs
+                if gpu_stats is None:
+                    gpu_stats = get_gpu_stats()
+                reserved_gpus = [gpu_stats[gpu_id] for gpu_id in gpu_ids if gpu_id in gpu_stats]
+                if reserved_gpus:
+                    gpu_utilization = round(sum(gpu["utilizationPercent"] for gpu in reserved_gpus) / len(reserved_gpus), 1)
+                    gpu_memory = sum(gpu["memoryUsedBytes"] for gpu in reserved_gpus)
+
+            samples.append({
+                "reservationId": reservation.reservationId,
+                "sampledAt": sampled_at,
+                "gpuUtilizationPercent": gpu_utilization,
+                "gpuMemoryUsedBytes": gpu_memory,
+                **stats
+            })
+
+    if samples:
+        session.bulk_insert_mappings(ReservationUsageSample, samples)
+
+    retention_days = settings_handler.getSetting("docker.usageSampleRetentionDays")
+    session.query(ReservationUsageSample).filter(
+        ReservationUsageSample.sampledAt < timeNow() - datetime.timedelta(days=retention_days),
+        ReservationUsageSample.reservationId.in_(
+            session.query(Reservation.reservationId).filter(Reservation.computerId == computer_id)
+        )
+    ).delete(synchronize_session=False)
+
+    session.commit()
+    return len(samples)
@@ -1,4 +1,4 @@
-from docker.dockerUtils import stopOrphanDockerContainer, getRunningReservedDockerContainers, getComputerId, getContainerInformation, getRunningReservations, getReservationsRequiringStart, getReservationsRequiringStop, stopDockerContainer, startDockerContainer, getReservationsRequiringRestart, restartDockerContainer
+from docker.dockerUtils import stopOrphanDockerContainer, getRunningReservedDockerContainers, getCreatedReservedDockerContainers, getReservedContainerNames, getComputerId, getContainerInformation, getRunningReservations, getReservationsRequiringStart, getReservationsRequiringStaging, getReservationsRequiringStop, stopDockerContainers, startDockerContainer, stageDockerContainer, getReservationsRequiringRestart, restartDockerContainer, releaseStartingClaims
 from time import sleep
 from settings_handler import settings_handler
 import datetime
@@ -6,9 +6,18 @@ from datetime import timezone, datetime, timedelta
 import sys
 from os import linesep
 import psutil
-import subprocess
+import threading
 import time
-from database import ServerStatus, ServerLogs, Computer, Session
+from database import ServerStatus, Computer, Session
+from docker.log_collector import collect_logs
+from docker.usage_collector import collect_usage_samples
+from docker.idle_detector import apply_idle_policy
+from docker.failover import fail_over_reservations
+from helpers.metrics import REGISTRY, startMetricsServer
+from helpers.tables.ServerStatus import renewHeartbeatLease, markExpiredServersOffline, getOfflineComputerIds
+
+TICK_DURATION = REGISTRY.histogram("containerfly_dockerutil_tick_duration_seconds", "Time of one pass of the docker utility loop, without the sleep", ("loop",))
+PENDING_RESERVATIONS = REGISTRY.gauge("containerfly_dockerutil_pending_reservations", "Reservations waiting for an action in this server on the latest pass", ("action",))
 
 # Runs the script forever
 run : bool = True
@@ -138,78 +147,112 @@ def updateServerMonitoring():
         print(f"Error updating server monitoring: {e}")
 
 def updateServerLogs(computer_id: int, session):
-    """Update server logs in database"""
+    """Append new pm2 log output of this server to the database"""
     try:
-        # Backend logs
-        try:
-            backend_logs = subprocess.check_output(
-                ["pm2", "logs", "backend", "--lines", "300", "--nostream"], 
-                text=True, stderr=subprocess.STDOUT, timeout=10
-            )
-            updateLogRecord(session, computer_id, "backend", backend_logs, 300)
-        except:
-            pass
-        
-        # Frontend logs  
-        try:
-            frontend_logs = subprocess.check_output(
-                ["pm2", "logs", "frontend", "--lines", "300", "--nostream"],
-                text=True, stderr=subprocess.STDOUT, timeout=10
-            )
-            updateLogRecord(session, computer_id, "frontend", frontend_logs, 300)
-        except:
-            pass
-        
-        # Docker utility logs
-        try:
-            docker_logs = subprocess.check_output(
-                ["pm2", "logs", "backendDockerUtil", "--lines", "300", "--nostream"],
-                text=True, stderr=subprocess.STDOUT, timeout=10
-            )
-            updateLogRecord(session, computer_id, "docker_utility", docker_logs, 300)
-        except:
-            pass
-            
+        collect_logs(session, computer_id)
     except Exception as e:
         print(f"Error updating server logs: {e}")
 
-def updateLogRecord(session, computer_id: int, log_type: str, content: str, lines: int):
-    """Helper function to upsert log records"""
+def updateContainerUsage():
+    """Store CPU, memory, IO and GPU usage samples of the reserved containers in this server"""
+    if settings_handler.getSetting("docker.enabled") != True or settings_handler.getSetting("docker.usageSamplingEnabled") != True:
+        return
     try:
-        log_record = session.query(ServerLogs).filter(
-            ServerLogs.computerId == computer_id,
-            ServerLogs.logType == log_type
-        ).first()
-        
-        if not log_record:
-            log_record = ServerLogs(
-                computerId=computer_id,
-                logType=log_type
-            )
-            session.add(log_record)
-        
-        log_record.logContent = content
-        log_record.logLines = lines
-        session.commit()
-        
+        with Session() as session:
+            collect_usage_samples(session, computerId)
+    except Exception as e:
+        print(f"Error updating container usage: {e}")
+
+def sendHeartbeat():
+    """Renew the heartbeat lease of this server, so that it stays online"""
+    try:
+        renewHeartbeatLease(computerId, settings_handler.getSetting("docker.heartbeatLeaseSeconds"))
+    except Exception as e:
+        print(f"Error sending heartbeat: {e}")
+
+def sendHeartbeats():
+    """Renew the heartbeat lease three times per lease period, until the utility exits"""
+    while run:
+        sendHeartbeat()
+        time.sleep(max(1, settings_handler.getSetting("docker.heartbeatLeaseSeconds") / 3))
+
+def startHeartbeatThread():
+    """
+    Renews the heartbeat lease in a thread of its own, so that a pass of the main loop which takes longer
+    than the lease (image pulls, stop grace periods) does not get a healthy server marked offline
+    """
+    thread = threading.Thread(target=sendHeartbeats, name="heartbeat", daemon=True)
+    thread.start()
+    return thread
+
+def watchServerLeases():
+    """Mark servers with an expired heartbeat lease offline and optionally move their upcoming reservations to online servers"""
+    try:
+        offlineComputerIds = markExpiredServersOffline()
+        for offlineComputerId in offlineComputerIds:
+            print(timeNow(), ": Heartbeat lease expired, marked server offline. computerId: ", offlineComputerId)
+
+        if settings_handler.getSetting("docker.failoverReservations") != True:
+            return
+        with Session() as session:
+            for offlineComputerId in getOfflineComputerIds(session):
+                for reservationId, newComputerId in fail_over_reservations(session, offlineComputerId):
+                    print(timeNow(), ": Moved reservation with reservationId: ", reservationId, " from offline server ", offlineComputerId, " to server ", newComputerId)
     except Exception as e:
-        print(f"Error updating {log_type} logs: {e}")
+        print(f"Error watching server leases: {e}")
+
+def reclaimIdleReservations():
+    """Notify users of idle reservations in this server and end them early if the idle policy says so"""
+    if settings_handler.getSetting("docker.enabled") != True:
+        return
+    try:
+        # Idle policy settings are edited in the admin panel, reload them from the database
+        settings_handler.clearDatabaseCache()
+        if settings_handler.getSetting("idle.detectionEnabled") != True:
+            return
+        with Session() as session:
+            notified_ids, ended_ids = apply_idle_policy(session, computerId)
+        for reservationId in notified_ids:
+            print(timeNow(), ": Notified user of idle reservation with reservationId: ", reservationId)
+        for reservationId in ended_ids:
+            print(timeNow(), ": Ending idle reservation with reservationId: ", reservationId)
+    except Exception as e:
+        print(f"Error reclaiming idle reservations: {e}")
+
+def runMainTick(i: int):
+  '''
+  Runs one pass of the main loop. The main loop runs every 10 seconds, i is the index of the pass within a minute (0-5).
+  '''
+  with TICK_DURATION.time(loop="main"):
+    stopFinishedServers()
+    startNewServers()
+    stageUpcomingServers()
+    restartCrashedServers()
+    restartServersRequiringRestart()
+    
+    # Update monitoring data every 3rd iteration (every 30 seconds)
+    if i % 3 == 0:
+      updateServerMonitoring()
+      updateContainerUsage()
+
+def runCleanupTick():
+  '''
+  Runs the larger cleanup, once a minute after the six passes of the main loop.
+  '''
+  with TICK_DURATION.time(loop="cleanup"):
+    stopOrphanContainerReservations()
+    removeOrphanStagedContainers()
+    reclaimIdleReservations()
+    watchServerLeases()
 
 def main():
+  # The simulator in docker/simulation.py replays the same schedule with a simulated clock
   while (run):
     for i in range(6):
-      stopFinishedServers()
-      startNewServers()
-      restartCrashedServers()
-      restartServersRequiringRestart()
-      
-      # Update monitoring data every 3rd iteration (every 30 seconds)
-      if i % 3 == 0:
-        updateServerMonitoring()
-      
+      runMainTick(i)
       sleep(10)
     # Run this larger cleanup below every 60 seconds (1 minute)
-    stopOrphanContainerReservations()
+    runCleanupTick()
     
 
 def stopOrphanContainerReservations():
@@ -229,7 +272,7 @@ def stopOrphanContainerReservations():
     # Get all Docker container reservations (container name starting with "reservation-"") really running on this computer
     docker_reservation_containers = getRunningReservedDockerContainers()
     for container in docker_reservation_containers:
-      time_running = datetime.now(timezone.utc) - container.state.started_at
+      time_running = timeNow() - container.state.started_at
       # If the container has been running for over 30 minutes, check that it is really marked as running in the database
       if time_running > timedelta(minutes=30):
         is_running = False
@@ -244,17 +287,34 @@ def stopOrphanContainerReservations():
     print("Error stopping (cleaning up) orphan containers:")
     print(e)
 
+def removeOrphanStagedContainers():
+  '''
+  Removes the pre-staged (created but never started) containers which no reservation of this computer uses anymore.
+  They are left behind when a reservation is failed over to another computer or cancelled after it was pre-staged.
+  Staging runs in the same thread, so a container being staged is always recorded before this runs.
+  '''
+  try:
+    containerNames = getReservedContainerNames(computerId)
+    for container in getCreatedReservedDockerContainers():
+      if container.name not in containerNames:
+        print("Removing pre-staged container not bound to a reservation of this server: " + container.name)
+        stopOrphanDockerContainer(container.name)
+  except Exception as e:
+    print("Error removing orphan pre-staged containers:")
+    print(e)
+
 def stopFinishedServers():
   '''
   Gathers a list of reservations (containers) which reservation is due, status is "started"
-  and stops them one by one.
+  and stops them all at once.
   '''
   global computerId
-  reservations = getReservationsRequiringStop(computerId)
-  for reservation in reservations:
-    if settings_handler.getSetting("docker.enabled") == True:
-      print(timeNow(), ": Stopping Docker server for reservation with reservationId: ",  reservation.reservationId)
-      stopDockerContainer(reservation.reservationId)
+  if settings_handler.getSetting("docker.enabled") != True: return
+  reservationIds = [reservation.reservationId for reservation in getReservationsRequiringStop(computerId)]
+  PENDING_RESERVATIONS.set(len(reservationIds), action="stop")
+  for reservationId in reservationIds:
+    print(timeNow(), ": Stopping Docker server for reservation with reservationId: ",  reservationId)
+  stopDockerContainers(reservationIds)
 
 def startNewServers():
   '''
@@ -262,11 +322,27 @@ def startNewServers():
   and starts them one by one.
   '''
   global computerId
-  reservations = getReservationsRequiringStart(computerId)
+  reservations = getReservationsRequiringStart(computerId).all()
+  PENDING_RESERVATIONS.set(len(reservations), action="start")
   for reservation in reservations:
     if settings_handler.getSetting("docker.enabled") == True:
       print(timeNow(), ": Starting Docker server for reservation with reservationId: ",  reservation.reservationId)
-      startDockerContainer(reservation.reservationId)
+      startDockerContainer(reservation.reservationId, computerId)
+
+def stageUpcomingServers():
+  '''
+  Gathers a list of reservations (containers) starting within docker.prestageMinutes in the current computer
+  and creates their containers ahead of time, so that at the start date they only need to be started.
+  '''
+  global computerId
+  if settings_handler.getSetting("docker.enabled") != True: return
+  minutes = settings_handler.getSetting("docker.prestageMinutes")
+  if not minutes or minutes <= 0: return
+  reservations = getReservationsRequiringStaging(computerId, minutes).all()
+  PENDING_RESERVATIONS.set(len(reservations), action="stage")
+  for reservation in reservations:
+    print(timeNow(), ": Pre-staging Docker server for reservation with reservationId: ",  reservation.reservationId)
+    stageDockerContainer(reservation.reservationId)
 
 def restartCrashedServers():
   '''
@@ -297,7 +373,8 @@ def restartServersRequiringRestart():
   and starts them one by one.
   '''
   global computerId
-  reservations = getReservationsRequiringRestart(computerId)
+  reservations = getReservationsRequiringRestart(computerId).all()
+  PENDING_RESERVATIONS.set(len(reservations), action="restart")
 
   for reservation in reservations:
     if settings_handler.getSetting("docker.enabled") == True:
@@ -330,4 +407,19 @@ if __name__ == "__main__":
     print("!!! Could not find computer with this name from the database. settings.json should contain docker.serverName and the name should be exactly the same as the computer in the database. !!! Exiting." + linesep)
     sys.exit()
   
+  metricsPort = settings_handler.getSetting("docker.metricsPort")
+  metricsToken = settings_handler.getSetting("app.metricsToken")
+  if metricsPort and not metricsToken:
+    print("Not serving metrics, app.metricsToken is not set." + linesep)
+  elif metricsPort:
+    metricsHost = settings_handler.getSetting("docker.metricsHost")
+    try:
+      startMetricsServer(metricsPort, metricsToken, host=metricsHost)
+      print(f"Serving metrics at {metricsHost}:{metricsPort}." + linesep)
+    except OSError as e:
+      print(f"Could not serve metrics at {metricsHost}:{metricsPort}: {e}" + linesep)
+
+  # Reservations a previous run stopped in the middle of starting are started again
+  releaseStartingClaims(computerId)
+  startHeartbeatThread()
   main()
\ No newline at end of file
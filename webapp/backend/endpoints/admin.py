@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, Request
+from helpers.json_response import FastJSONRoute, conditionalResponse
 from helpers.server import ForceAuthentication, Response
 from fastapi.security import OAuth2PasswordBearer
 from endpoints.responses import admin as functionality
-from endpoints.models.admin import ContainerEdit, ComputerEdit, UserEdit, RoleMountsEdit, RoleHardwareLimitsEdit, RoleReservationLimitsEdit
+from endpoints.models.admin import ContainerEdit, ComputerEdit, UserEdit, UserImport, RoleMountsEdit, RoleHardwareLimitsEdit, RoleReservationLimitsEdit
 from endpoints.models.reservation import ReservationFilters
 from database import Session, Computer, ContainerPort, User, Reservation, Container, ReservedContainer, ReservedHardwareSpec, HardwareSpec, UserRole, ServerStatus, ServerLogs
 from sqlalchemy import desc, Column, Integer, Text, Float, ForeignKey, DateTime, UniqueConstraint, Boolean, BigInteger, func
@@ -16,6 +17,7 @@ router = APIRouter(
     prefix="/api/admin",
     tags=["Admin"],
     responses={404: {"description": "Not found"}},
+    route_class=FastJSONRoute,
 )
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="user/login")  # Make sure the tokenUrl is correct
@@ -26,24 +28,24 @@ async def getReservations(filters : ReservationFilters, token: str = Depends(oau
   return functionality.getReservations(filters)
 
 @router.get("/users")
-async def getUsers(token: str = Depends(oauth2_scheme)):
+async def getUsers(request: Request, page: int = None, pageSize: int = 50, email: str = None, role: str = None, userId: int = None, sortBy: str = "userId", sortDesc: bool = True, token: str = Depends(oauth2_scheme)):
   ForceAuthentication(token, "admin")
-  return functionality.getUsers()
+  return conditionalResponse(request, ("users", "roles"), lambda: functionality.getUsers(page, pageSize, email, role, userId, sortBy, sortDesc))
 
 @router.get("/hardware")
-async def getHardware(token: str = Depends(oauth2_scheme)):
+async def getHardware(request: Request, token: str = Depends(oauth2_scheme)):
   ForceAuthentication(token, "admin")
-  return functionality.getHardware()
+  return conditionalResponse(request, ("computers",), functionality.getHardware)
 
 @router.get("/containers")
-async def getContainers(token: str = Depends(oauth2_scheme)):
+async def getContainers(request: Request, token: str = Depends(oauth2_scheme)):
   ForceAuthentication(token, "admin")
-  return functionality.getContainers()
+  return conditionalResponse(request, ("containers",), functionality.getContainers)
 
 @router.get("/computers")
-async def getComputers(token: str = Depends(oauth2_scheme)):
+async def getComputers(request: Request, token: str = Depends(oauth2_scheme)):
   ForceAuthentication(token, "admin")
-  return functionality.getComputers()
+  return conditionalResponse(request, ("computers",), functionality.getComputers)
 
 @router.get("/computer")
 async def getComputer(computerId : int, token: str = Depends(oauth2_scheme)):
@@ -85,11 +87,18 @@ async def getUser(userId: int, token: str = Depends(oauth2_scheme)):
     ForceAuthentication(token, "admin")
     return functionality.getUser(userId)
 
+# Not async, the password is hashed in a worker process
 @router.post("/save_user")
-async def saveUser(userEdit: UserEdit, token: str = Depends(oauth2_scheme)):
+def saveUser(userEdit: UserEdit, token: str = Depends(oauth2_scheme)):
     ForceAuthentication(token, "admin")
     return functionality.saveUser(userEdit.userId, userEdit.data)
 
+# Not async, so that FastAPI runs the import in its thread pool instead of blocking the event loop
+@router.post("/import_users")
+def importUsers(userImport: UserImport, token: str = Depends(oauth2_scheme)):
+    ForceAuthentication(token, "admin")
+    return functionality.importUsers(userImport.users, userImport.csv, userImport.replaceRoles)
+
 @router.get("/roles")
 async def getRoles(token: str = Depends(oauth2_scheme)):
     ForceAuthentication(token, "admin")
@@ -139,15 +148,30 @@ async def saveRoleReservationLimits(roleReservationLimitsEdit: RoleReservationLi
     return functionality.saveRoleReservationLimits(roleReservationLimitsEdit.roleId, roleReservationLimitsEdit.reservationLimits)
 
 @router.get("/server/{computer_id}/monitoring")
-async def getServerMonitoring(computer_id: int, token: str = Depends(oauth2_scheme)):
+async def getServerMonitoring(computer_id: int, logType: str = None, beforeChunkId: int = None, chunkLimit: int = 50, token: str = Depends(oauth2_scheme)):
+    ForceAuthentication(token, "admin")
+    return functionality.getServerMonitoring(computer_id, logType, beforeChunkId, chunkLimit)
+
+@router.get("/reservation_usage")
+async def getReservationUsage(reservationId: int, hours: int = 24, token: str = Depends(oauth2_scheme)):
     ForceAuthentication(token, "admin")
-    return functionality.getServerMonitoring(computer_id)
+    return functionality.getReservationUsage(reservationId, hours)
+
+@router.get("/start_latency")
+async def getStartLatency(days: int = 30, token: str = Depends(oauth2_scheme)):
+    ForceAuthentication(token, "admin")
+    return functionality.getStartLatency(days)
 
 @router.get("/servers")
 async def getServersForMonitoring(token: str = Depends(oauth2_scheme)):
     ForceAuthentication(token, "admin")
     return functionality.getServersForMonitoring()
 
+@router.get("/servers/overview")
+async def getServersOverview(token: str = Depends(oauth2_scheme)):
+    ForceAuthentication(token, "admin")
+    return functionality.getServersOverview()
+
 # General admin settings endpoints
 class GeneralSettingsData(BaseModel):
     section: str
@@ -1,10 +1,12 @@
 from fastapi import APIRouter
+from helpers.json_response import FastJSONRoute
 from endpoints.responses import app as functionality
 
 router = APIRouter(
     prefix="/api/app",
     tags=["App"],
     responses={404: {"description": "Not found"}},
+    route_class=FastJSONRoute,
 )
 
 @router.get("/config")
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 class ContainerEdit(BaseModel):
     '''
@@ -41,4 +41,12 @@ class RoleReservationLimitsEdit(BaseModel):
     For editing role reservation limits.
     '''
     roleId: int
-    reservationLimits: Dict[str, Any]
\ No newline at end of file
+    reservationLimits: Dict[str, Any]
+
+class UserImport(BaseModel):
+    '''
+    For importing users in bulk. Either users or csv is given.
+    '''
+    users: Optional[List[Dict[str, Any]]] = None  # [{ "email": str, "password": str (optional), "roles": [str] (optional) }]
+    csv: Optional[str] = None  # Header row with email and optionally password and roles, roles separated with ;
+    replaceRoles: bool = False  # Remove the roles of existing users which are not in the import
@@ -1,4 +1,6 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
+from helpers.json_response import FastJSONRoute, conditionalResponse
+from helpers.tables.ServerStatus import getOfflineComputerIds
 from helpers.server import Response, ForceAuthentication
 from helpers.auth import CheckToken, IsAdmin, get_authenticated_user_id
 from fastapi.security import OAuth2PasswordBearer
@@ -11,6 +13,7 @@ router = APIRouter(
     prefix="/api/reservation",
     tags=["Reservation"],
     responses={404: {"description": "Not found"}},
+    route_class=FastJSONRoute,
 )
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/user/login")
@@ -21,14 +24,17 @@ async def getAvailableHardware(date : str, duration: int, token: str = Depends(o
   return functionality.getAvailableHardware(date, duration, None, IsAdmin(userId), None, userId)
 
 @router.get("/get_availability_timeline")
-async def getAvailabilityTimeline(startDate: str, endDate: str, token: str = Depends(oauth2_scheme)):
+async def getAvailabilityTimeline(request: Request, startDate: str, endDate: str, token: str = Depends(oauth2_scheme)):
   userId = get_authenticated_user_id(token)
-  return functionality.getAvailabilityTimeline(startDate, endDate, IsAdmin(userId))
+  # Servers going offline are not versioned, they are part of the ETag instead
+  return conditionalResponse(request, ("computers", "reservations"),
+    lambda: functionality.getAvailabilityTimeline(startDate, endDate, IsAdmin(userId)),
+    lambda session: sorted(getOfflineComputerIds(session)))
 
 @router.get("/get_all_reservations_for_calendar")
-async def getAllReservationsForCalendar(startDate: str, endDate: str, token: str = Depends(oauth2_scheme)):
+async def getAllReservationsForCalendar(request: Request, startDate: str, endDate: str, token: str = Depends(oauth2_scheme)):
   ForceAuthentication(token)
-  return functionality.getAllReservationsForCalendar(startDate, endDate)
+  return conditionalResponse(request, ("computers", "reservations"), lambda: functionality.getAllReservationsForCalendar(startDate, endDate))
 
 @router.post("/get_own_reservations")
 async def getOwnReservations(filters : ReservationFilters, token: str = Depends(oauth2_scheme)):
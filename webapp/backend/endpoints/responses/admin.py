@@ -1,19 +1,23 @@
-from database import Session, Computer, ContainerPort, User, Reservation, Container, ReservedContainer, ReservedHardwareSpec, HardwareSpec, UserRole, Role, ServerStatus, ServerLogs
+from database import Session, Computer, ContainerPort, User, Reservation, Container, ReservedContainer, ReservedContainerPort, ReservedHardwareSpec, HardwareSpec, UserRole, Role, ServerStatus, ServerLogs, ServerLogChunk, ReservationUsageSample, ReservationLifecycleEvent
 from dateutil import parser
 from dateutil.relativedelta import *
 from datetime import timezone, timedelta
-from helpers.server import Response, ORMObjectToDict
+from helpers.server import Response, ORMObjectToDict, getSerializer
 import datetime
+import math
 from endpoints.models.admin import ContainerEdit, ComputerEdit
 from endpoints.models.reservation import ReservationFilters
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, selectinload
 from logger import log
-from helpers.auth import HashPassword, IsCorrectPassword
-import base64
+from helpers.password_hashing import hashPassword, hashPasswords
+import csv
+import io
 from endpoints.models.admin import UserEdit
 from database import UserRole, Role
-from helpers.tables.Role import getRoles, getRoleById, addRole as addRoleHelper, editRole as editRoleHelper, removeRole as removeRoleHelper
-from sqlalchemy import func
+from helpers.tables.Role import getRoles, getRolesWithMountCounts, getRoleById, addRole as addRoleHelper, editRole as editRoleHelper, removeRole as removeRoleHelper
+from sqlalchemy import func, desc, and_, insert, update, delete
+from sqlalchemy.exc import IntegrityError
+from docker.lifecycle_events import READY
 
 def getReservations(filters : ReservationFilters) -> object:
   '''
@@ -55,19 +59,23 @@ def getReservations(filters : ReservationFilters) -> object:
       query = query.filter( Reservation.status == filters.filters["status"] )
     session.close()
 
+  serializeReservation = getSerializer(Reservation)
+  serializeReservedContainer = getSerializer(ReservedContainer)
+  serializeContainer = getSerializer(Container)
+  serializeReservedPort = getSerializer(ReservedContainerPort)
   for reservation in query:
-    res = ORMObjectToDict(reservation)
+    res = serializeReservation(reservation)
     res["userEmail"] = reservation.user.email
     res["computerName"] = reservation.computer.name
-    res["reservedContainer"] = ORMObjectToDict(reservation.reservedContainer)
-    res["reservedContainer"]["container"] = ORMObjectToDict(reservation.reservedContainer.container)
+    res["reservedContainer"] = serializeReservedContainer(reservation.reservedContainer)
+    res["reservedContainer"]["container"] = serializeContainer(reservation.reservedContainer.container)
     
     # Add all reserved ports
     res["reservedContainer"]["reservedPorts"] = []
     # Only add ports if the reservation is started as the ports are unbound after the reservation is stopped
     if reservation.status == "started":
       for reservedPort in reservation.reservedContainer.reservedContainerPorts:
-        portObj = ORMObjectToDict(reservedPort)
+        portObj = serializeReservedPort(reservedPort)
         portObj["localPort"] = reservedPort.containerPort.port
         portObj["serviceName"] = reservedPort.containerPort.serviceName
         res["reservedContainer"]["reservedPorts"].append(portObj)
@@ -93,6 +101,13 @@ def getReservations(filters : ReservationFilters) -> object:
     
   return Response(True, "Reservations fetched.", { "reservations": reservations, "statusCounts": status_counts })
 
+def parseStopTimeout(value) -> int:
+  '''
+  Parses the stop grace period of a container. Empty values mean the docker.stopTimeoutSeconds setting is used.
+  '''
+  if value is None or value == "": return None
+  return max(0, int(value))
+
 def saveContainer(containerEdit : ContainerEdit) -> object:
   '''
   Edits the given container.
@@ -105,6 +120,10 @@ def saveContainer(containerEdit : ContainerEdit) -> object:
     object: Response object with status, message and data.
 
   '''
+  try:
+    stopTimeoutSeconds = parseStopTimeout(containerEdit.data.get("stopTimeoutSeconds"))
+  except (ValueError, TypeError):
+    return Response(False, "Invalid stop timeout.")
 
   with Session() as session:
     # If new, create a new container
@@ -114,6 +133,7 @@ def saveContainer(containerEdit : ContainerEdit) -> object:
       container.name = containerEdit.data.get("name")
       container.imageName = containerEdit.data.get("imageName")
       container.description = containerEdit.data.get("description", "")
+      container.stopTimeoutSeconds = stopTimeoutSeconds
       # Add ports
       for port in containerEdit.data.get("ports", []):
         container.containerPorts.append(ContainerPort(port=port["port"], serviceName=port["serviceName"]))
@@ -129,6 +149,7 @@ def saveContainer(containerEdit : ContainerEdit) -> object:
         container.name = containerEdit.data.get("name")
         container.imageName = containerEdit.data.get("imageName")
         container.description = containerEdit.data.get("description", "")
+        container.stopTimeoutSeconds = stopTimeoutSeconds
         container.updatedAt = datetime.datetime.now(datetime.timezone.utc)
         # Remove all removable ports
         for port in containerEdit.data.get("removedPorts", []):
@@ -173,18 +194,56 @@ def removeContainer(containerId : int) -> object:
   
   return Response(True, "Container removed successfully")
 
-def getUsers() -> object:
+USER_SORT_COLUMNS = {
+    "userId": User.userId,
+    "email": User.email,
+    "createdAt": User.userCreatedAt,
+}
+MAX_USERS_PAGE_SIZE = 1000
+
+def getUsers(page: int = None, pageSize: int = 50, email: str = None, role: str = None, userId: int = None, sortBy: str = "userId", sortDesc: bool = True) -> object:
     '''
-    Returns a list of all users and available roles.
+    Returns a page of users and the available roles with their user and mount counts.
+    Runs the same amount of queries regardless of the amount of users.
+
+    Parameters:
+        page: Page to return, starting from 1. All matching users are returned if not given.
+        pageSize: Users per page.
+        email: Only users whose email contains this, case insensitive.
+        role: Only users with this role.
+        userId: Only the user with this id.
+        sortBy: userId, email or createdAt.
+        sortDesc: Sort in descending order.
 
     Returns:
         object: Response object with status, message and data.
     '''
+    if sortBy not in USER_SORT_COLUMNS:
+        return Response(False, "Invalid sort column.")
+    if page is not None and (page < 1 or pageSize < 1 or pageSize > MAX_USERS_PAGE_SIZE):
+        return Response(False, f"Invalid page, the page size must be between 1 and {MAX_USERS_PAGE_SIZE}.")
+
     data = []
-    role_user_counts = {}
 
     with Session() as session:
         query = session.query(User)
+        if email:
+            # Escape the wildcards of LIKE, the search is a plain substring
+            pattern = email.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            query = query.filter(User.email.ilike(f"%{pattern}%", escape="\\"))
+        if role:
+            query = query.filter(User.roles.any(Role.name == role))
+        if userId is not None:
+            query = query.filter(User.userId == userId)
+
+        totalCount = query.count()
+
+        sortColumn = USER_SORT_COLUMNS[sortBy]
+        query = query.options(selectinload(User.roles))\
+            .order_by(sortColumn.desc() if sortDesc else sortColumn.asc(), User.userId.desc())
+        if page is not None:
+            query = query.offset((page - 1) * pageSize).limit(pageSize)
+
         for user in query:
             addable = {}
             addable["userId"] = user.userId
@@ -193,22 +252,24 @@ def getUsers() -> object:
             addable["createdAt"] = user.userCreatedAt  # Added createdAt field
             addable["hasPassword"] = user.password is not None and user.password != ""
             data.append(addable)
-            
-            # Count users per role
-            for role in user.roles:
-                if role.name not in role_user_counts:
-                    role_user_counts[role.name] = 0
-                role_user_counts[role.name] += 1
+
+        # Count users per role
+        roleUserCounts = dict(session.query(UserRole.roleId, func.count(UserRole.userId)).group_by(UserRole.roleId).all())
+        allUsersCount = session.query(func.count(User.userId)).scalar()
 
     # Get available roles
-    from helpers.tables.Role import getRolesWithMountCounts
     availableRoles = getRolesWithMountCounts()
     
     # Add user counts to each role
-    for role in availableRoles:
-        role["userCount"] = role_user_counts.get(role["name"], 0)
+    for availableRole in availableRoles:
+        availableRole["userCount"] = roleUserCounts.get(availableRole["roleId"], 0)
 
-    return Response(True, "Users fetched successfully", {"users": data, "availableRoles": availableRoles})
+    return Response(True, "Users fetched successfully", {
+        "users": data,
+        "totalCount": totalCount,
+        "allUsersCount": allUsersCount,
+        "availableRoles": availableRoles
+    })
 
 def getUser(userId: int) -> object:
     '''
@@ -255,11 +316,11 @@ def saveUser(userId: int, data: dict) -> object:
 
         if userId == -1:
             # Create new user
-            hash = HashPassword(data["password"])
+            hash = hashPassword(data["password"])
             user = User(
                 email=data["email"],
-                password=base64.b64encode(hash["hashedPassword"]).decode('utf-8'),
-                passwordSalt=base64.b64encode(hash["salt"]).decode('utf-8')
+                password=hash["password"],
+                passwordSalt=hash["passwordSalt"]
             )
             session.add(user)
             session.flush()  # This will populate the userId
@@ -279,9 +340,9 @@ def saveUser(userId: int, data: dict) -> object:
                 user.passwordSalt = ""
             elif "password" in data and data["password"]:
                 # Update password only if provided and not clearing
-                hash = HashPassword(data["password"])
-                user.password = base64.b64encode(hash["hashedPassword"]).decode('utf-8')
-                user.passwordSalt = base64.b64encode(hash["salt"]).decode('utf-8')
+                hash = hashPassword(data["password"])
+                user.password = hash["password"]
+                user.passwordSalt = hash["passwordSalt"]
         
         # Handle roles
         # First remove all existing roles
@@ -300,6 +361,197 @@ def saveUser(userId: int, data: dict) -> object:
         session.commit()
         return Response(True, "User saved successfully")
 
+MAX_IMPORTED_USERS = 20000
+# Emails per IN (...) query of the import
+IMPORT_QUERY_CHUNK = 1000
+
+def parseUserImportCsv(text: str) -> list:
+    '''
+    Parses the CSV of a user import to the rows of importUsers(). The header row names the columns:
+    email and optionally password and roles. Roles are separated with a semicolon.
+    '''
+    reader = csv.DictReader(io.StringIO(text.strip()))
+    if reader.fieldnames is None or "email" not in [name.strip().lower() for name in reader.fieldnames]:
+        raise ValueError("The CSV must have a header row with an email column.")
+    rows = []
+    for row in reader:
+        # Values of extra columns without a header are in a list under None, they are ignored
+        row = { key.strip().lower(): (value or "").strip() for key, value in row.items() if key is not None }
+        rows.append({
+            "email": row.get("email", ""),
+            "password": row.get("password", ""),
+            "roles": [role.strip() for role in row.get("roles", "").split(";") if role.strip() != ""]
+        })
+    return rows
+
+def chunked(values: list, size: int):
+    for index in range(0, len(values), size):
+        yield values[index:index + size]
+
+def insertImportedUsers(session, newUsers: list) -> set:
+    '''
+    Inserts the new users of an import with one statement. If a user with one of the emails was created
+    at the same time, the users are inserted one at a time instead, each in its own savepoint.
+
+    Returns:
+        set: Lowercase emails of the users which could not be inserted.
+    '''
+    try:
+        with session.begin_nested():
+            session.execute(insert(User), newUsers)
+        return set()
+    except IntegrityError:
+        pass
+    failedEmails = set()
+    for user in newUsers:
+        try:
+            with session.begin_nested():
+                session.execute(insert(User), [user])
+        except IntegrityError:
+            failedEmails.add(user["email"].lower())
+    return failedEmails
+
+def importUsers(rows: list = None, csvText: str = None, replaceRoles: bool = False) -> object:
+    '''
+    Creates or updates users in bulk. Users are matched by email: new users are created, existing users
+    get the given password and roles. Passwords are hashed in parallel and the users and their roles are
+    written with bulk statements in one transaction.
+
+    Parameters:
+        rows: [{ "email": str, "password": str (optional), "roles": [str] or str separated with ; (optional) }]
+        csvText: CSV with the same columns, used if rows is not given.
+        replaceRoles: Remove the roles of existing users which are not in their row. Otherwise roles are only added.
+
+    Returns:
+        object: Response object with status, message and data. data.results has the result of each row:
+        { "row": int, "email": str, "status": "created" / "updated" / "error", "message": str }
+    '''
+    if rows is None:
+        if not csvText:
+            return Response(False, "Give the users as JSON or CSV.")
+        try:
+            rows = parseUserImportCsv(csvText)
+        except (ValueError, csv.Error) as e:
+            return Response(False, f"Invalid CSV: {e}")
+    if len(rows) == 0:
+        return Response(False, "No users to import.")
+    if len(rows) > MAX_IMPORTED_USERS:
+        return Response(False, f"At most {MAX_IMPORTED_USERS} users can be imported at a time.")
+
+    results = []
+    valid = []  # (result, email, password, role names)
+    seenEmails = set()
+    for index, row in enumerate(rows):
+        email = str(row.get("email") or "").strip()
+        password = str(row.get("password") or "")
+        roleNames = row.get("roles") or []
+        if isinstance(roleNames, str):
+            roleNames = roleNames.split(";")
+        roleNames = set(str(roleName).strip() for roleName in roleNames if str(roleName).strip() != "")
+
+        result = { "row": index + 1, "email": email, "status": "error", "message": "" }
+        results.append(result)
+        if email == "" or "@" not in email:
+            result["message"] = "Invalid email."
+        elif email.lower() in seenEmails:
+            result["message"] = "The email is already on an earlier row."
+        else:
+            seenEmails.add(email.lower())
+            valid.append((result, email, password, roleNames))
+
+    with Session() as session:
+        # Roles by name in one query
+        allRoleNames = set(roleName for _, _, _, roleNames in valid for roleName in roleNames)
+        roleIds = {}
+        if allRoleNames:
+            roleIds = dict(session.query(Role.name, Role.roleId).filter(Role.name.in_(allRoleNames)).all())
+
+        rowsToWrite = []
+        for result, email, password, roleNames in valid:
+            unknownRoles = sorted(roleNames - set(roleIds))
+            if unknownRoles:
+                result["message"] = "Unknown roles: " + ", ".join(unknownRoles)
+            else:
+                rowsToWrite.append((result, email, password, roleNames))
+
+        # Existing users by email
+        existingUserIds = {}
+        emails = [email for _, email, _, _ in rowsToWrite]
+        for emailChunk in chunked(emails, IMPORT_QUERY_CHUNK):
+            for userId, email in session.query(User.userId, User.email).filter(User.email.in_(emailChunk)):
+                existingUserIds[email.lower()] = userId
+
+        # Hash the given passwords in parallel
+        passwords = [password for _, _, password, _ in rowsToWrite if password != ""]
+        hashes = iter(hashPasswords(passwords))
+
+        newUsers = []
+        passwordUpdates = []
+        for result, email, password, roleNames in rowsToWrite:
+            passwordColumns = {}
+            if password != "":
+                hash = next(hashes)
+                passwordColumns = {
+                    "password": hash["password"],
+                    "passwordSalt": hash["passwordSalt"]
+                }
+            userId = existingUserIds.get(email.lower())
+            if userId is None:
+                newUsers.append(dict({ "email": email }, **passwordColumns))
+                result["status"] = "created"
+            else:
+                if passwordColumns:
+                    passwordUpdates.append(dict({ "userId": userId }, **passwordColumns))
+                result["status"] = "updated"
+
+        if newUsers:
+            failedEmails = insertImportedUsers(session, newUsers)
+            if failedEmails:
+                for result, email, _, _ in rowsToWrite:
+                    if email.lower() in failedEmails:
+                        result["status"] = "error"
+                        result["message"] = "A user with this email was created at the same time."
+                rowsToWrite = [row for row in rowsToWrite if row[1].lower() not in failedEmails]
+                emails = [email for _, email, _, _ in rowsToWrite]
+            newEmails = [user["email"] for user in newUsers if user["email"].lower() not in failedEmails]
+            for emailChunk in chunked(newEmails, IMPORT_QUERY_CHUNK):
+                for userId, email in session.query(User.userId, User.email).filter(User.email.in_(emailChunk)):
+                    existingUserIds[email.lower()] = userId
+        if passwordUpdates:
+            session.execute(update(User), passwordUpdates)
+
+        # Role links: add the missing ones and with replaceRoles remove the ones not in the import
+        wantedLinks = set()
+        for _, email, _, roleNames in rowsToWrite:
+            userId = existingUserIds[email.lower()]
+            wantedLinks.update((userId, roleIds[roleName]) for roleName in roleNames)
+        userIds = list(set(existingUserIds[email.lower()] for email in emails))
+        existingLinks = {}
+        for userIdChunk in chunked(userIds, IMPORT_QUERY_CHUNK):
+            for userRoleId, userId, roleId in session.query(UserRole.userRoleId, UserRole.userId, UserRole.roleId).filter(UserRole.userId.in_(userIdChunk)):
+                existingLinks[(userId, roleId)] = userRoleId
+
+        newLinks = [{ "userId": userId, "roleId": roleId } for userId, roleId in wantedLinks if (userId, roleId) not in existingLinks]
+        if newLinks:
+            session.execute(insert(UserRole), newLinks)
+        if replaceRoles:
+            removedLinkIds = [userRoleId for link, userRoleId in existingLinks.items() if link not in wantedLinks]
+            for linkChunk in chunked(removedLinkIds, IMPORT_QUERY_CHUNK):
+                session.execute(delete(UserRole).where(UserRole.userRoleId.in_(linkChunk)))
+
+        session.commit()
+
+    created = sum(1 for result in results if result["status"] == "created")
+    updated = sum(1 for result in results if result["status"] == "updated")
+    failed = len(results) - created - updated
+    log.info(f"Imported users: {created} created, {updated} updated, {failed} failed")
+    return Response(True, f"{created} users created, {updated} updated and {failed} failed.", {
+        "created": created,
+        "updated": updated,
+        "failed": failed,
+        "results": results
+    })
+
 def getHardware() -> object:
   '''
   Returns a list of all hardware.
@@ -312,9 +564,9 @@ def getHardware() -> object:
 
   with Session() as session:
     query = session.query(HardwareSpec)
+    serializeHardwareSpec = getSerializer(HardwareSpec)
     for hardware in query:
-      addable = {}
-      addable = ORMObjectToDict(hardware)
+      addable = serializeHardwareSpec(hardware)
       data.append(addable)
   
   return Response(True, "Data fetched.", { "hardware": data })
@@ -332,9 +584,9 @@ def getContainers() -> object:
   with Session() as session:
     # Find all where Container.removed is not True
     query = session.query(Container).filter(Container.removed.isnot(True))
+    serializeContainer = getSerializer(Container)
     for container in query:
-      addable = {}
-      addable = ORMObjectToDict(container)
+      addable = serializeContainer(container)
       addable["ports"] = []
       for port in container.containerPorts:
         addable["ports"].append({
@@ -386,12 +638,13 @@ def getComputers() -> object:
 
   with Session() as session:
     query = session.query(Computer).filter(Computer.removed.isnot(True))
+    serializeComputer = getSerializer(Computer)
+    serializeHardwareSpec = getSerializer(HardwareSpec)
     for computer in query:
-      addable = {}
-      addable = ORMObjectToDict(computer)
+      addable = serializeComputer(computer)
       addable["hardwareSpecs"] = []
       for spec in computer.hardwareSpecs:
-        addable["hardwareSpecs"].append(ORMObjectToDict(spec))
+        addable["hardwareSpecs"].append(serializeHardwareSpec(spec))
       data.append(addable)
   
   return Response(True, "Data fetched.", { "computers": data })
@@ -604,7 +857,6 @@ def getAllRoles() -> object:
     Returns:
         object: Response object with status, message and data.
     '''
-    from helpers.tables.Role import getRolesWithMountCounts
     data = getRolesWithMountCounts()
     
     return Response(True, "Roles fetched successfully.", {"roles": data})
@@ -754,12 +1006,15 @@ def saveRoleReservationLimits(roleId: int, reservationLimits: dict) -> object:
     except Exception as e:
         return Response(False, f"Error saving role reservation limits: {str(e)}")
 
-def getServerMonitoring(computer_id: int) -> object:
+def getServerMonitoring(computer_id: int, logType: str = None, beforeChunkId: int = None, chunkLimit: int = 50) -> object:
     '''
     Returns monitoring data (metrics and logs) for a specific server.
     
     Args:
         computer_id (int): The ID of the computer/server.
+        logType (str): If given, only logs of this type are returned.
+        beforeChunkId (int): Paging cursor, only log chunks older than this chunk are returned.
+        chunkLimit (int): Maximum amount of log chunks returned per log type.
         
     Returns:
         object: Response object with server monitoring data.
@@ -770,15 +1025,23 @@ def getServerMonitoring(computer_id: int) -> object:
         if not computer:
             return Response(False, "Server not found")
         
-        # Get server status/metrics
-        status = session.query(ServerStatus).filter(
+        # Get server status/metrics, with the current time of the database. lastUpdatedAt is set by the
+        # database (now()) in its session time zone, so its age is measured with the database clock
+        statusRow = session.query(ServerStatus, func.now()).filter(
             ServerStatus.computerId == computer_id
         ).first()
+        status, databaseNow = statusRow if statusRow else (None, None)
         
         # Get server logs
         logs = session.query(ServerLogs).filter(
             ServerLogs.computerId == computer_id
-        ).all()
+        )
+        if logType:
+            logs = logs.filter(ServerLogs.logType == logType)
+        logs = logs.all()
+        
+        lastUpdated = status.lastUpdatedAt.replace(tzinfo=None) if status and status.lastUpdatedAt else None
+        staleBefore = databaseNow.replace(tzinfo=None) - SERVER_OFFLINE_AFTER if databaseNow else None
         
         # Build response
         monitoring_data = {
@@ -787,7 +1050,7 @@ def getServerMonitoring(computer_id: int) -> object:
                 "name": computer.name,
                 "ip": computer.ip
             },
-            "isOnline": status.isOnline if status else False,
+            "isOnline": isServerOnline(status, lastUpdated, staleBefore),
             "metrics": None,
             "logs": {}
         }
@@ -844,16 +1107,154 @@ def getServerMonitoring(computer_id: int) -> object:
                 "updated": status.versionUpdatedAt.isoformat() if status.versionUpdatedAt else None
             }
         
-        # Add logs
+        # Add logs, newest chunks first from the database and then put back to chronological order
+        chunkLimit = max(1, min(chunkLimit, 500))
         for log in logs:
+            chunkQuery = session.query(ServerLogChunk).filter(ServerLogChunk.serverLogId == log.serverLogId)
+            if beforeChunkId:
+                chunkQuery = chunkQuery.filter(ServerLogChunk.serverLogChunkId < beforeChunkId)
+            chunks = chunkQuery.order_by(desc(ServerLogChunk.serverLogChunkId)).limit(chunkLimit + 1).all()
+            hasMore = len(chunks) > chunkLimit
+            chunks = list(reversed(chunks[:chunkLimit]))
+
+            content = "".join(chunk.chunkContent for chunk in chunks)
+            # Logs stored before incremental log shipping
+            if not chunks and not beforeChunkId and log.logContent:
+                content = log.logContent
+
             monitoring_data["logs"][log.logType] = {
-                "content": log.logContent or "",
-                "lines": log.logLines or 0,
+                "content": content,
+                "lines": sum(chunk.chunkLines for chunk in chunks) if chunks else content.count("\n"),
+                "oldestChunkId": chunks[0].serverLogChunkId if chunks else None,
+                "hasMore": hasMore,
                 "lastUpdated": log.lastUpdatedAt.isoformat() if log.lastUpdatedAt else None
             }
         
         return Response(True, "Server monitoring data retrieved", monitoring_data)
 
+def getReservationUsage(reservationId: int, hours: int = 24) -> object:
+    '''
+    Returns the recorded CPU, memory, IO and GPU usage samples of a reservation.
+    
+    Args:
+        reservationId (int): The ID of the reservation.
+        hours (int): How many hours of samples to return, counting back from now.
+        
+    Returns:
+        object: Response object with the samples and averages over them.
+    '''
+    minSampledAt = datetime.datetime.now(datetime.timezone.utc) - timedelta(hours=max(1, hours))
+
+    with Session() as session:
+        reservation = session.query(Reservation).filter(Reservation.reservationId == reservationId).first()
+        if not reservation:
+            return Response(False, "Reservation not found")
+
+        sampleFilter = (
+            ReservationUsageSample.reservationId == reservationId,
+            ReservationUsageSample.sampledAt > minSampledAt
+        )
+        samples = session.query(ReservationUsageSample)\
+            .filter(*sampleFilter)\
+            .order_by(ReservationUsageSample.sampledAt)\
+            .all()
+        summary = session.query(
+            func.avg(ReservationUsageSample.cpuPercent),
+            func.max(ReservationUsageSample.memoryUsedBytes),
+            func.avg(ReservationUsageSample.gpuUtilizationPercent),
+            func.count(ReservationUsageSample.reservationUsageSampleId)
+        ).filter(*sampleFilter).one()
+
+        data = {
+            "reservationId": reservationId,
+            "samples": [{
+                "sampledAt": sample.sampledAt.isoformat(),
+                "cpuPercent": sample.cpuPercent,
+                "memoryUsedBytes": sample.memoryUsedBytes,
+                "memoryLimitBytes": sample.memoryLimitBytes,
+                "blockReadBytes": sample.blockReadBytes,
+                "blockWriteBytes": sample.blockWriteBytes,
+                "gpuUtilizationPercent": sample.gpuUtilizationPercent,
+                "gpuMemoryUsedBytes": sample.gpuMemoryUsedBytes
+            } for sample in samples],
+            "summary": {
+                "averageCpuPercent": round(summary[0], 1) if summary[0] is not None else None,
+                "peakMemoryUsedBytes": summary[1],
+                "averageGpuUtilizationPercent": round(summary[2], 1) if summary[2] is not None else None,
+                "sampleCount": summary[3]
+            }
+        }
+
+    return Response(True, "Reservation usage retrieved", data)
+
+def percentile(sortedValues: list, percent: float):
+    '''
+    Returns the nearest-rank percentile of already sorted values, or None if there are no values.
+    '''
+    if not sortedValues:
+        return None
+    rank = max(1, math.ceil(percent / 100 * len(sortedValues)))
+    return sortedValues[rank - 1]
+
+def summarizeDurations(durationsByKey: dict) -> list:
+    '''
+    Calculates the count, p50 and p95 of the durations (milliseconds) of each key, the slowest p95 first.
+    '''
+    summaries = []
+    for key, durations in durationsByKey.items():
+        durations.sort()
+        summaries.append({
+            "name": key,
+            "count": len(durations),
+            "p50Ms": percentile(durations, 50),
+            "p95Ms": percentile(durations, 95)
+        })
+    summaries.sort(key=lambda summary: summary["p95Ms"], reverse=True)
+    return summaries
+
+def getStartLatency(days: int = 30) -> object:
+    '''
+    Returns the p50 and p95 time-to-ready of reservation containers per image and per server,
+    and the p50 and p95 of each lifecycle step, so that it is visible where the start time goes.
+    Time-to-ready is measured from the start date of the reservation until the user was notified.
+
+    Args:
+        days (int): How many days of lifecycle events to use, counting back from now.
+
+    Returns:
+        object: Response object with byImage, byServer and bySteps lists.
+    '''
+    minStartedAt = datetime.datetime.now(datetime.timezone.utc) - timedelta(days=max(1, days))
+
+    with Session() as session:
+        events = session.query(
+            ReservationLifecycleEvent.event,
+            ReservationLifecycleEvent.imageName,
+            Computer.name,
+            ReservationLifecycleEvent.durationMs
+        )\
+            .join(Computer, Computer.computerId == ReservationLifecycleEvent.computerId)\
+            .filter(
+                ReservationLifecycleEvent.startedAt > minStartedAt,
+                ReservationLifecycleEvent.succeeded.is_(True)
+            ).all()
+
+    byImage = {}
+    byServer = {}
+    bySteps = {}
+    for event, imageName, computerName, durationMs in events:
+        bySteps.setdefault(event, []).append(durationMs)
+        if event == READY:
+            byImage.setdefault(imageName, []).append(durationMs)
+            byServer.setdefault(computerName, []).append(durationMs)
+
+    return Response(True, "Start latency retrieved", {
+        "days": days,
+        "byImage": summarizeDurations(byImage),
+        "byServer": summarizeDurations(byServer),
+        "bySteps": summarizeDurations(bySteps)
+    })
+
 def getServersForMonitoring() -> object:
     '''
     Returns a list of all servers/computers available for monitoring.
@@ -877,6 +1278,118 @@ def getServersForMonitoring() -> object:
         
         return Response(True, "Servers retrieved successfully", {"servers": servers_list})
 
+# A server whose monitoring data is older than this is shown as offline
+SERVER_OFFLINE_AFTER = timedelta(minutes=7)
+
+def isServerOnline(status, lastUpdated, staleBefore) -> bool:
+    '''
+    Returns whether the server is online. The heartbeat lease is used when the server sends one,
+    otherwise the server is online if its monitoring data is recent.
+    '''
+    if not status or not status.isOnline:
+        return False
+    if status.leaseExpiresAt:
+        leaseExpiresAt = status.leaseExpiresAt
+        if leaseExpiresAt.tzinfo is None:
+            leaseExpiresAt = leaseExpiresAt.replace(tzinfo=timezone.utc)
+        return leaseExpiresAt > datetime.datetime.now(timezone.utc)
+    return bool(lastUpdated and lastUpdated >= staleBefore)
+
+def getServersOverview() -> object:
+    '''
+    Returns the latest metrics, online status, running container count and reserved vs. total
+    hardware capacity of all servers, without logs. Everything is fetched with a single joined query.
+    
+    Returns:
+        object: Response object with servers list.
+    '''
+    with Session() as session:
+        runningCounts = session.query(
+            Reservation.computerId.label("computerId"),
+            func.count(Reservation.reservationId).label("runningContainers")
+        ).filter(Reservation.status == "started")\
+            .group_by(Reservation.computerId).subquery()
+
+        capacities = session.query(
+            HardwareSpec.computerId.label("computerId"),
+            HardwareSpec.type.label("type"),
+            func.sum(HardwareSpec.maximumAmount).label("total"),
+            func.min(HardwareSpec.format).label("format")
+        ).group_by(HardwareSpec.computerId, HardwareSpec.type).subquery()
+
+        reservedAmounts = session.query(
+            HardwareSpec.computerId.label("computerId"),
+            HardwareSpec.type.label("type"),
+            func.sum(ReservedHardwareSpec.amount).label("reserved")
+        ).join(ReservedHardwareSpec, ReservedHardwareSpec.hardwareSpecId == HardwareSpec.hardwareSpecId)\
+            .join(Reservation, Reservation.reservationId == ReservedHardwareSpec.reservationId)\
+            .filter(Reservation.status == "started")\
+            .group_by(HardwareSpec.computerId, HardwareSpec.type).subquery()
+
+        # One row per computer and hardware type
+        rows = session.query(
+            Computer,
+            ServerStatus,
+            runningCounts.c.runningContainers,
+            capacities.c.type,
+            capacities.c.total,
+            capacities.c.format,
+            reservedAmounts.c.reserved,
+            func.now()
+        ).outerjoin(ServerStatus, ServerStatus.computerId == Computer.computerId)\
+            .outerjoin(runningCounts, runningCounts.c.computerId == Computer.computerId)\
+            .outerjoin(capacities, capacities.c.computerId == Computer.computerId)\
+            .outerjoin(reservedAmounts, and_(
+                reservedAmounts.c.computerId == capacities.c.computerId,
+                reservedAmounts.c.type == capacities.c.type
+            ))\
+            .filter((Computer.removed == False) | (Computer.removed.is_(None)))\
+            .order_by(Computer.name)\
+            .all()
+
+        servers = {}
+        for computer, status, runningContainers, specType, total, specFormat, reserved, databaseNow in rows:
+            server = servers.get(computer.computerId)
+            if server is None:
+                # lastUpdatedAt is set by the database (now()) in its session time zone, so its age is measured with the database clock
+                staleBefore = databaseNow.replace(tzinfo=None) - SERVER_OFFLINE_AFTER
+                lastUpdated = status.lastUpdatedAt.replace(tzinfo=None) if status and status.lastUpdatedAt else None
+                server = {
+                    "id": computer.computerId,
+                    "name": computer.name,
+                    "address": computer.ip,
+                    "public": computer.public,
+                    "isOnline": isServerOnline(status, lastUpdated, staleBefore),
+                    "lastUpdated": lastUpdated.isoformat() if lastUpdated else None,
+                    "runningContainers": runningContainers or 0,
+                    "metrics": None,
+                    "version": None,
+                    "capacity": {}
+                }
+                if status:
+                    server["metrics"] = {
+                        "cpu": { "usage": status.cpuUsagePercent, "cores": status.cpuCores },
+                        "memory": { "total": status.memoryTotalBytes, "used": status.memoryUsedBytes, "percentage": status.memoryUsagePercent },
+                        "disk": { "total": status.diskTotalBytes, "used": status.diskUsedBytes, "free": status.diskFreeBytes, "percentage": status.diskUsagePercent },
+                        "docker": { "running": status.dockerContainersRunning, "total": status.dockerContainersTotal },
+                        "load": { "avg1": status.loadAvg1Min, "avg5": status.loadAvg5Min, "avg15": status.loadAvg15Min },
+                        "uptimeSeconds": status.systemUptimeSeconds
+                    }
+                    server["version"] = {
+                        "software": status.softwareVersion,
+                        "updated": status.versionUpdatedAt.isoformat() if status.versionUpdatedAt else None
+                    }
+                servers[computer.computerId] = server
+
+            if specType is not None:
+                server["capacity"][specType] = {
+                    "total": total,
+                    "reserved": reserved or 0,
+                    "format": specFormat
+                }
+
+        return Response(True, "Servers overview retrieved successfully", {"servers": list(servers.values())})
+
 def getGeneralSettings() -> object:
     '''
     Returns all general admin settings with default values if not set.
@@ -908,6 +1421,12 @@ def getGeneralSettings() -> object:
             'email.sendEmail',
             'notifications.containerAlertsEnabled',
             'notifications.alertEmails',
+            'idle.detectionEnabled',
+            'idle.windowMinutes',
+            'idle.cpuThresholdPercent',
+            'idle.gpuThresholdPercent',
+            'idle.action',
+            'idle.stopGraceMinutes',
             'auth.loginType',
             'auth.sessionTimeoutMinutes',
             'auth.ldap.url',
@@ -916,7 +1435,9 @@ def getGeneralSettings() -> object:
             'auth.ldap.domain',
             'auth.ldap.searchMethod',
             'auth.ldap.accountField',
-            'auth.ldap.emailField'
+            'auth.ldap.emailField',
+            'auth.ldap.bindDn',
+            'auth.ldap.bindPassword'
         ]
         
         # Get all settings
@@ -967,6 +1488,14 @@ def getGeneralSettings() -> object:
                 "containerAlertsEnabled": settings_dict.get('notifications.containerAlertsEnabled', False),
                 "alertEmails": alert_emails
             },
+            "idle": {
+                "detectionEnabled": settings_dict.get('idle.detectionEnabled', False),
+                "windowMinutes": settings_dict.get('idle.windowMinutes', 120),
+                "cpuThresholdPercent": settings_dict.get('idle.cpuThresholdPercent', 5),
+                "gpuThresholdPercent": settings_dict.get('idle.gpuThresholdPercent', 5),
+                "action": settings_dict.get('idle.action', 'notify'),
+                "stopGraceMinutes": settings_dict.get('idle.stopGraceMinutes', 60)
+            },
             "auth": {
                 "loginType": settings_dict.get('auth.loginType', 'password'),
                 "sessionTimeoutMinutes": settings_dict.get('auth.sessionTimeoutMinutes', 1440),
@@ -977,7 +1506,9 @@ def getGeneralSettings() -> object:
                     "domain": settings_dict.get('auth.ldap.domain', ''),
                     "searchMethod": settings_dict.get('auth.ldap.searchMethod', ''),
                     "accountField": settings_dict.get('auth.ldap.accountField', ''),
-                    "emailField": settings_dict.get('auth.ldap.emailField', '')
+                    "emailField": settings_dict.get('auth.ldap.emailField', ''),
+                    "bindDn": settings_dict.get('auth.ldap.bindDn', ''),
+                    "bindPassword": settings_dict.get('auth.ldap.bindPassword', '')
                 }
             }
         }
@@ -992,7 +1523,7 @@ def saveGeneralSettings(section: str, settings: dict) -> object:
     Saves general admin settings for a specific section.
     
     Args:
-        section: The section to save (general, access, email, notifications, auth)
+        section: The section to save (general, access, email, notifications, idle, auth)
         settings: Dictionary of settings to save
         
     Returns:
@@ -1062,6 +1593,12 @@ def saveGeneralSettings(section: str, settings: dict) -> object:
             if 'alertEmails' in settings:
                 setSetting('notifications.alertEmails', settings['alertEmails'])
         
+        elif section == "idle":
+            # Save idle reservation policy settings
+            for key in ['detectionEnabled', 'windowMinutes', 'cpuThresholdPercent', 'gpuThresholdPercent', 'action', 'stopGraceMinutes']:
+                if key in settings:
+                    setSetting(f'idle.{key}', settings[key])
+        
         elif section == "auth":
             # Save authentication settings
             if 'loginType' in settings:
@@ -1087,6 +1624,10 @@ def saveGeneralSettings(section: str, settings: dict) -> object:
                     setSetting('auth.ldap.accountField', ldap_settings['accountField'])
                 if 'emailField' in ldap_settings:
                     setSetting('auth.ldap.emailField', ldap_settings['emailField'])
+                if 'bindDn' in ldap_settings:
+                    setSetting('auth.ldap.bindDn', ldap_settings['bindDn'])
+                if 'bindPassword' in ldap_settings:
+                    setSetting('auth.ldap.bindPassword', ldap_settings['bindPassword'])
                 
         else:
             return Response(False, f"Unknown section: {section}")
@@ -1,6 +1,6 @@
-from database import Session, Computer, User, Reservation, Container, ReservedContainer, ReservedHardwareSpec, HardwareSpec
+from database import Session, Computer, User, Reservation, Container, ReservedContainer, ReservedContainerPort, ReservedHardwareSpec, HardwareSpec
 from docker.docker_functionality import get_email_container_started, restart_container
-from helpers.server import Response, ORMObjectToDict
+from helpers.server import Response, getSerializer
 from helpers.auth import IsAdmin
 from dateutil import parser
 from dateutil.relativedelta import *
@@ -9,6 +9,7 @@ from datetime import timezone, timedelta
 from docker.dockerUtils import stop_container
 from endpoints.models.reservation import ReservationFilters
 from sqlalchemy.orm import joinedload
+from helpers.tables.ServerStatus import getOfflineComputerIds, isComputerOnline
 
 # TODO: Should be able to send a computer here and get the available hardware specs for it.
 # TODO: Should also be able to only fail there is not enough resources any computer. Right now it fails if any of the computers are out of resources for the given time period.
@@ -43,7 +44,9 @@ def getAvailableHardware(date : str, duration : int, reducableSpecs : dict = Non
         Reservation.endDate > date,
         (Reservation.status == "reserved") | (Reservation.status == "started")
       )
-    allComputers = session.query(Computer).filter(Computer.removed.isnot(True), Computer.public.is_(True))
+    # Servers whose heartbeat lease has expired cannot start reservations
+    offlineComputerIds = getOfflineComputerIds(session)
+    allComputers = session.query(Computer).filter(Computer.removed.isnot(True), Computer.public.is_(True), Computer.computerId.notin_(offlineComputerIds))
     allContainers = session.query(Container)
     session.close()
 
@@ -77,16 +80,19 @@ def getAvailableHardware(date : str, duration : int, reducableSpecs : dict = Non
 
   computers = []
 
+  serializeComputer = getSerializer(Computer)
+  serializeHardwareSpec = getSerializer(HardwareSpec)
   for computer in allComputers:
-    compDict = ORMObjectToDict(computer)
+    compDict = serializeComputer(computer)
     compDict["hardwareSpecs"] = []
     for spec in computer.hardwareSpecs:
-      compDict["hardwareSpecs"].append(ORMObjectToDict(spec))
+      compDict["hardwareSpecs"].append(serializeHardwareSpec(spec))
     computers.append(compDict)
 
   containers = []
+  serializeContainer = getSerializer(Container)
   for container in allContainers:
-    containers.append(ORMObjectToDict(container))
+    containers.append(serializeContainer(container))
 
   # Get user's roles and their hardware limits
   user_role_limits = {}
@@ -199,11 +205,15 @@ def getOwnReservations(userId : int, filters : ReservationFilters) -> object:
       query = query.filter( Reservation.status == filters.filters["status"] )
     session.close()
   
+  serializeReservation = getSerializer(Reservation)
+  serializeReservedContainer = getSerializer(ReservedContainer)
+  serializeContainer = getSerializer(Container)
+  serializeReservedPort = getSerializer(ReservedContainerPort)
   for reservation in query:
-    res = ORMObjectToDict(reservation)
+    res = serializeReservation(reservation)
     res["computerName"] = reservation.computer.name
-    res["reservedContainer"] = ORMObjectToDict(reservation.reservedContainer)
-    res["reservedContainer"]["container"] = ORMObjectToDict(reservation.reservedContainer.container)
+    res["reservedContainer"] = serializeReservedContainer(reservation.reservedContainer)
+    res["reservedContainer"]["container"] = serializeContainer(reservation.reservedContainer.container)
     res["reservedContainer"]["reservedPorts"] = []
     # Include SHM and RAM disk percentages
     res["shmSizePercent"] = reservation.reservedContainer.shmSizePercent if reservation.reservedContainer.shmSizePercent is not None else 50
@@ -211,7 +221,7 @@ def getOwnReservations(userId : int, filters : ReservationFilters) -> object:
     # Only add ports if the reservation is started as the ports are unbound after the reservation is stopped
     if reservation.status == "started":
       for reservedPort in reservation.reservedContainer.reservedContainerPorts:
-        portObj = ORMObjectToDict(reservedPort)
+        portObj = serializeReservedPort(reservedPort)
         portObj["localPort"] = reservedPort.containerPort.port
         portObj["serviceName"] = reservedPort.containerPort.serviceName
         res["reservedContainer"]["reservedPorts"].append(portObj)
@@ -333,6 +343,8 @@ def createReservation(userId : int, date: str, duration: int, computerId: int, c
     computer = session.query(Computer).filter( Computer.computerId == computerId ).first()
     if (computer == None):
       return Response(False, "Computer not found.")
+    if not isComputerOnline(session, computerId):
+      return Response(False, "The server is offline, please select another server.")
     container = session.query(Container).filter( Container.containerId == containerId ).first()
     if (container == None):
       return Response(False, "Container not found.")
@@ -626,7 +638,7 @@ def getAvailabilityTimeline(startDate: str, endDate: str, isAdmin = False) -> ob
   with Session() as session:
     computers = session.query(Computer)\
       .options(joinedload(Computer.hardwareSpecs))\
-      .filter(Computer.removed.isnot(True), Computer.public.is_(True))\
+      .filter(Computer.removed.isnot(True), Computer.public.is_(True), Computer.computerId.notin_(getOfflineComputerIds(session)))\
       .all()
     
     reservations = session.query(Reservation)\
@@ -1,10 +1,11 @@
-from database import User, Session, UserWhitelist, UserBlacklist
+from database import User, Session
 from settings_handler import getSetting
 from helpers.server import Response
-from helpers.auth import CreateLoginToken, HashPassword, IsCorrectPassword, CheckToken, GetLDAPUser, GetRole
+from helpers.auth import CreateLoginToken, CheckToken, GetLDAPUser, GetRole
+from helpers.password_hashing import hashPassword, verifyPassword, needsRehash
+from helpers.access_control import isBlacklisted, isWhitelisted
 from fastapi import HTTPException, status
 from datetime import datetime, timezone
-import base64
 
 def login(username, password):
   '''
@@ -30,16 +31,12 @@ def login(username, password):
     user = session.query(User).filter(User.email == username).first()
     
     # Check blacklist first - this overrides whitelist and denies access immediately
-    if useBlacklisting:
-      blacklistEmail = session.query(UserBlacklist).filter(UserBlacklist.email == username).first()
-      if blacklistEmail is not None:
-        return Response(False, "You are not allowed to login (blacklisted).")
+    if useBlacklisting and isBlacklisted(session, username):
+      return Response(False, "You are not allowed to login (blacklisted).")
 
     # Check whitelist if enabled
-    if useWhitelisting:
-      whitelistEmail = session.query(UserWhitelist).filter(UserWhitelist.email == username).first()
-      if whitelistEmail is None:
-        return Response(False, "You are not allowed to login (not whitelisted).")
+    if useWhitelisting and not isWhitelisted(session, username):
+      return Response(False, "You are not allowed to login (not whitelisted).")
 
     # Helper function to create login token
     def create_successful_login(user):
@@ -60,8 +57,14 @@ def login(username, password):
       if user.password == "" or user.password is None:
         raise HTTPException(status_code=400, detail="User password was not set yet. Please set the password first to login.")
       
-      if IsCorrectPassword(base64.b64decode(user.passwordSalt), base64.b64decode(user.password), password) == False:
+      if verifyPassword(password, user.password, user.passwordSalt) == False:
         raise HTTPException(status_code=400, detail="Incorrect password.")
+
+      # Upgrade hashes made with an older algorithm or parameters, committed with the login token
+      if needsRehash(user.password):
+        hash = hashPassword(password)
+        user.password = hash["password"]
+        user.passwordSalt = hash["passwordSalt"]
       
       # Password is correct
       return create_successful_login(user)
@@ -131,10 +134,10 @@ def createPassword(password):
   '''
   if password == "" or password is None:
     return Response(False, "Password cannot be empty.")
-  hash = HashPassword(password)
+  hash = hashPassword(password)
   return Response(True, "Password created", {
-    "password": str(hash["hashedPassword"]),
-    "salt": str(hash['salt'])
+    "password": hash["password"],
+    "salt": hash["passwordSalt"]
   })
 
 def profile(token):
@@ -191,13 +194,13 @@ def changePassword(token, currentPassword, newPassword):
       return Response(False, "Password is not set for this account. Cannot change password.")
     
     # Verify current password
-    if not IsCorrectPassword(base64.b64decode(user.passwordSalt), base64.b64decode(user.password), currentPassword):
+    if not verifyPassword(currentPassword, user.password, user.passwordSalt):
       return Response(False, "Current password is incorrect.")
     
     # Hash and set new password
-    hash = HashPassword(newPassword)
-    user.password = base64.b64encode(hash["hashedPassword"]).decode('utf-8')
-    user.passwordSalt = base64.b64encode(hash["salt"]).decode('utf-8')
+    hash = hashPassword(newPassword)
+    user.password = hash["password"]
+    user.passwordSalt = hash["passwordSalt"]
     session.commit()
     
     return Response(True, "Password changed successfully.")
\ No newline at end of file
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends
+from helpers.json_response import FastJSONRoute
 from helpers.server import Response, ForceAuthentication
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from endpoints.responses import user as functionality
@@ -10,10 +11,13 @@ router = APIRouter(
     prefix="/api/user",
     tags=["User"],
     responses={404: {"description": "Not found"}},
+    route_class=FastJSONRoute,
 )
 
+# Not async, so that FastAPI runs the password hashing and verification in its thread pool
+# while they wait for the worker processes, instead of blocking the event loop
 @router.post("/login")
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+def login(form_data: OAuth2PasswordRequestForm = Depends()):
   return functionality.login(form_data.username, form_data.password)
 
 @router.get("/check_token")
@@ -21,7 +25,7 @@ async def checkToken(token: str = Depends(oauth2_scheme)):
   return functionality.checkToken(token)
 
 @router.post("/create_password")
-async def createPassword(password: str, token: str = Depends(oauth2_scheme)):
+def createPassword(password: str, token: str = Depends(oauth2_scheme)):
   ForceAuthentication(token)
   return functionality.createPassword(password)
 
@@ -40,6 +44,6 @@ class ChangePasswordRequest(BaseModel):
   newPassword: str
 
 @router.post("/change_password")
-async def changePassword(request: ChangePasswordRequest, token: str = Depends(oauth2_scheme)):
+def changePassword(request: ChangePasswordRequest, token: str = Depends(oauth2_scheme)):
   ForceAuthentication(token)
   return functionality.changePassword(token, request.currentPassword, request.newPassword)
\ No newline at end of file
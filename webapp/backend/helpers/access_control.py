@@ -0,0 +1,103 @@
+# Email blacklist and whitelist checks of logins, from lists kept in memory.
+# The lists are loaded once and reloaded when the version of the "accessControl" resource changes,
+# which every committed write to UserBlacklist or UserWhitelist bumps (see helpers/resource_versions.py).
+#
+# Entries are email addresses or domain wildcards:
+#   user@example.com    the address only
+#   *@example.com       every address of example.com
+#   *@*.example.com     every address of the subdomains of example.com
+import threading
+from helpers.resource_versions import getResourceVersions
+
+RESOURCE = "accessControl"
+# Trie node key marking a domain whose addresses match, and a domain whose subdomains' addresses match
+DOMAIN_MATCH = "@"
+SUBDOMAIN_MATCH = "*"
+
+def normalizeEntry(entry):
+    '''
+    Returns the entry in the form it is stored and compared in, or None if it is empty.
+    '''
+    if entry is None:
+        return None
+    entry = entry.strip().lower()
+    return entry or None
+
+class AccessList:
+    '''
+    Addresses in a frozenset and domain wildcards in a trie of the domain labels from the top level domain down.
+    '''
+    def __init__(self, entries):
+        emails = set()
+        self.domains = {}
+        for entry in entries:
+            entry = normalizeEntry(entry)
+            if entry is None:
+                continue
+            if not entry.startswith("*@"):
+                emails.add(entry)
+                continue
+            domain = entry[2:]
+            marker = DOMAIN_MATCH
+            if domain.startswith("*."):
+                domain = domain[2:]
+                marker = SUBDOMAIN_MATCH
+            node = self.domains
+            for label in reversed(domain.split(".")):
+                node = node.setdefault(label, {})
+            node[marker] = True
+        self.emails = frozenset(emails)
+
+    def __contains__(self, email):
+        email = normalizeEntry(email)
+        if email is None:
+            return False
+        if email in self.emails:
+            return True
+        if not self.domains or "@" not in email:
+            return False
+        labels = email.rsplit("@", 1)[1].split(".")
+        node = self.domains
+        for index, label in enumerate(reversed(labels)):
+            node = node.get(label)
+            if node is None:
+                return False
+            # A subdomain wildcard matches when labels of the email's domain are left below it
+            if SUBDOMAIN_MATCH in node and index < len(labels) - 1:
+                return True
+        return DOMAIN_MATCH in node
+
+lock = threading.Lock()
+# (version, blacklist, whitelist)
+loaded = None
+
+def getAccessLists(session):
+    '''
+    Returns the blacklist and whitelist as AccessLists. Reads only the version of the lists
+    from the database while they have not changed.
+
+    Parameters:
+        session: Database session
+    Returns:
+        (blacklist, whitelist)
+    '''
+    global loaded
+    from database import UserBlacklist, UserWhitelist
+    version = getResourceVersions(session, [RESOURCE])[RESOURCE]
+    current = loaded
+    if current is not None and current[0] == version:
+        return current[1], current[2]
+    with lock:
+        if loaded is not None and loaded[0] == version:
+            return loaded[1], loaded[2]
+        # Read after the version, so that a change in between is loaded again on the next check
+        blacklist = AccessList(email for (email,) in session.query(UserBlacklist.email))
+        whitelist = AccessList(email for (email,) in session.query(UserWhitelist.email))
+        loaded = (version, blacklist, whitelist)
+        return blacklist, whitelist
+
+def isBlacklisted(session, email) -> bool:
+    return email in getAccessLists(session)[0]
+
+def isWhitelisted(session, email) -> bool:
+    return email in getAccessLists(session)[1]
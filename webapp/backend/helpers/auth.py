@@ -1,14 +1,13 @@
-from typing import Tuple
 import os
-import hashlib
-import hmac
 import random
 import string
-from database import User, Session, UserWhitelist
+from database import User, Session
 from settings_handler import getSetting
 import helpers.server
 #import ldap3 as ldap
 import ldap
+from helpers.ldap_client import getLDAPClient, LDAPLoginError
+from helpers.access_control import isWhitelisted
 from datetime import timedelta
 import datetime
 import string
@@ -212,31 +211,6 @@ def CreateLoginToken() -> str:
   limit = 100
   return ''.join(random.choice(allowedChars) for _ in range(limit))
 
-def HashPassword(password: str) -> Tuple[bytes, bytes]:
-  """
-  Hash the provided password with a randomly-generated salt and return the
-  salt and hash to store in the database.
-  
-  Example usage:
-    hash = HashPassword('correct horse battery staple')
-  """
-  salt = os.urandom(16)
-  pw_hash = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, 100000)
-  return { "salt": salt, "hashedPassword": pw_hash }
-
-def IsCorrectPassword(salt: bytes, pw_hash: bytes, password: str) -> bool:
-  """
-  Given a previously-stored salt and hash, and a password provided by a user
-  trying to log in, check whether the password is correct.
-
-  Example usage:
-    if IsCorrectPassword(hash['salt'], hash['hashedPassword'], 'correct horse battery staple') == True
-  """
-  return hmac.compare_digest(
-    pw_hash,
-    hashlib.pbkdf2_hmac('sha256', password.encode(), salt, 100000)
-  )
-
 def create_password(length = 40):
   '''
   Creates a random password of the given length.
@@ -248,60 +222,40 @@ def create_password(length = 40):
   return random_password
 
 def GetLDAPUser(username, password):
+  '''
+  Checks the username and password against LDAP, with the pooled client of helpers/ldap_client.py.
+  Creates the user on the first login.
+  Returns:
+    (True, userId) or (False, error message)
+  '''
   from settings_handler import getSetting
-  
-  # Get LDAP settings from database
-  ldap_url = getSetting('auth.ldap.url')
-  username_format = getSetting('auth.ldap.usernameFormat')
-  password_format = getSetting('auth.ldap.passwordFormat') 
-  ldap_domain = getSetting('auth.ldap.domain')
-  search_method = getSetting('auth.ldap.searchMethod')
-  account_field = getSetting('auth.ldap.accountField')
-  email_field = getSetting('auth.ldap.emailField')
-  
+
+  client = getLDAPClient()
   # Check if LDAP is properly configured
-  if not all([ldap_url, username_format, password_format, ldap_domain, search_method, account_field, email_field]):
+  if not client.config.isComplete():
     return False, "LDAP is not properly configured"
-    
-  useWhitelisting = getSetting('access.whitelistEnabled')
-  # Disable certificate checks
-  ldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_NEVER)
-  l = ldap.initialize(ldap_url)
-  l.set_option(ldap.OPT_NETWORK_TIMEOUT, 6)
-  l.set_option(ldap.OPT_TIMEOUT, 6)
-  l.set_option(ldap.OPT_REFERRALS, ldap.OPT_OFF)
-  #print(os.getcwd())
-  #l.set_option(ldap.OPT_X_TLS_CACERTFILE, os.getcwd()+"/certificate.pem")
 
-  with Session() as session:
-    try:
-      l.simple_bind_s(username_format.replace("{username}", username), password_format.replace("{password}", password))
-      result = l.search_s(ldap_domain, ldap.SCOPE_SUBTREE, search_method.replace("{username}", username), [account_field, email_field])
-      account = result[0][1][account_field][0].decode("utf-8")
-      if account != username:
-        return False, "Wrong username / ldap username association"
-      
-      email = result[0][1][email_field][0].decode("utf-8")
+  try:
+    email = client.authenticate(username, password)
+  except ldap.INVALID_CREDENTIALS:
+    return False, "Wrong username or password."
+  except ldap.SERVER_DOWN:
+    return False, "Failed to connect to LDAP authentication service: Timeout."
+  except LDAPLoginError as e:
+    return False, str(e)
+  except Exception:
+    return False, "Unknown error with the LDAP login!"
 
-      whitelistEmail = session.query(UserWhitelist).filter( UserWhitelist.email == email ).first()
-      if useWhitelisting and whitelistEmail == None:
-        return False, "You are not allowed to login (not whitelisted, LDAP)."
+  with Session() as session:
+    if getSetting('access.whitelistEnabled') and not isWhitelisted(session, email):
+      return False, "You are not allowed to login (not whitelisted, LDAP)."
 
-      user = session.query(User).filter( User.email == email ).first()
-      # User not found? Create it and return the newly created user
-      if user == None:
-        newUser = User(
-          email = email
-        )
-        session.add(newUser)
-        session.commit()
-        return True, session.query(User).filter( User.email == email ).first().userId
-      # User found? Return it
-      else:
-        return True, user.userId
-    except ldap.INVALID_CREDENTIALS:
-      return False, "Wrong username or password."
-    except ldap.SERVER_DOWN:
-      return False, "Failed to connect to LDAP authentication service: Timeout."
-    except Exception:
-      return False, "Unknown error with the LDAP login!"
\ No newline at end of file
+    user = session.query(User).filter( User.email == email ).first()
+    # User not found? Create it and return the newly created user
+    if user == None:
+      user = User(
+        email = email
+      )
+      session.add(user)
+      session.commit()
+    return True, user.userId
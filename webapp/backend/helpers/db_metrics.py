@@ -0,0 +1,98 @@
+# Database metrics: query counts and profiling per request and connection pool usage of the SQLAlchemy engine
+import os
+import time
+import traceback
+from contextvars import ContextVar
+from sqlalchemy import event
+from helpers.metrics import REGISTRY
+
+DB_QUERIES = REGISTRY.counter("containerfly_db_queries_total", "SQL statements executed")
+
+BACKEND_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Frames of these files are skipped when looking for the code which ran a statement
+SKIPPED_ORIGIN_FILES = (os.path.abspath(__file__),)
+
+class RequestQueryStats:
+    '''
+    SQL statements of one request. Counting is always on, timing and the slowest statements only when profiling.
+    '''
+
+    def __init__(self, profile=False, slowQueryLimit=5):
+        self.count = 0
+        self.seconds = 0.0
+        self.profile = profile
+        self.slowQueryLimit = slowQueryLimit
+        # (seconds, statement, origin), the slowest first
+        self.slowQueries = []
+
+    def addTiming(self, seconds, statement):
+        self.seconds += seconds
+        if self.slowQueryLimit <= 0:
+            return
+        if len(self.slowQueries) >= self.slowQueryLimit and seconds <= self.slowQueries[-1][0]:
+            return
+        # The stack is only walked for statements which make it to the slowest list
+        self.slowQueries.append((seconds, " ".join(statement.split()), getStatementOrigin()))
+        self.slowQueries.sort(key=lambda query: query[0], reverse=True)
+        del self.slowQueries[self.slowQueryLimit:]
+
+# Query stats of the current request. Copies of the context (thread pool, tasks) share the same object
+requestQueryStats = ContextVar("requestQueryStats", default=None)
+
+def getStatementOrigin():
+    '''
+    Returns "file:line in function" of the innermost backend code which ran the current statement.
+    '''
+    for frame in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(frame.filename)
+        if not filename.startswith(BACKEND_FOLDER) or filename in SKIPPED_ORIGIN_FILES or "site-packages" in filename:
+            continue
+        return f"{os.path.relpath(filename, BACKEND_FOLDER)}:{frame.lineno} in {frame.name}"
+    return "unknown"
+
+def beforeCursorExecute(conn, cursor, statement, parameters, context, executemany):
+    DB_QUERIES.inc()
+    stats = requestQueryStats.get()
+    if stats is None:
+        return
+    stats.count += 1
+    if stats.profile:
+        conn.info.setdefault("queryStartTimes", []).append(time.perf_counter())
+
+def afterCursorExecute(conn, cursor, statement, parameters, context, executemany):
+    stats = requestQueryStats.get()
+    if stats is None or not stats.profile:
+        return
+    startTimes = conn.info.get("queryStartTimes")
+    if startTimes:
+        stats.addTiming(time.perf_counter() - startTimes.pop(), statement)
+
+def instrumentEngine(engine):
+    '''
+    Counts (and when profiling, times) the SQL statements of the engine and exposes the usage of its connection pool.
+    '''
+    event.listen(engine, "before_cursor_execute", beforeCursorExecute)
+    event.listen(engine, "after_cursor_execute", afterCursorExecute)
+    pool = engine.pool
+    if hasattr(pool, "checkedout"):
+        REGISTRY.gauge("containerfly_db_pool_size", "Connections kept open in the pool", function=pool.size)
+        REGISTRY.gauge("containerfly_db_pool_checked_out", "Connections currently in use", function=pool.checkedout)
+        REGISTRY.gauge("containerfly_db_pool_overflow", "Connections opened over the pool size (max_overflow)", function=lambda: max(0, pool.overflow()))
+
+def startCountingQueries(profile=False, slowQueryLimit=5):
+    '''
+    Starts collecting the queries of the current request.
+    Returns:
+        (token, stats): Pass the token to stopCountingQueries(), stats is a RequestQueryStats.
+    '''
+    stats = RequestQueryStats(profile, slowQueryLimit)
+    return requestQueryStats.set(stats), stats
+
+def stopCountingQueries(token):
+    requestQueryStats.reset(token)
+
+def getServerTimingHeader(stats, totalSeconds):
+    '''
+    Returns a Server-Timing header value with the database time and query count of the request.
+    '''
+    return f'db;dur={stats.seconds * 1000:.1f};desc="{stats.count} queries", app;dur={totalSeconds * 1000:.1f}'
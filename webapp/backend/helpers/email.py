@@ -2,7 +2,11 @@ import smtplib
 import socket
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+import time
 from settings_handler import getSetting
+from helpers.metrics import REGISTRY
+
+EMAIL_SEND_DURATION = REGISTRY.histogram("containerfly_email_send_duration_seconds", "Time to send an email over SMTP", ("result",))
 
 def send_email(to, mail_subject, mail_body):
 
@@ -33,6 +37,8 @@ def send_email(to, mail_subject, mail_body):
     mimemsg['To'] = to
     mimemsg['Subject'] = mail_subject
     mimemsg.attach(MIMEText(mail_body, 'plain'))
+    start = time.perf_counter()
+    result = "sent"
     try:
         # Use SSL/TLS for port 465, STARTTLS for other ports (typically 587)
         if smtpPort == 465:
@@ -45,4 +51,6 @@ def send_email(to, mail_subject, mail_body):
         connection.quit()
     except (smtplib.SMTPConnectError, smtplib.SMTPAuthenticationError, socket.gaierror, socket.error, Exception) as e:
         print(f"Something went wrong sending email: {e}")
-        return
\ No newline at end of file
+        result = "failed"
+    finally:
+        EMAIL_SEND_DURATION.observe(time.perf_counter() - start, result=result)
\ No newline at end of file
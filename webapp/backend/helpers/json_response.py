@@ -0,0 +1,127 @@
+# JSON responses serialized with orjson, without walking the content with FastAPI's jsonable_encoder first,
+# and conditional responses (ETag / If-None-Match) of read-mostly endpoints
+import datetime
+import decimal
+import functools
+import hashlib
+import inspect
+import time
+import orjson
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from sqlalchemy.engine import Row
+from starlette.responses import Response
+from database import Session
+from helpers.resource_versions import getResourceVersions
+
+# Part of every ETag, so that responses of an older backend (possibly in another format) are not reused after a restart
+PROCESS_TOKEN = str(time.time_ns())
+
+def encodeDefault(value):
+    '''
+    Converts the values orjson does not serialize natively, the same way jsonable_encoder does.
+    datetime, date, time, UUID, enums and dataclasses are handled by orjson itself.
+    '''
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    if isinstance(value, (Row, set, frozenset)):
+        return list(value)
+    if isinstance(value, bytes):
+        return value.decode()
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    if hasattr(value, "model_dump"):
+        # Pydantic models
+        return value.model_dump(mode="json")
+    raise TypeError(f"Type {type(value).__name__} is not JSON serializable")
+
+class FastJSONResponse(JSONResponse):
+    '''
+    JSON response rendered with orjson. Dict keys do not need to be strings.
+    '''
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=encodeDefault, option=orjson.OPT_NON_STR_KEYS)
+
+def toResponse(content):
+    return content if isinstance(content, Response) else FastJSONResponse(content)
+
+def returnFastJSON(endpoint):
+    '''
+    Wraps the endpoint so that it returns FastJSONResponse. FastAPI passes responses through as they are,
+    so the content is not converted with jsonable_encoder. The signature of the endpoint is kept for the dependencies.
+    '''
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def asyncWrapper(*args, **kwargs):
+            return toResponse(await endpoint(*args, **kwargs))
+        return asyncWrapper
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        return toResponse(endpoint(*args, **kwargs))
+    return wrapper
+
+class FastJSONRoute(APIRoute):
+    '''
+    Route class returning the content of the endpoints as FastJSONResponse. Routes with a response_model,
+    given or taken from the return annotation, are left as they are, as FastAPI validates their content.
+
+    Example:
+        router = APIRouter(prefix="/api/admin", route_class=FastJSONRoute)
+    '''
+    def __init__(self, path, endpoint, **kwargs):
+        responseModel = kwargs.get("response_model")
+        if isinstance(responseModel, DefaultPlaceholder):
+            responseModel = responseModel.value
+        if responseModel is None and inspect.signature(endpoint).return_annotation is inspect.Signature.empty:
+            endpoint = returnFastJSON(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+def createETag(request, versions, extraKey=None):
+    parts = [PROCESS_TOKEN, request.url.path, str(sorted(request.query_params.multi_items()))]
+    parts += [f"{resource}={version}" for resource, version in sorted(versions.items())]
+    if extraKey is not None:
+        parts.append(str(extraKey))
+    return '"' + hashlib.sha256("|".join(parts).encode()).hexdigest()[:32] + '"'
+
+def matchesETag(request, etag):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison
+    return any(value.strip().removeprefix("W/") == etag for value in header.split(","))
+
+def conditionalResponse(request, resources, getContent, getExtraKey=None):
+    '''
+    Answers a GET request with 304 Not Modified if the resources have not changed since the ETag
+    given in If-None-Match, otherwise returns the content of getContent() with an ETag.
+    The response must only depend on the resources, the path and the query parameters of the request.
+
+    Parameters:
+        request: The request.
+        resources: Resources the content is built from, keys of RESOURCE_TABLES in helpers/resource_versions.py.
+        getContent: Function returning the content, called only when the content is sent.
+        getExtraKey: Optional function called with a database session, for state which is not versioned
+            but changes the content. Its return value is added to the ETag.
+
+    Returns:
+        FastJSONResponse or a 304 response.
+    '''
+    with Session() as session:
+        versions = getResourceVersions(session, resources)
+        extraKey = getExtraKey(session) if getExtraKey is not None else None
+
+    # Versions are read before the content, so a write in between gives the newer content the older ETag.
+    # The next request then does not match and gets the content again.
+    etag = createETag(request, versions, extraKey)
+    headers = { "ETag": etag, "Cache-Control": "private, no-cache" }
+    if matchesETag(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    content = getContent()
+    if isinstance(content, dict) and content.get("status") is False:
+        return FastJSONResponse(content)
+    return FastJSONResponse(content, headers=headers)
@@ -0,0 +1,268 @@
+# Pooled LDAP client for logins. Connections to the LDAP server are kept open and reused, so that a login storm
+# at the start of a lab does not open a new (TLS) connection per attempt, and their amount is bounded,
+# so that the LDAP server is not saturated.
+#
+# Without a service account a login binds as the user on a pooled connection and searches the user with it.
+# With a service account (auth.ldap.bindDn) the user is searched with the service account's own connections.
+# Search results (account and email, or that the user was not found) are cached for a short time,
+# so repeated logins only bind. Passwords are always checked by the LDAP server, binds are not cached.
+import queue
+import threading
+import time
+from dataclasses import dataclass
+import ldap
+import ldap.filter
+
+LDAP_SETTINGS = {
+    "url": "auth.ldap.url",
+    "usernameFormat": "auth.ldap.usernameFormat",
+    "passwordFormat": "auth.ldap.passwordFormat",
+    "domain": "auth.ldap.domain",
+    "searchMethod": "auth.ldap.searchMethod",
+    "accountField": "auth.ldap.accountField",
+    "emailField": "auth.ldap.emailField",
+    "bindDn": "auth.ldap.bindDn",
+    "bindPassword": "auth.ldap.bindPassword",
+}
+# Settings which have to be set for LDAP logins, the service account is optional
+REQUIRED_SETTINGS = ("url", "usernameFormat", "passwordFormat", "domain", "searchMethod", "accountField", "emailField")
+
+TIMEOUT_SECONDS = 6
+# Connections open at the same time per pool, logins wait for a free connection at most TIMEOUT_SECONDS
+POOL_SIZE = 10
+# Idle connections older than this are closed instead of reused, servers drop idle connections
+MAX_IDLE_SECONDS = 240
+FOUND_CACHE_SECONDS = 300
+NOT_FOUND_CACHE_SECONDS = 60
+MAX_CACHED_USERS = 10000
+
+class LDAPLoginError(Exception):
+    '''
+    Login failed for a reason which is shown to the user as it is.
+    '''
+
+@dataclass(frozen=True)
+class LDAPConfig:
+    url: str
+    usernameFormat: str
+    passwordFormat: str
+    domain: str
+    searchMethod: str
+    accountField: str
+    emailField: str
+    bindDn: str
+    bindPassword: str
+
+    def isComplete(self) -> bool:
+        return all(getattr(self, field) for field in REQUIRED_SETTINGS)
+
+def closeConnection(connection):
+    try:
+        connection.unbind_s()
+    except ldap.LDAPError:
+        pass
+
+class ConnectionPool:
+    '''
+    Bounded pool of connections to the LDAP server, bound as the service account if one is given.
+    '''
+    def __init__(self, url, bindDn=None, bindPassword=None):
+        self.url = url
+        self.bindDn = bindDn
+        self.bindPassword = bindPassword
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(POOL_SIZE)
+
+    def connect(self):
+        # Certificates are not checked
+        ldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_NEVER)
+        connection = ldap.initialize(self.url)
+        connection.set_option(ldap.OPT_NETWORK_TIMEOUT, TIMEOUT_SECONDS)
+        connection.set_option(ldap.OPT_TIMEOUT, TIMEOUT_SECONDS)
+        connection.set_option(ldap.OPT_REFERRALS, ldap.OPT_OFF)
+        if self.bindDn:
+            try:
+                connection.simple_bind_s(self.bindDn, self.bindPassword)
+            except ldap.INVALID_CREDENTIALS:
+                closeConnection(connection)
+                raise LDAPLoginError("The LDAP service account could not log in.")
+            except Exception:
+                closeConnection(connection)
+                raise
+        return connection
+
+    def checkOut(self):
+        '''
+        Returns:
+            (connection, True if it was used before)
+        '''
+        while True:
+            try:
+                connection, lastUsed = self.idle.get_nowait()
+            except queue.Empty:
+                return self.connect(), False
+            if time.monotonic() - lastUsed < MAX_IDLE_SECONDS:
+                return connection, True
+            closeConnection(connection)
+
+    def checkIn(self, connection):
+        self.idle.put((connection, time.monotonic()))
+
+    def run(self, operation):
+        '''
+        Runs operation(connection) on a pooled connection and returns its result. A reused connection
+        the server has closed in the meantime is replaced with a new one once.
+        '''
+        if not self.slots.acquire(timeout=TIMEOUT_SECONDS):
+            raise LDAPLoginError("The LDAP authentication service is busy, please try again.")
+        try:
+            connection, reused = self.checkOut()
+            while True:
+                try:
+                    result = operation(connection)
+                except ldap.SERVER_DOWN:
+                    closeConnection(connection)
+                    if not reused:
+                        raise
+                    connection, reused = self.connect(), False
+                    continue
+                except ldap.INVALID_CREDENTIALS:
+                    # A failed bind leaves the connection usable
+                    self.checkIn(connection)
+                    raise
+                except BaseException:
+                    closeConnection(connection)
+                    raise
+                self.checkIn(connection)
+                return result
+        finally:
+            self.slots.release()
+
+    def close(self):
+        while True:
+            try:
+                connection, _ = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            closeConnection(connection)
+
+class UserCache:
+    '''
+    Search results of usernames, (account, email) or None if the user was not found, with an expiry time.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def get(self, username):
+        '''
+        Returns:
+            (True, result) if the result is cached, otherwise (False, None)
+        '''
+        with self.lock:
+            entry = self.entries.get(username)
+        if entry is None or entry[0] < time.monotonic():
+            return False, None
+        return True, entry[1]
+
+    def set(self, username, result):
+        seconds = FOUND_CACHE_SECONDS if result is not None else NOT_FOUND_CACHE_SECONDS
+        with self.lock:
+            if len(self.entries) >= MAX_CACHED_USERS:
+                now = time.monotonic()
+                self.entries = { key: entry for key, entry in self.entries.items() if entry[0] >= now }
+                if len(self.entries) >= MAX_CACHED_USERS:
+                    self.entries.clear()
+            self.entries[username] = (time.monotonic() + seconds, result)
+
+class LDAPClient:
+    def __init__(self, config: LDAPConfig):
+        self.config = config
+        # Connections the users bind on
+        self.bindPool = ConnectionPool(config.url)
+        # Connections bound as the service account, for searches
+        self.searchPool = ConnectionPool(config.url, config.bindDn, config.bindPassword) if config.bindDn else None
+        self.users = UserCache()
+
+    def search(self, connection, username):
+        '''
+        Returns:
+            (account, email) of the user or None if the user was not found.
+        '''
+        config = self.config
+        searchFilter = config.searchMethod.replace("{username}", ldap.filter.escape_filter_chars(username))
+        result = connection.search_s(config.domain, ldap.SCOPE_SUBTREE, searchFilter, [config.accountField, config.emailField])
+        # Referrals are returned without a DN
+        for dn, attributes in result:
+            if dn is not None and attributes.get(config.accountField) and attributes.get(config.emailField):
+                return attributes[config.accountField][0].decode("utf-8"), attributes[config.emailField][0].decode("utf-8")
+        return None
+
+    def findUser(self, connection, username):
+        cached, user = self.users.get(username)
+        if not cached:
+            user = self.search(connection, username)
+            self.users.set(username, user)
+        return user
+
+    def authenticate(self, username: str, password: str) -> str:
+        '''
+        Checks the username and password against the LDAP server.
+        Returns:
+            Email address of the user.
+        Raises:
+            ldap.INVALID_CREDENTIALS on a wrong username or password, ldap.SERVER_DOWN if the server
+            can not be reached, LDAPLoginError for the other failures.
+        '''
+        config = self.config
+        # An empty password would be an unauthenticated bind, which LDAP servers accept
+        if not password:
+            raise ldap.INVALID_CREDENTIALS()
+        userDn = config.usernameFormat.replace("{username}", username)
+        userPassword = config.passwordFormat.replace("{password}", password)
+
+        def bind(connection):
+            connection.simple_bind_s(userDn, userPassword)
+
+        def bindAndFind(connection):
+            bind(connection)
+            return self.findUser(connection, username)
+
+        if self.searchPool is not None:
+            user = self.searchPool.run(lambda connection: self.findUser(connection, username))
+            if user is None:
+                raise ldap.INVALID_CREDENTIALS()
+            self.bindPool.run(bind)
+        else:
+            user = self.bindPool.run(bindAndFind)
+            if user is None:
+                raise LDAPLoginError("User was not found in LDAP.")
+
+        account, email = user
+        if account != username:
+            raise LDAPLoginError("Wrong username / ldap username association")
+        return email
+
+    def close(self):
+        self.bindPool.close()
+        if self.searchPool is not None:
+            self.searchPool.close()
+
+clientLock = threading.Lock()
+client = None
+
+def getLDAPClient() -> LDAPClient:
+    '''
+    Returns the LDAP client of the current LDAP settings. The settings are read with one call to the
+    settings cache; the client, its connections and cached users are replaced when they change.
+    '''
+    global client
+    from settings_handler import getMultipleSettings
+    values = getMultipleSettings(list(LDAP_SETTINGS.values()))
+    config = LDAPConfig(**{ field: values.get(key) or "" for field, key in LDAP_SETTINGS.items() })
+    with clientLock:
+        if client is None or client.config != config:
+            if client is not None:
+                client.close()
+            client = LDAPClient(config)
+        return client
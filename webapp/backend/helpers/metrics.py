@@ -0,0 +1,218 @@
+# Lightweight metrics registry (counters, gauges, histograms) with the Prometheus text exposition format
+import hmac
+import math
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds, from fast API requests to slow image pulls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+def escapeLabelValue(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def formatValue(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+def formatLabels(labelNames, labelValues, extra=()):
+    pairs = list(zip(labelNames, labelValues)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escapeLabelValue(value)}"' for name, value in pairs) + "}"
+
+class Metric:
+    '''
+    Base class of the metrics. Values are kept per label value combination.
+    '''
+    type = None
+
+    def __init__(self, name, description, labelNames=()):
+        self.name = name
+        self.description = description
+        self.labelNames = tuple(labelNames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels):
+        if set(labels) != set(self.labelNames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelNames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelNames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type}"]
+        with self.lock:
+            for labelValues, value in sorted(self.values.items()):
+                lines.extend(self.renderValue(labelValues, value))
+        return lines
+
+    def renderValue(self, labelValues, value):
+        return [f"{self.name}{formatLabels(self.labelNames, labelValues)} {formatValue(value)}"]
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    '''
+    Gauge set by the code, or read from the given function when the metrics are rendered (only without labels).
+    '''
+    type = "gauge"
+
+    def __init__(self, name, description, labelNames=(), function=None):
+        super().__init__(name, description, labelNames)
+        self.function = function
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self):
+        if self.function is not None:
+            try:
+                self.set(self.function())
+            except Exception as e:
+                print(f"Could not read metric {self.name}: {e}")
+        return super().render()
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, description, labelNames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, labelNames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # Count per bucket (not cumulative), sum, count
+                state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        '''
+        Observes how many seconds the with block takes.
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def renderValue(self, labelValues, value):
+        bucketCounts, total, count = value
+        lines = []
+        cumulative = 0
+        for bucket, bucketCount in zip(self.buckets, bucketCounts):
+            cumulative += bucketCount
+            lines.append(f"{self.name}_bucket{formatLabels(self.labelNames, labelValues, [('le', formatValue(float(bucket)))])} {cumulative}")
+        lines.append(f"{self.name}_sum{formatLabels(self.labelNames, labelValues)} {formatValue(total)}")
+        lines.append(f"{self.name}_count{formatLabels(self.labelNames, labelValues)} {count}")
+        return lines
+
+class Registry:
+    '''
+    Holds the metrics of the process. Creating a metric with an existing name returns the existing one.
+    '''
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def add(self, metric):
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric):
+                    raise ValueError(f"Metric {metric.name} is already registered as a {existing.type}")
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, description, labelNames=()):
+        return self.add(Counter(name, description, labelNames))
+
+    def gauge(self, name, description, labelNames=(), function=None):
+        return self.add(Gauge(name, description, labelNames, function))
+
+    def histogram(self, name, description, labelNames=(), buckets=DEFAULT_BUCKETS):
+        return self.add(Histogram(name, description, labelNames, buckets))
+
+    def render(self):
+        '''
+        Returns all metrics in the Prometheus text exposition format.
+        '''
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def isAuthorized(authorizationHeader, token):
+    '''
+    Checks the Authorization header of a scrape against the metrics token (app.metricsToken).
+    Without a token the metrics are not served to anyone.
+    '''
+    if not token or not authorizationHeader:
+        return False
+    return hmac.compare_digest(authorizationHeader.encode("utf-8"), f"Bearer {token}".encode("utf-8"))
+
+def startMetricsServer(port, token, registry=REGISTRY, host="127.0.0.1"):
+    '''
+    Serves the metrics at http://host:port/metrics from a background thread, to scrapes with the
+    header "Authorization: Bearer <token>". Used by processes which do not run the API, like the docker utility.
+
+    Returns:
+        The HTTP server, call shutdown() on it to stop serving.
+    '''
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            if not isAuthorized(self.headers.get("Authorization"), token):
+                self.send_error(401)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes every few seconds would flood the pm2 logs
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
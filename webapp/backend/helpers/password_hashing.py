@@ -0,0 +1,214 @@
+# Password hashing and verification in a bounded pool of worker processes, so that key derivation
+# does not block the event loop and logins are spread over all CPU cores.
+#
+# Stored format of User.password: "<algorithm>$<parameters>$<base64 hash>" with the base64 salt in
+# User.passwordSalt, or the encoded argon2 hash ("$argon2id$v=19$m=...") which contains its salt.
+# Hashes without "$" are legacy PBKDF2-SHA256 hashes with 100 000 iterations.
+# Hashes made with other than the configured algorithm or parameters are upgraded on login (see needsRehash()).
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    from argon2 import PasswordHasher
+    from argon2.exceptions import InvalidHashError, VerificationError
+except ImportError:
+    PasswordHasher = None
+
+ALGORITHMS = ("pbkdf2_sha256", "scrypt", "argon2id")
+LEGACY_ITERATIONS = 100000
+SALT_BYTES = 16
+SCRYPT_PARAMS = { "n": 2 ** 15, "r": 8, "p": 1 }
+ARGON2_PARAMS = { "t": 3, "m": 65536, "p": 4 }
+# Jobs waiting per worker process before callers wait for a free slot
+QUEUED_PER_WORKER = 4
+# Passwords given to a worker process at a time in hashPasswords()
+CHUNK_SIZE = 16
+
+# ===== Run in the worker processes, the algorithm and parameters are given as arguments =====
+
+def encodeParams(params: dict) -> str:
+    return ",".join(f"{key}={value}" for key, value in params.items())
+
+def decodeParams(text: str) -> dict:
+    return { key: int(value) for key, value in (part.split("=") for part in text.split(",")) }
+
+def deriveKey(password: str, salt: bytes, algorithm: str, params: dict) -> bytes:
+    if algorithm == "pbkdf2_sha256":
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, params["i"])
+    if algorithm == "scrypt":
+        return hashlib.scrypt(password.encode(), salt=salt, n=params["n"], r=params["r"], p=params["p"], maxmem=256 * params["r"] * params["n"], dklen=32)
+    raise ValueError(f"Unknown password hash algorithm: {algorithm}")
+
+def createHash(password: str, algorithm: str, params: dict) -> dict:
+    '''
+    Returns:
+        { "password": str, "passwordSalt": str }, the values to store in the User table.
+    '''
+    if algorithm == "argon2id":
+        hasher = PasswordHasher(time_cost=params["t"], memory_cost=params["m"], parallelism=params["p"])
+        return { "password": hasher.hash(password), "passwordSalt": "" }
+    salt = os.urandom(SALT_BYTES)
+    key = deriveKey(password, salt, algorithm, params)
+    return {
+        "password": f"{algorithm}${encodeParams(params)}${base64.b64encode(key).decode('utf-8')}",
+        "passwordSalt": base64.b64encode(salt).decode('utf-8')
+    }
+
+def createHashes(passwords: list, algorithm: str, params: dict) -> list:
+    return [createHash(password, algorithm, params) for password in passwords]
+
+def checkHash(password: str, storedPassword: str, storedSalt: str) -> bool:
+    if storedPassword.startswith("$argon2"):
+        if PasswordHasher is None:
+            raise RuntimeError("The password is hashed with argon2, install argon2-cffi to verify it")
+        try:
+            return PasswordHasher().verify(storedPassword, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    algorithm, params, key = parseHash(storedPassword)
+    return hmac.compare_digest(key, deriveKey(password, base64.b64decode(storedSalt), algorithm, params))
+
+def parseHash(storedPassword: str):
+    '''
+    Returns:
+        (algorithm, params, key) of a stored hash which is not argon2.
+    '''
+    if "$" not in storedPassword:
+        return "pbkdf2_sha256", { "i": LEGACY_ITERATIONS }, base64.b64decode(storedPassword)
+    algorithm, params, key = storedPassword.split("$")
+    return algorithm, decodeParams(params), base64.b64decode(key)
+
+# ===== Run in the backend =====
+
+def getConfiguration():
+    '''
+    Returns:
+        (algorithm, params) new hashes are made with.
+    '''
+    from settings_handler import getSetting
+    algorithm = getSetting("app.passwordHashAlgorithm")
+    if algorithm == "argon2id" and PasswordHasher is None:
+        print("app.passwordHashAlgorithm is argon2id but argon2-cffi is not installed, using pbkdf2_sha256")
+        algorithm = "pbkdf2_sha256"
+    if algorithm == "scrypt":
+        return algorithm, dict(SCRYPT_PARAMS)
+    if algorithm == "argon2id":
+        return algorithm, dict(ARGON2_PARAMS)
+    return "pbkdf2_sha256", { "i": getSetting("app.passwordHashIterations") }
+
+poolLock = threading.Lock()
+pool = None
+poolSlots = None
+poolWorkers = 1
+
+def getPool():
+    global pool, poolSlots, poolWorkers
+    with poolLock:
+        if pool is None:
+            from settings_handler import getSetting
+            workers = getSetting("app.passwordHashWorkers") or os.cpu_count() or 1
+            # Workers are not forked from the backend, which has threads and database connections open
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload([__name__])
+            else:
+                context = multiprocessing.get_context("spawn")
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            poolWorkers = workers
+            poolSlots = threading.BoundedSemaphore(workers * QUEUED_PER_WORKER)
+        return pool, poolSlots
+
+def resetPool(brokenPool):
+    global pool
+    with poolLock:
+        if pool is brokenPool:
+            pool = None
+
+def runInPool(function, *args):
+    '''
+    Runs the function in a worker process and waits for the result. Blocks the calling thread only,
+    so it is called from endpoints which FastAPI runs in its thread pool.
+    '''
+    executor, slots = getPool()
+    with slots:
+        try:
+            return executor.submit(function, *args).result()
+        except BrokenProcessPool:
+            # A worker died, the next call creates a new pool
+            resetPool(executor)
+            return function(*args)
+
+def hashPassword(password: str) -> dict:
+    '''
+    Hashes the password with the configured algorithm.
+    Returns:
+        { "password": str, "passwordSalt": str }, the values to store in the User table.
+    '''
+    algorithm, params = getConfiguration()
+    return runInPool(createHash, password, algorithm, params)
+
+def hashPasswords(passwords: list) -> list:
+    '''
+    Hashes many passwords at once, spread over the worker processes.
+    Returns:
+        List of { "password": str, "passwordSalt": str } in the order of the passwords.
+    '''
+    if len(passwords) == 0:
+        return []
+    algorithm, params = getConfiguration()
+    chunks = [passwords[i:i + CHUNK_SIZE] for i in range(0, len(passwords), CHUNK_SIZE)]
+    hashes = []
+    retried = False
+    while len(chunks) > 0:
+        executor, slots = getPool()
+        # At most one chunk per worker at a time, so logins queue behind one chunk per worker
+        # instead of the whole import, and the rest of the slots are left for them
+        window = chunks[:poolWorkers]
+        for _ in window:
+            slots.acquire()
+        try:
+            futures = [executor.submit(createHashes, chunk, algorithm, params) for chunk in window]
+            windowHashes = [future.result() for future in futures]
+        except BrokenProcessPool:
+            # A worker died, the window is hashed again in a new pool, or here if that breaks too
+            resetPool(executor)
+            if not retried:
+                retried = True
+                continue
+            windowHashes = [createHashes(chunk, algorithm, params) for chunk in window]
+        finally:
+            for _ in window:
+                slots.release()
+        for chunkHashes in windowHashes:
+            hashes.extend(chunkHashes)
+        chunks = chunks[len(window):]
+        retried = False
+    return hashes
+
+def verifyPassword(password: str, storedPassword: str, storedSalt: str) -> bool:
+    '''
+    Checks the password against the stored hash and salt of the user.
+    '''
+    if not storedPassword:
+        return False
+    return runInPool(checkHash, password, storedPassword, storedSalt)
+
+def needsRehash(storedPassword: str) -> bool:
+    '''
+    Checks if the stored hash was made with other than the configured algorithm or parameters.
+    '''
+    algorithm, params = getConfiguration()
+    if storedPassword.startswith("$argon2"):
+        if algorithm != "argon2id":
+            return True
+        # "$argon2id$v=19$m=65536,t=3,p=4$salt$hash"
+        parts = storedPassword.split("$")
+        return parts[1] != "argon2id" or decodeParams(parts[3]) != params
+    storedAlgorithm, storedParams, _ = parseHash(storedPassword)
+    return storedAlgorithm != algorithm or storedParams != params
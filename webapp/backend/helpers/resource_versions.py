@@ -0,0 +1,113 @@
+# Versions of resource collections, for ETags and conditional GET requests of read-mostly endpoints.
+# Every committed write to the tables of a resource bumps its version in the ResourceVersion table,
+# so the API can answer If-None-Match with 304 after reading only the versions (see conditionalResponse() of helpers/json_response.py).
+from sqlalchemy import column, event, inspect, table, update
+from sqlalchemy.exc import IntegrityError
+
+# Resource -> tables whose writes change it
+RESOURCE_TABLES = {
+    "users": ("User", "UserRole"),
+    "roles": ("Role", "RoleMount", "RoleHardwareLimit", "RoleReservationLimit"),
+    "containers": ("Container", "ContainerPort"),
+    "computers": ("Computer", "HardwareSpec"),
+    "reservations": ("Reservation", "ReservedHardwareSpec"),
+    "accessControl": ("UserBlacklist", "UserWhitelist"),
+}
+TABLE_RESOURCES = {}
+for resource, tables in RESOURCE_TABLES.items():
+    for tableName in tables:
+        TABLE_RESOURCES.setdefault(tableName, set()).add(resource)
+
+# Columns which are not shown by any versioned endpoint, changes to only these do not bump the version.
+# Logging in would otherwise invalidate the user listing.
+IGNORED_COLUMNS = {
+    "User": {"loginToken", "loginTokenCreatedAt", "userUpdatedAt"},
+}
+
+RESOURCE_VERSION = table("ResourceVersion", column("resource"), column("version"))
+PENDING_KEY = "changedResources"
+
+def getChangedTables(instance):
+    '''
+    Returns the tables the flush of a modified instance writes to: its own table if a column changed,
+    and the association table of each changed many-to-many relationship.
+    Other relationships are written through the foreign keys of the related instances.
+    '''
+    state = inspect(instance)
+    tableName = state.mapper.local_table.name
+    ignored = IGNORED_COLUMNS.get(tableName, ())
+    changed = set()
+    for attribute in state.mapper.column_attrs:
+        if attribute.key not in ignored and state.attrs[attribute.key].history.has_changes():
+            changed.add(tableName)
+            break
+    for relationship in state.mapper.relationships:
+        if relationship.secondary is not None and state.attrs[relationship.key].history.has_changes():
+            changed.add(relationship.secondary.name)
+    return changed
+
+def addChangedResources(session, tableName):
+    resources = TABLE_RESOURCES.get(tableName)
+    if resources:
+        session.info.setdefault(PENDING_KEY, set()).update(resources)
+
+def afterFlush(session, flushContext):
+    # The instances and their attribute history are still in the state before the flush
+    for instance in list(session.new) + list(session.deleted):
+        addChangedResources(session, inspect(instance).mapper.local_table.name)
+    for instance in session.dirty:
+        for tableName in getChangedTables(instance):
+            addChangedResources(session, tableName)
+
+def onORMExecute(executeState):
+    # Bulk query.update() / query.delete() and insert(), update() and delete() of mapped classes
+    if not (executeState.is_insert or executeState.is_update or executeState.is_delete):
+        return
+    mapper = executeState.bind_mapper
+    if mapper is not None:
+        addChangedResources(executeState.session, mapper.local_table.name)
+
+def beforeCommit(session):
+    # Flush first, so that the changes flushed by the commit are included
+    session.flush()
+    resources = session.info.pop(PENDING_KEY, None)
+    if resources:
+        # One statement locks the rows in index order, so concurrent commits do not deadlock on them
+        session.connection().execute(
+            update(RESOURCE_VERSION)
+            .where(RESOURCE_VERSION.c.resource.in_(sorted(resources)))
+            .values(version=RESOURCE_VERSION.c.version + 1)
+        )
+
+def afterRollback(session):
+    session.info.pop(PENDING_KEY, None)
+
+def trackResourceVersions(sessionFactory):
+    '''
+    Bumps the versions of the changed resources when a session of the factory commits.
+    The versions are bumped in the same transaction as the changes.
+    '''
+    event.listen(sessionFactory, "after_flush", afterFlush)
+    event.listen(sessionFactory, "do_orm_execute", onORMExecute)
+    event.listen(sessionFactory, "before_commit", beforeCommit)
+    event.listen(sessionFactory, "after_rollback", afterRollback)
+
+def getResourceVersions(session, resources):
+    '''
+    Returns resource -> version of the given resources. Creates the missing version rows.
+    '''
+    from database import ResourceVersion
+    def query():
+        return dict(session.query(ResourceVersion.resource, ResourceVersion.version).filter(ResourceVersion.resource.in_(resources)).all())
+
+    versions = query()
+    missing = [resource for resource in resources if resource not in versions]
+    if not missing:
+        return versions
+    try:
+        session.add_all([ResourceVersion(resource=resource, version=0) for resource in missing])
+        session.commit()
+    except IntegrityError:
+        # Created by another request at the same time
+        session.rollback()
+    return query()
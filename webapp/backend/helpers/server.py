@@ -1,3 +1,4 @@
+import keyword
 from typing import Union
 from fastapi import HTTPException, status
 from sqlalchemy import inspect
@@ -64,20 +65,67 @@ def ForceAuthentication(token: str, roleRequired: str = None) -> Union[bool,HTTP
     headers = {"WWW-Authenticate": "Bearer"},
   )
 
-def ORMObjectToDict(self):
-    dict_ = {}
-    for key in self.__mapper__.c.keys():
-        # Going through all the keys one by one
-        if not key.startswith('_'):
-            # Cast all bytes to strings
-            if isinstance(getattr(self, key), bytes):
-              dict_[key] = str(getattr(self, key))
-            # Otherwise do the casting automatically
-            else:
-              dict_[key] = getattr(self, key)
+def bytesToStr(value):
+  # Kept the same as before the serializers were compiled, bytes are shown as their repr
+  return str(value) if isinstance(value, bytes) else value
+
+def isBinaryColumn(column) -> bool:
+  try:
+    return column.type.python_type is bytes
+  except NotImplementedError:
+    return False
 
-    for key, prop in inspect(self.__class__).all_orm_descriptors.items():
-        if isinstance(prop, hybrid_property):
-            dict_[key] = getattr(self, key)
-    return dict_
+def compileSerializer(modelClass, columns = None, exclude = ()):
+  '''
+  Generates a function which returns the columns and hybrid properties of a model instance as a dict.
+  The mapper is inspected only here, the generated function reads the attributes directly.
+  '''
+  mapper = inspect(modelClass)
+  keys = [key for key in mapper.c.keys() if not key.startswith('_')]
+  hybridKeys = [key for key, prop in mapper.all_orm_descriptors.items() if isinstance(prop, hybrid_property)]
+  if columns is not None:
+    unknown = set(columns) - set(keys) - set(hybridKeys)
+    if unknown:
+      raise ValueError(f"{modelClass.__name__} has no columns {', '.join(sorted(unknown))}")
+    keys = [key for key in keys if key in columns]
+    hybridKeys = [key for key in hybridKeys if key in columns]
+  keys = [key for key in keys + hybridKeys if key not in exclude]
+  binaryKeys = set(key for key in keys if key in mapper.c and isBinaryColumn(mapper.c[key]))
 
+  fields = []
+  for key in keys:
+    accessor = f"obj.{key}" if key.isidentifier() and not keyword.iskeyword(key) else f"getattr(obj, {key!r})"
+    if key in binaryKeys:
+      accessor = f"bytesToStr({accessor})"
+    fields.append(f"{key!r}: {accessor}")
+  source = f"def serialize(obj):\n  return {{{', '.join(fields)}}}\n"
+  namespace = { "bytesToStr": bytesToStr }
+  exec(compile(source, f"<serializer of {modelClass.__name__}>", "exec"), namespace)
+  return namespace["serialize"]
+
+# (model class, columns, exclude) -> serializer
+serializers = {}
+
+def getSerializer(modelClass, columns = None, exclude = ()):
+  '''
+  Returns a function converting instances of the model to dicts, compiled once per model and column subset.
+  Parameters:
+    modelClass: Database model, for example Reservation.
+    columns: Only include these columns (and hybrid properties). All columns if None.
+    exclude: Leave these columns out.
+  Example:
+    serializeReservedContainer = getSerializer(ReservedContainer, exclude = ["sshPassword"])
+    containers = [serializeReservedContainer(reservedContainer) for reservedContainer in query]
+  '''
+  key = (modelClass, tuple(columns) if columns is not None else None, tuple(exclude))
+  serializer = serializers.get(key)
+  if serializer is None:
+    serializer = serializers[key] = compileSerializer(modelClass, columns, exclude)
+  return serializer
+
+def ORMObjectToDict(self):
+  '''
+  Returns the columns and hybrid properties of the database object as a dict.
+  Listings with many rows should call getSerializer() once and use the serializer for each row.
+  '''
+  return getSerializer(type(self))(self)
@@ -1,7 +1,8 @@
 # Role table management functionality
 from database import Role, RoleMount, Computer, Session, UserRole
-from helpers.server import Response
-from sqlalchemy import func
+from helpers.server import Response, getSerializer
+from sqlalchemy import func, delete, insert, update
+from docker.mount_resolver import invalidate_mount_plans
 
 def getRoles():
     '''
@@ -19,14 +20,12 @@ def getRolesWithMountCounts():
         List of all roles with additional mountCount field.
     '''
     with Session() as session:
-        roles = session.query(Role).all()
+        mountCounts = dict(session.query(RoleMount.roleId, func.count(RoleMount.roleMountId)).group_by(RoleMount.roleId).all())
+        serializeRole = getSerializer(Role)
         result = []
-        for role in roles:
-            from helpers.server import ORMObjectToDict
-            role_dict = ORMObjectToDict(role)
-            # Add mount count
-            mount_count = session.query(RoleMount).filter(RoleMount.roleId == role.roleId).count()
-            role_dict['mountCount'] = mount_count
+        for role in session.query(Role).all():
+            role_dict = serializeRole(role)
+            role_dict['mountCount'] = mountCounts.get(role.roleId, 0)
             result.append(role_dict)
         return result
 
@@ -249,6 +248,7 @@ def saveRoleMounts(roleId: int, mounts: list) -> tuple[bool, str]:
             session.add(new_mount)
         
         session.commit()
+        invalidate_mount_plans()
         return True, "Role mounts saved successfully"
 
 def getRoleHardwareLimits(roleId: int) -> list:
@@ -286,6 +286,7 @@ def getRoleHardwareLimits(roleId: int) -> list:
 def saveRoleHardwareLimits(roleId: int, hardwareLimits: list) -> tuple[bool, str]:
     '''
     Saves role hardware limits, removing old ones and adding new ones.
+    The limits are validated before anything is written, and only the changed rows are written.
     Parameters:
         roleId: The ID of the role
         hardwareLimits: List of hardware limit dictionaries with computerId, hardwareSpecId, maximumAmountForRole
@@ -304,26 +305,41 @@ def saveRoleHardwareLimits(roleId: int, hardwareLimits: list) -> tuple[bool, str
         if role.name.lower() in ["admin", "everyone"]:
             return False, f"Cannot set hardware limits for built-in role '{role.name}'"
         
-        # Remove all existing hardware limits for this role
-        session.query(RoleHardwareLimit).filter(RoleHardwareLimit.roleId == roleId).delete()
-        session.flush()
-        
-        # Add new hardware limits
+        # Validate required fields
         for limit_data in hardwareLimits:
-            # Validate required fields
             if not all(key in limit_data for key in ['hardwareSpecId', 'maximumAmountForRole']):
                 return False, "Missing required hardware limit fields"
-            
-            # Skip if maximumAmountForRole is None
-            if limit_data['maximumAmountForRole'] is None:
-                continue
-                
+        
+        # Skip limits whose maximumAmountForRole is None
+        limits = [limit_data for limit_data in hardwareLimits if limit_data['maximumAmountForRole'] is not None]
+        
+        # All hardware specs of the limits with one query, and their computers' GPU counts with another
+        spec_ids = { limit_data['hardwareSpecId'] for limit_data in limits }
+        hardware_specs = {}
+        if spec_ids:
+            hardware_specs = {
+                spec.hardwareSpecId: spec
+                for spec in session.query(HardwareSpec).filter(HardwareSpec.hardwareSpecId.in_(spec_ids))
+            }
+        computer_ids = { spec.computerId for spec in hardware_specs.values() }
+        gpu_counts = {}
+        if computer_ids:
+            gpu_counts = dict(
+                session.query(HardwareSpec.computerId, func.count(HardwareSpec.hardwareSpecId))
+                .filter(HardwareSpec.computerId.in_(computer_ids), HardwareSpec.type == 'gpu')
+                .group_by(HardwareSpec.computerId)
+                .all()
+            )
+        
+        # hardwareSpecId -> maximumAmountForRole
+        new_limits = {}
+        for limit_data in limits:
             # Check if hardware spec exists
-            hardware_spec = session.query(HardwareSpec).filter(
-                HardwareSpec.hardwareSpecId == limit_data['hardwareSpecId']
-            ).first()
+            hardware_spec = hardware_specs.get(limit_data['hardwareSpecId'])
             if not hardware_spec:
                 return False, f"Hardware spec with ID {limit_data['hardwareSpecId']} not found"
+            if hardware_spec.hardwareSpecId in new_limits:
+                return False, f"Hardware spec with ID {hardware_spec.hardwareSpecId} has more than one limit"
             
             # Validate that role limit doesn't exceed system maximum
             max_amount = limit_data['maximumAmountForRole']
@@ -340,23 +356,37 @@ def saveRoleHardwareLimits(roleId: int, hardwareLimits: list) -> tuple[bool, str
             
             # For GPUs without internalId, system max is the count of all GPU specs
             if hardware_spec.type == 'gpu' and not hardware_spec.internalId:
-                gpu_count = session.query(HardwareSpec).filter(
-                    HardwareSpec.computerId == hardware_spec.computerId,
-                    HardwareSpec.type == 'gpu'
-                ).count()
-                system_max = gpu_count
+                system_max = gpu_counts.get(hardware_spec.computerId, 0)
             else:
                 system_max = hardware_spec.maximumAmount
             
             if max_amount > system_max:
                 return False, f"Role limit ({max_amount}) exceeds system maximum ({system_max}) for {hardware_spec.type} on computer {hardware_spec.computer.name}"
             
-            new_limit = RoleHardwareLimit(
-                roleId=roleId,
-                hardwareSpecId=limit_data['hardwareSpecId'],
-                maximumAmountForRole=max_amount
-            )
-            session.add(new_limit)
+            new_limits[hardware_spec.hardwareSpecId] = max_amount
+        
+        # Diff against the existing limits, unchanged rows are not written
+        removed_ids = []
+        changed = []
+        for limit_id, spec_id, amount in session.query(
+            RoleHardwareLimit.roleHardwareLimitId, RoleHardwareLimit.hardwareSpecId, RoleHardwareLimit.maximumAmountForRole
+        ).filter(RoleHardwareLimit.roleId == roleId):
+            if spec_id not in new_limits:
+                removed_ids.append(limit_id)
+                continue
+            new_amount = new_limits.pop(spec_id)
+            if new_amount != amount:
+                changed.append({ "roleHardwareLimitId": limit_id, "maximumAmountForRole": new_amount })
+        
+        if removed_ids:
+            session.execute(delete(RoleHardwareLimit).where(RoleHardwareLimit.roleHardwareLimitId.in_(removed_ids)))
+        if changed:
+            session.execute(update(RoleHardwareLimit), changed)
+        if new_limits:
+            session.execute(insert(RoleHardwareLimit), [
+                { "roleId": roleId, "hardwareSpecId": spec_id, "maximumAmountForRole": amount }
+                for spec_id, amount in new_limits.items()
+            ])
         
         session.commit()
         return True, "Role hardware limits saved successfully"
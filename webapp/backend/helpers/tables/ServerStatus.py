@@ -0,0 +1,78 @@
+# Server status (heartbeat lease) table management functionality
+from database import ServerStatus, Session
+import datetime
+
+def timeNow():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def renewHeartbeatLease(computerId, leaseSeconds):
+    '''
+    Marks the server as online and extends its heartbeat lease. Called periodically by the docker utility of the server.
+    Parameters:
+        computerId: ID of the computer.
+        leaseSeconds: How long the server is considered online without a new heartbeat.
+    '''
+    with Session() as session:
+        now = timeNow()
+        updated = session.query(ServerStatus).filter(ServerStatus.computerId == computerId).update({
+            ServerStatus.isOnline: True,
+            ServerStatus.heartbeatAt: now,
+            ServerStatus.leaseExpiresAt: now + datetime.timedelta(seconds=leaseSeconds)
+        }, synchronize_session=False)
+        if updated == 0:
+            session.add(ServerStatus(
+                computerId=computerId,
+                isOnline=True,
+                heartbeatAt=now,
+                leaseExpiresAt=now + datetime.timedelta(seconds=leaseSeconds)
+            ))
+        session.commit()
+
+def getOfflineComputerIds(session):
+    '''
+    Gets the computers whose heartbeat lease has expired.
+    Servers which have never sent a heartbeat are not included, as their state is unknown.
+    Parameters:
+        session: Database session.
+    Returns:
+        Set of computer IDs.
+    '''
+    rows = session.query(ServerStatus.computerId).filter(
+        ServerStatus.leaseExpiresAt.isnot(None),
+        ServerStatus.leaseExpiresAt < timeNow()
+    ).all()
+    return set(row.computerId for row in rows)
+
+def isComputerOnline(session, computerId):
+    '''
+    Checks that the heartbeat lease of the computer has not expired.
+    Parameters:
+        session: Database session.
+        computerId: ID of the computer.
+    Returns:
+        False if the lease has expired, True otherwise.
+    '''
+    return computerId not in getOfflineComputerIds(session)
+
+def markExpiredServersOffline():
+    '''
+    Sets isOnline to False for all servers whose heartbeat lease has expired.
+    Returns:
+        List of computer IDs which were marked offline by this call.
+    '''
+    with Session() as session:
+        now = timeNow()
+        expired = session.query(ServerStatus.computerId).filter(
+            ServerStatus.isOnline == True,
+            ServerStatus.leaseExpiresAt.isnot(None),
+            ServerStatus.leaseExpiresAt < now
+        ).all()
+        computerIds = [row.computerId for row in expired]
+        if computerIds:
+            # The lease is checked again in the update, in case a heartbeat arrived in between
+            session.query(ServerStatus).filter(
+                ServerStatus.computerId.in_(computerIds),
+                ServerStatus.leaseExpiresAt < now
+            ).update({ServerStatus.isOnline: False}, synchronize_session=False)
+            session.commit()
+        return computerIds
@@ -1,5 +1,6 @@
 from database import User, Session
 from helpers.auth import *
+from helpers.password_hashing import hashPassword
 
 # User table management functionality
 
@@ -62,13 +63,13 @@ def addUser(email, password):
   Returns:
     The created user object fetched from database.
   '''
-  hash = HashPassword(password)
+  hash = hashPassword(password)
   with Session() as session:
     session.add(
       User(
         email = email,
-        password = hash["hashedPassword"],
-        passwordSalt = hash["salt"]
+        password = hash["password"],
+        passwordSalt = hash["passwordSalt"]
       )
     )
     session.commit()
@@ -89,9 +90,9 @@ Finds user by email and changes email or password.
     if new_email != None:
       user.email = new_email
     if new_password != None:
-      hash = HashPassword(new_password)
-      user.password = hash["hashedPassword"]
-      user.passwordSalt = hash['salt']
+      hash = hashPassword(new_password)
+      user.password = hash["password"]
+      user.passwordSalt = hash["passwordSalt"]
     session.commit()
     return None
 
@@ -1,5 +1,38 @@
 # User access control (blacklist/whitelist) table management functionality
+from sqlalchemy import delete, insert
 from database import UserBlacklist, UserWhitelist, Session
+from helpers.access_control import normalizeEntry
+
+# Rows deleted with one statement
+DELETE_CHUNK = 1000
+
+def replaceEmails(model, idColumn, emails: list):
+    """
+    Replaces the entries of the blacklist or whitelist table with the given emails. Only the difference
+    is written: one bulk delete of the removed entries and one bulk insert of the added ones.
+    Entries are stored normalized (see normalizeEntry() of helpers/access_control.py).
+    """
+    wanted = set()
+    for email in emails:
+        email = normalizeEntry(email)
+        if email is not None:
+            wanted.add(email)
+
+    with Session() as session:
+        keptEmails = set()
+        removedIds = []
+        for rowId, storedEmail in session.query(idColumn, model.email):
+            # Rows which are not normalized are removed and their emails added again normalized
+            if storedEmail in wanted and storedEmail not in keptEmails:
+                keptEmails.add(storedEmail)
+            else:
+                removedIds.append(rowId)
+        for index in range(0, len(removedIds), DELETE_CHUNK):
+            session.execute(delete(model).where(idColumn.in_(removedIds[index:index + DELETE_CHUNK])))
+        added = sorted(wanted - keptEmails)
+        if added:
+            session.execute(insert(model), [{ "email": email } for email in added])
+        session.commit()
 
 def getBlacklistedEmails():
     """
@@ -23,18 +56,8 @@ def setBlacklistedEmails(emails: list):
         Boolean indicating success
     """
     try:
-        with Session() as session:
-            # Remove all existing entries
-            session.query(UserBlacklist).delete()
-            
-            # Add new entries
-            for email in emails:
-                if email and email.strip():
-                    blacklist_entry = UserBlacklist(email=email.strip())
-                    session.add(blacklist_entry)
-            
-            session.commit()
-            return True
+        replaceEmails(UserBlacklist, UserBlacklist.userBlacklistId, emails)
+        return True
     except Exception as e:
         print(f"Error setting blacklisted emails: {e}")
         return False
@@ -61,18 +84,8 @@ def setWhitelistedEmails(emails: list):
         Boolean indicating success
     """
     try:
-        with Session() as session:
-            # Remove all existing entries
-            session.query(UserWhitelist).delete()
-            
-            # Add new entries
-            for email in emails:
-                if email and email.strip():
-                    whitelist_entry = UserWhitelist(email=email.strip())
-                    session.add(whitelist_entry)
-            
-            session.commit()
-            return True
+        replaceEmails(UserWhitelist, UserWhitelist.userWhitelistId, emails)
+        return True
     except Exception as e:
         print(f"Error setting whitelisted emails: {e}")
         return False 
\ No newline at end of file
@@ -4,11 +4,18 @@
 #from importlib import reload
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse, Response
+import time
+from os import linesep
 from routes.api import router as api_router
 from settings_handler import settings_handler
+from helpers.metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE, isAuthorized as isMetricsScrapeAuthorized
+from helpers.db_metrics import startCountingQueries, stopCountingQueries, getServerTimingHeader
+from helpers.json_response import FastJSONResponse
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # Setup allowed origins
 origins = [
@@ -25,9 +32,66 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large responses, such as the reservation and user listings
+gzipMinimumSize = settings_handler.getSetting("app.gzipMinimumSize")
+if gzipMinimumSize is not None and gzipMinimumSize > 0:
+    app.add_middleware(GZipMiddleware, minimum_size=gzipMinimumSize)
+
 # Add all routes
 app.include_router(api_router)
 
+REQUEST_DURATION = REGISTRY.histogram(
+    "containerfly_http_request_duration_seconds", "Time to handle API requests",
+    ("method", "route", "status")
+)
+REQUEST_QUERIES = REGISTRY.histogram(
+    "containerfly_http_request_db_queries", "SQL statements executed per API request",
+    ("route",), buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+)
+
+# Opt-in query profiling, adds Server-Timing headers and logs requests with too many queries
+queryProfiling = settings_handler.getSetting("app.queryProfilingEnabled") == True
+queryProfilingMaxQueries = settings_handler.getSetting("app.queryProfilingMaxQueries")
+queryProfilingSlowQueries = settings_handler.getSetting("app.queryProfilingSlowQueries")
+
+def logQueryProfile(request: Request, routePath: str, stats, totalSeconds: float):
+    message = f"Request {request.method} {routePath} ran {stats.count} queries in {stats.seconds * 1000:.1f} ms (total {totalSeconds * 1000:.1f} ms). Slowest queries:"
+    for seconds, statement, origin in stats.slowQueries:
+        message += f"{linesep}  {seconds * 1000:.1f} ms at {origin}: {statement[:300]}"
+    print(message)
+
+# Record latency and query count per route
+@app.middleware("http")
+async def recordRequestMetrics(request: Request, call_next):
+    token, queryStats = startCountingQueries(queryProfiling, queryProfilingSlowQueries)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        if queryProfiling:
+            response.headers["Server-Timing"] = getServerTimingHeader(queryStats, time.perf_counter() - start)
+        return response
+    finally:
+        stopCountingQueries(token)
+        totalSeconds = time.perf_counter() - start
+        route = request.scope.get("route")
+        routePath = route.path if route is not None else "unmatched"
+        REQUEST_DURATION.observe(totalSeconds, method=request.method, route=routePath, status=status)
+        REQUEST_QUERIES.observe(queryStats.count, route=routePath)
+        if queryProfiling and queryStats.count > queryProfilingMaxQueries:
+            logQueryProfile(request, routePath, queryStats, totalSeconds)
+
+if settings_handler.getSetting("app.metricsEnabled") == True:
+    if not settings_handler.getSetting("app.metricsToken"):
+        print("app.metricsEnabled is set without app.metricsToken, /metrics refuses all scrapes")
+
+    @app.get("/metrics", include_in_schema=False)
+    def getMetrics(request: Request):
+        if not isMetricsScrapeAuthorized(request.headers.get("Authorization"), settings_handler.getSetting("app.metricsToken")):
+            return Response(status_code=401, headers={"WWW-Authenticate": "Bearer"})
+        return PlainTextResponse(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
 # Start the app
 if __name__ == '__main__':
     production = settings_handler.getSetting("app.production")
@@ -1,9 +1,8 @@
 from fastapi import APIRouter
 from endpoints import user, reservation, admin, app
 from settings_handler import settings_handler
-from helpers.auth import HashPassword
+from helpers.password_hashing import hashPassword
 from database import ContainerPort, Session, User, Role, Computer, HardwareSpec, Container
-import base64
 import sqlalchemy as sa
 
 router = APIRouter()
@@ -45,11 +44,11 @@ if settings_handler.getSetting("app.addTestDataInDevelopment"):
     adminUser = session.query(User).filter( User.email == "admin@foo.com" ).first()
     if adminUser is None:
       print("Creating test data: admin user with email admin@foo.com")
-      hash = HashPassword("test")
+      hash = hashPassword("test")
       adminUser = User(
         email = "admin@foo.com",
-        password = base64.b64encode(hash["hashedPassword"]).decode('utf-8'),
-        passwordSalt = base64.b64encode(hash["salt"]).decode('utf-8')
+        password = hash["password"],
+        passwordSalt = hash["passwordSalt"]
       )
       adminRole = session.query(Role).filter( Role.name == "admin" ).first()
       adminUser.roles.append(adminRole)
@@ -60,11 +59,11 @@ if settings_handler.getSetting("app.addTestDataInDevelopment"):
     normalUser = session.query(User).filter( User.email == "user@foo.com" ).first()
     if normalUser is None:
       print("Creating test data: normal user with email user@foo.com")
-      hash = HashPassword("test")
+      hash = hashPassword("test")
       normalUser = User(
         email = "user@foo.com",
-        password = base64.b64encode(hash["hashedPassword"]).decode('utf-8'),
-        passwordSalt = base64.b64encode(hash["salt"]).decode('utf-8')
+        password = hash["password"],
+        passwordSalt = hash["passwordSalt"]
       )
       session.add(normalUser)
       session.commit()
@@ -73,6 +73,45 @@ SETTINGS_SCHEMA: Dict[str, SettingSetting] = {
         SettingSource.FILE, SettingType.BOOLEAN, default=True,
         description="Whether the application runs in production mode"
     ),
+    "app.metricsEnabled": SettingSetting(
+        SettingSource.FILE, SettingType.BOOLEAN, default=False,
+        description="Serve Prometheus metrics of the API at /metrics"
+    ),
+    "app.metricsToken": SettingSetting(
+        SettingSource.FILE, SettingType.TEXT, default="",
+        description="Token the Prometheus metrics of the API and the docker utility are scraped with, in the header Authorization: Bearer <token>. Metrics are not served without it"
+    ),
+    "app.queryProfilingEnabled": SettingSetting(
+        SettingSource.FILE, SettingType.BOOLEAN, default=False,
+        description="Time the SQL queries of each API request, add Server-Timing headers and log requests with too many queries"
+    ),
+    "app.queryProfilingMaxQueries": SettingSetting(
+        SettingSource.FILE, SettingType.INTEGER, default=50,
+        description="Requests running more SQL queries than this are logged with their slowest queries when query profiling is enabled"
+    ),
+    "app.queryProfilingSlowQueries": SettingSetting(
+        SettingSource.FILE, SettingType.INTEGER, default=5,
+        description="How many of the slowest queries of a request are logged with the code that ran them"
+    ),
+    "app.gzipMinimumSize": SettingSetting(
+        SettingSource.FILE, SettingType.INTEGER, default=1000,
+        description="Gzip compress API responses of at least this many bytes when the client accepts it, 0 disables compression"
+    ),
+    "app.passwordHashAlgorithm": SettingSetting(
+        SettingSource.FILE, SettingType.TEXT, default="pbkdf2_sha256",
+        allowed_values=["pbkdf2_sha256", "scrypt", "argon2id"],
+        description="Algorithm of new password hashes, argon2id requires argon2-cffi. Older hashes are upgraded when the user logs in"
+    ),
+    "app.passwordHashIterations": SettingSetting(
+        SettingSource.FILE, SettingType.INTEGER, default=100000,
+        min_value=10000,
+        description="Iterations of pbkdf2_sha256 password hashes"
+    ),
+    "app.passwordHashWorkers": SettingSetting(
+        SettingSource.FILE, SettingType.INTEGER, default=0,
+        min_value=0,
+        description="Worker processes hashing and verifying passwords, 0 uses one per CPU core"
+    ),
     "app.addTestDataInDevelopment": SettingSetting(
         SettingSource.FILE, SettingType.BOOLEAN, default=False,
         description="Add test data when running in development mode"
@@ -117,6 +156,54 @@ SETTINGS_SCHEMA: Dict[str, SettingSetting] = {
         SettingSource.FILE, SettingType.BOOLEAN, default=False,
         description="Skip actual GPU device dedication for testing (GPU reservation logic still runs)"
     ),
+    "docker.heartbeatLeaseSeconds": SettingSetting(
+        SettingSource.FILE, SettingType.INTEGER, default=60,
+        description="How long a server stays online without sending a new heartbeat, in seconds"
+    ),
+    "docker.failoverReservations": SettingSetting(
+        SettingSource.FILE, SettingType.BOOLEAN, default=False,
+        description="Move reservations that have not started yet from offline servers to equivalent online servers"
+    ),
+    "docker.prestageMinutes": SettingSetting(
+        SettingSource.FILE, SettingType.INTEGER, default=5,
+        description="Minutes before the start of a reservation its container is created, so that it only needs to be started at the start time. 0 disables pre-staging"
+    ),
+    "docker.lifecycleEventRetentionDays": SettingSetting(
+        SettingSource.FILE, SettingType.INTEGER, default=90,
+        description="Days to keep the container start timing events shown in the admin panel"
+    ),
+    "docker.metricsPort": SettingSetting(
+        SettingSource.FILE, SettingType.INTEGER, default=9101,
+        description="Port where the docker utility serves Prometheus metrics at /metrics. 0 disables the listener"
+    ),
+    "docker.metricsHost": SettingSetting(
+        SettingSource.FILE, SettingType.TEXT, default="127.0.0.1",
+        description="Address the metrics listener of the docker utility binds to. Use 0.0.0.0 only when Prometheus scrapes from another host"
+    ),
+    "docker.secretsFolder": SettingSetting(
+        SettingSource.FILE, SettingType.TEXT, default="/var/lib/containerfly/secrets",
+        description="Folder of the password files mounted into containers, created by sudo make setup-docker-utility. It has to be owned by the user running the docker utility with mode 0700, otherwise passwords are set with docker exec"
+    ),
+    "docker.stopTimeoutSeconds": SettingSetting(
+        SettingSource.FILE, SettingType.INTEGER, default=10,
+        description="Seconds to wait for a container to stop before it is killed, unless set for the container image"
+    ),
+    "docker.pm2LogPath": SettingSetting(
+        SettingSource.FILE, SettingType.TEXT, default="",
+        description="Folder containing the pm2 log files (empty = $PM2_HOME/logs or ~/.pm2/logs)"
+    ),
+    "docker.logRingBufferLines": SettingSetting(
+        SettingSource.FILE, SettingType.INTEGER, default=300,
+        description="Maximum amount of log lines kept in the database per server and log type"
+    ),
+    "docker.usageSamplingEnabled": SettingSetting(
+        SettingSource.FILE, SettingType.BOOLEAN, default=True,
+        description="Record CPU, memory, IO and GPU usage of reserved containers"
+    ),
+    "docker.usageSampleRetentionDays": SettingSetting(
+        SettingSource.FILE, SettingType.INTEGER, default=14,
+        description="How many days container usage samples are kept in the database"
+    ),
     
     # ===== DATABASE-BASED SETTINGS (User-Configurable) =====
     # These can be modified through the admin interface
@@ -217,6 +304,37 @@ SETTINGS_SCHEMA: Dict[str, SettingSetting] = {
         description="Email addresses for alerts (JSON array)"
     ),
     
+    # Idle Reservation Settings
+    "idle.detectionEnabled": SettingSetting(
+        SettingSource.DATABASE, SettingType.BOOLEAN, default=False,
+        description="Detect started reservations whose CPU and GPU usage stays under the idle thresholds"
+    ),
+    "idle.windowMinutes": SettingSetting(
+        SettingSource.DATABASE, SettingType.INTEGER, default=120,
+        min_value=10, max_value=2880,
+        description="How long usage must stay under the thresholds before a reservation is idle, in minutes"
+    ),
+    "idle.cpuThresholdPercent": SettingSetting(
+        SettingSource.DATABASE, SettingType.INTEGER, default=5,
+        min_value=0, max_value=100,
+        description="Container CPU usage under which a reservation counts as idle"
+    ),
+    "idle.gpuThresholdPercent": SettingSetting(
+        SettingSource.DATABASE, SettingType.INTEGER, default=5,
+        min_value=0, max_value=100,
+        description="GPU utilization under which a reservation counts as idle"
+    ),
+    "idle.action": SettingSetting(
+        SettingSource.DATABASE, SettingType.TEXT, default="notify",
+        allowed_values=["notify", "stop"],
+        description="What to do with idle reservations (notify the user, or notify and end the reservation)"
+    ),
+    "idle.stopGraceMinutes": SettingSetting(
+        SettingSource.DATABASE, SettingType.INTEGER, default=60,
+        min_value=0, max_value=1440,
+        description="Minutes between the idle notification and ending the reservation"
+    ),
+    
     # Authentication Settings
     "auth.loginType": SettingSetting(
         SettingSource.DATABASE, SettingType.TEXT, default="password",
@@ -258,6 +376,14 @@ SETTINGS_SCHEMA: Dict[str, SettingSetting] = {
         SettingSource.DATABASE, SettingType.TEXT, default="",
         description="LDAP email field for user mapping"
     ),
+    "auth.ldap.bindDn": SettingSetting(
+        SettingSource.DATABASE, SettingType.TEXT, default="",
+        description="Optional LDAP service account which searches the users, logins only bind as the user when set"
+    ),
+    "auth.ldap.bindPassword": SettingSetting(
+        SettingSource.DATABASE, SettingType.TEXT, default="",
+        description="Password of the LDAP service account"
+    ),
 }
 
 # Helper functions for schema access
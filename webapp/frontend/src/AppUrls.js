@@ -42,6 +42,8 @@ function createUrls(baseAddress) {
     URLS.admin.save_general_settings = baseAdminUrl + "general-settings"
     URLS.admin.test_email = baseAdminUrl + "test-email"
     URLS.admin.get_servers = baseAdminUrl + "servers"
+    URLS.admin.get_servers_overview = baseAdminUrl + "servers/overview"
+    URLS.admin.get_start_latency = baseAdminUrl + "start_latency"
     URLS.admin.get_server_monitoring = baseAdminUrl + "server"
     // Role management endpoints
     URLS.admin.get_roles = baseAdminUrl + "roles"